@@ -7,17 +7,23 @@ import time
 import os
 import json
 import pandas as pd
+import altair as alt
 import streamlit as st
 import jenkins
 import re
 import uuid
 import hashlib
+import heapq
+import math
 import threading
+import tempfile
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
+from urllib.parse import quote
 from difflib import get_close_matches
 from dotenv import load_dotenv
 from typing import Dict, List, Optional, Tuple
-from bs4 import BeautifulSoup
 
 # Multi-user support: File locking for concurrent access (cross-platform)
 # Uses threading locks (universal) + fcntl file locks (Unix/Linux if available)
@@ -36,7 +42,15 @@ from autogen import AssistantAgent, UserProxyAgent, register_function
 from oracle_runner_agentic_1 import (
     run_oracle_query, get_db_list, generate_awr_report, generate_ash_report,
     get_snapshots_for_time, run_full_health_check, get_snapshots_by_date_range, 
-    analyze_awr_report, compare_awr_reports, load_db_config
+    analyze_awr_report,
+    run_health_checks, health_check_status, ping_database, run_oracle_batch,
+    iter_oracle_query, write_query_csv, fetch_oracle_dataframe, find_snapshot_range,
+    load_metric_history, parse_awr_report, awr_sections_to_text, awr_report_text,
+    extract_awr_data, compare_awr_sections, ash_breakdown,
+    sample_live_metrics, live_metrics_frame, get_blocking_tree,
+    forecast_tablespace_growth, TBSPC_FORECAST_ALERT_DAYS, detect_metric_anomalies,
+    scan_plan_regressions, lookup_sql_metadata, find_table_sql_ids,
+    ash_sampler_running, stop_ash_sampler
 )
 import oracle_runner_agentic_1
 from patch_forstreamlit import download_oracle_patch
@@ -56,6 +70,22 @@ if not openai_api_key:
 JENKINS_URL = os.getenv("JENKINS_URL", "http://localhost:9020")
 JENKINS_USERNAME = os.getenv("JENKINS_USERNAME", "dba")
 JENKINS_TOKEN = os.getenv("JENKINS_API_TOKEN", os.getenv("JENKINS_PASSWORD", "113bb934053435f19fa62d94f8c79a108c"))
+JENKINS_TREE_DEPTH = int(os.getenv("JENKINS_TREE_DEPTH", "5"))        # folder levels per tree= request
+JENKINS_FETCH_WORKERS = int(os.getenv("JENKINS_FETCH_WORKERS", "8"))    # concurrent Jenkins API requests
+JENKINS_CATALOG_PATH = os.getenv(
+    "JENKINS_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jenkins_catalog.json")
+)
+JENKINS_CATALOG_REFRESH = int(os.getenv("JENKINS_CATALOG_REFRESH", "300"))            # seconds between job list probes
+JENKINS_CATALOG_FULL_REFRESH = int(os.getenv("JENKINS_CATALOG_FULL_REFRESH", "3600"))  # seconds between full re-reads
+JENKINS_CONSOLE_TAIL_CHARS = int(os.getenv("JENKINS_CONSOLE_TAIL_CHARS", "10000"))      # console kept per build in history
+JENKINS_CONSOLE_CHUNK = 64 * 1024                 # bytes per backward read of a console log
+JENKINS_CONSOLE_MAX_SCAN = 4 * 1024 * 1024        # most bytes read back looking for an error line
+JENKINS_CONSOLE_ERROR_CONTEXT = 20                # lines kept either side of an error above the tail
+
+# SQL Explorer: rows rendered in the grid, and the largest CSV offered for download
+# (Streamlit holds download data in memory, so bigger exports are cut off there)
+SQL_EXPLORER_PREVIEW_ROWS = int(os.getenv("SQL_EXPLORER_PREVIEW_ROWS", "5000"))
+SQL_EXPLORER_CSV_MAX_MB = int(os.getenv("SQL_EXPLORER_CSV_MAX_MB", "100"))
 
 # SSL Certificates (make configurable)
 SSL_CERT_PATH = os.getenv("SSL_CERT_PATH", r"C:\Users\omkarav\Downloads\Amdocs RSA Root CA.crt")
@@ -192,6 +222,10 @@ def handle_oracle_error(error: Exception) -> str:
     
     return f"❌ Database Error: {error_str}"
 
+def is_select_statement(sql: str) -> bool:
+    """True for row-returning statements that can be streamed with iter_oracle_query"""
+    return bool(re.match(r"^\s*(SELECT|WITH)\b", sql, re.IGNORECASE))
+
 def audit_log(action: str, db: str, details: Dict) -> None:
     """Log all database operations for compliance"""
     log_entry = {
@@ -303,7 +337,7 @@ def save_database_config(db_name: str, username: str, password: str, host: str,
                 
                 # Also reload the DB_CONFIG in oracle_runner_agentic_1 module so queries work immediately
                 try:
-                    oracle_runner_agentic_1.DB_CONFIG = load_db_config()
+                    oracle_runner_agentic_1.reload_db_config()  # also rebuilds pools whose DSN/credentials changed
                 except Exception as e:
                     # Non-critical - the dropdown will still work, just queries might need app restart
                     pass
@@ -334,7 +368,7 @@ def refresh_database_list():
             st.session_state["dbs"] = list(config.keys())
             # Also update the oracle_runner module's DB_CONFIG
             try:
-                oracle_runner_agentic_1.DB_CONFIG = load_db_config()
+                oracle_runner_agentic_1.reload_db_config()
             except:
                 pass
             return True
@@ -352,71 +386,365 @@ def get_jenkins_server():
         st.error(f"Jenkins Connection Error: {e}")
         return None
 
-def fetch_jobs_recursive(_client, folder=""):
-    if _client is None: 
-        return []
-    try:
-        items = _client.get_jobs(folder) if folder else _client.get_jobs()
-    except: 
-        return []
-    out = []
+# Job catalog: tree= queries pull names, classes, descriptions and parameter definitions
+# for JENKINS_TREE_DEPTH folder levels per request. Folders below that depth (or whose
+# request fails) are fetched separately, a bounded number at a time.
+_JOB_PARAM_FIELDS = "parameterDefinitions[name,type,choices,allValue,values,defaultParameterValue[value]]"
+_JOB_FIELDS = f"name,description,property[{_JOB_PARAM_FIELDS}],actions[{_JOB_PARAM_FIELDS}]"
+
+def _jobs_tree(depth: int, fields: str = _JOB_FIELDS) -> str:
+    """tree= expression for `depth` levels of nested jobs (folders carry their own jobs[...])"""
+    tree = f"jobs[{fields}]"
+    for _ in range(depth - 1):
+        tree = f"jobs[{fields},{tree}]"
+    return tree
+
+def _is_job_container(item: dict) -> bool:
+    cls = item.get("_class", "")
+    return "jobs" in item or "Folder" in cls or cls.endswith("MultiBranchProject")
+
+def _job_api_path(full_name: str) -> str:
+    return "job/" + "/job/".join(full_name.split("/"))
+
+def _job_entry(full: str, info: dict) -> dict:
+    """Catalog entry (name, description, parameters) from a job's JSON"""
+    desc = info.get("description", "") or "(no description)"
+    params = []
+    seen = set()
+    
+    all_sections = (
+        (info.get("actions") or []) +
+        (info.get("properties") or []) +
+        (info.get("property") or [])
+    )
+    for section in all_sections:
+        if section and "parameterDefinitions" in section:
+            for p in section["parameterDefinitions"]:
+                p_name = p["name"]
+                if p_name in seen: 
+                    continue
+                seen.add(p_name)
+                choices = p.get("choices", [])
+                if not choices: 
+                    choices = p.get("allValue", p.get("values", []))
+                
+                params.append({
+                    "name": p["name"],
+                    "type": p.get("_class", "") or p.get("type", ""),
+                    "default": (p.get("defaultParameterValue") or {}).get("value", ""),
+                    "choices": choices
+                })
+    return {"name": full, "description": desc, "parameters": params}
+
+def _collect_jobs(items: list, prefix: str, depth: int, out: list, pending: list):
+    """Flattens one tree= response into (full name, job JSON); folders returned without their jobs go to `pending`"""
     for it in items:
         name = it.get("name")
         if not name: 
             continue
-        full = f"{folder}/{name}" if folder else name
-        cls = it.get("_class", "")
-        if "Folder" in cls:
-            out.extend(fetch_jobs_recursive(_client, full))
+        full = f"{prefix}/{name}" if prefix else name
+        if _is_job_container(it):
+            if "jobs" in it:
+                _collect_jobs(it["jobs"], full, depth, out, pending)
+            else:
+                pending.append((full, depth))
         else:
-            out.append(full)
-    return out
+            out.append((full, it))
 
-@st.cache_data(show_spinner="Fetching Jenkins Jobs into cache...")
-def fetch_all_job_details_robust():
-    _client = get_jenkins_server()
+def _fetch_job_items(_client, fields: str = _JOB_FIELDS) -> tuple:
+    """([(full name, job JSON with `fields`)] for every job in the instance, folders that could not be read)"""
     if _client is None: 
-        return []
+        return [], [""]
     out = []
-    job_names = fetch_jobs_recursive(_client)
-    
-    for full in job_names:
+    failed = []
+    pending = [("", JENKINS_TREE_DEPTH)]
+    with ThreadPoolExecutor(max_workers=JENKINS_FETCH_WORKERS) as pool:
+        while pending:
+            batch, pending = pending, []
+            futures = {
+                pool.submit(_client.get_info, _job_api_path(folder) if folder else "", f"?tree={_jobs_tree(depth, fields)}"): (folder, depth)
+                for folder, depth in batch
+            }
+            for future in as_completed(futures):
+                folder, depth = futures[future]
+                try:
+                    items = future.result().get("jobs", [])
+                except Exception as e:
+                    if depth > 1:
+                        # Deep tree too large/slow for this folder: walk it one level at a time
+                        print(f"[DEBUG] Jenkins tree fetch failed for '{folder or '/'}' (depth {depth}): {e}")
+                        pending.append((folder, 1))
+                    else:
+                        print(f"[DEBUG] Skipping Jenkins folder '{folder or '/'}': {e}")
+                        failed.append(folder)
+                    continue
+                _collect_jobs(items, folder, depth, out, pending)
+    return out, failed
+
+def load_jenkins_catalog(_client) -> tuple:
+    """(every job in the instance as {name, description, parameters} sorted by name, unreadable folders)"""
+    items, failed = _fetch_job_items(_client)
+    return sorted((_job_entry(full, info) for full, info in items), key=lambda j: j["name"]), failed
+
+def _under_folders(name: str, folders: list) -> bool:
+    return any(not f or name.startswith(f + "/") for f in folders)
+
+# Process-wide job catalog shared (read-only) by every session. It is persisted to
+# JENKINS_CATALOG_PATH so a restart starts from the last known job list, and a
+# background thread keeps it current: a names-only probe every JENKINS_CATALOG_REFRESH
+# seconds fetches just the jobs that appeared, and a full re-read every
+# JENKINS_CATALOG_FULL_REFRESH seconds picks up description/parameter edits.
+# Refreshes swap in a new list (and bump "version") instead of mutating the old one.
+_JENKINS_CATALOG_FORMAT = 1
+
+def _job_hash(entry: dict) -> str:
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _save_job_catalog(catalog: dict):
+    payload = {
+        "format": _JENKINS_CATALOG_FORMAT,
+        "jenkins_url": JENKINS_URL,
+        "version": catalog["version"],
+        "full_refreshed_at": catalog["full_refreshed_at"],
+        "jobs": catalog["jobs"],
+    }
+    tmp = f"{JENKINS_CATALOG_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp, JENKINS_CATALOG_PATH)
+    except OSError as e:
+        print(f"[DEBUG] Could not persist Jenkins catalog: {e}")
+
+def _load_saved_job_catalog() -> Optional[dict]:
+    try:
+        with open(JENKINS_CATALOG_PATH, encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get("format") != _JENKINS_CATALOG_FORMAT or payload.get("jenkins_url") != JENKINS_URL:
+        return None
+    return payload
+
+def _apply_job_catalog(catalog: dict, jobs: list) -> int:
+    """Swaps in `jobs` if any job was added, removed or changed. Returns the number of changed jobs."""
+    hashes = {j["name"]: _job_hash(j) for j in jobs}
+    old = catalog["hashes"]
+    changed = sum(1 for n, h in hashes.items() if old.get(n) != h) + sum(1 for n in old if n not in hashes)
+    if changed:
+        with catalog["lock"]:
+            catalog["jobs"] = jobs
+            catalog["hashes"] = hashes
+            catalog["version"] += 1
+    return changed
+
+def refresh_job_catalog(catalog: dict, full: bool = False) -> int:
+    """Brings the shared catalog up to date (see above). Returns the number of changed jobs."""
+    client = get_jenkins_server()
+    known = {j["name"]: j for j in catalog["jobs"]}
+    if full:
+        jobs, failed = load_jenkins_catalog(client)
+        if not failed:
+            catalog["full_refreshed_at"] = time.time()
+    else:
+        items, failed = _fetch_job_items(client, "name")
+        names = [full_name for full_name, _ in items]
+        new_names = [n for n in names if n not in known]
+        fetched = []
+        if new_names:
+            def fetch(name):
+                try:
+                    return _job_entry(name, client.get_info(_job_api_path(name), f"?tree={_JOB_FIELDS}"))
+                except Exception as e:
+                    # Deleted/renamed since the probe, or a transient error: the next probe retries it
+                    print(f"[DEBUG] Could not fetch Jenkins job '{name}': {e}")
+                    return None
+            with ThreadPoolExecutor(max_workers=JENKINS_FETCH_WORKERS) as pool:
+                fetched = [j for j in pool.map(fetch, new_names) if j]
+        jobs = [known[n] for n in names if n in known] + fetched
+    if failed:
+        # Folders that could not be read are not deleted folders: keep their last known jobs
+        listed = {j["name"] for j in jobs}
+        kept = [j for n, j in known.items() if n not in listed and _under_folders(n, failed)]
+        print(f"[DEBUG] Jenkins catalog refresh kept {len(kept)} jobs from unreadable folders: {failed}")
+        jobs = jobs + kept
+    jobs = sorted(jobs, key=lambda j: j["name"])
+    if not jobs and catalog["jobs"]:
+        # An empty answer is far more likely an outage than a wiped Jenkins: keep what we have
+        print("[DEBUG] Jenkins catalog refresh returned no jobs; keeping the current catalog")
+        return 0
+    changed = _apply_job_catalog(catalog, jobs)
+    if changed or full:
+        _save_job_catalog(catalog)
+    if changed:
+        print(f"[DEBUG] Jenkins catalog v{catalog['version']}: {changed} jobs changed ({len(jobs)} total)")
+    return changed
+
+def _job_catalog_refresher(catalog: dict, delay: float):
+    while True:
+        time.sleep(delay)
+        delay = JENKINS_CATALOG_REFRESH
+        full = not catalog["jobs"] or time.time() - catalog["full_refreshed_at"] >= JENKINS_CATALOG_FULL_REFRESH
         try:
-            info = _client.get_job_info(full)
-        except: 
-            continue
-            
-        desc = info.get("description", "") or "(no description)"
-        params = []
-        seen = set()
-        
-        all_sections = (
-            info.get("actions", []) +
-            info.get("properties", []) +
-            info.get("property", [])
+            refresh_job_catalog(catalog, full=full)
+        except Exception as e:
+            print(f"[DEBUG] Jenkins catalog refresh failed: {e}")
+
+@st.cache_resource(show_spinner="Fetching Jenkins Jobs into cache...")
+def get_job_catalog() -> dict:
+    """The shared catalog: {"jobs", "hashes", "version", "full_refreshed_at", "lock"}"""
+    catalog = {"lock": threading.Lock(), "jobs": [], "hashes": {}, "version": 0, "full_refreshed_at": 0.0}
+    saved = _load_saved_job_catalog()
+    if saved:
+        catalog.update(
+            jobs=saved["jobs"], version=saved["version"], full_refreshed_at=saved["full_refreshed_at"],
+            hashes={j["name"]: _job_hash(j) for j in saved["jobs"]},
         )
-        for section in all_sections:
-            if "parameterDefinitions" in section:
-                for p in section["parameterDefinitions"]:
-                    p_name = p["name"]
-                    if p_name in seen: 
-                        continue
-                    seen.add(p_name)
-                    choices = p.get("choices", [])
-                    if not choices: 
-                        choices = p.get("allValue", p.get("values", []))
-                    
-                    params.append({
-                        "name": p["name"],
-                        "type": p.get("_class", "") or p.get("type", ""),
-                        "default": p.get("defaultParameterValue", {}).get("value", ""),
-                        "choices": choices
-                    })
-        out.append({"name": full, "description": desc, "parameters": params})
-    return out
-
-if not st.session_state["job_map"]:
-    st.session_state["job_map"] = fetch_all_job_details_robust()
+        print(f"[DEBUG] Jenkins catalog v{catalog['version']} loaded from disk ({len(catalog['jobs'])} jobs)")
+        delay = 0  # probe right away for anything added while we were down
+    else:
+        try:
+            refresh_job_catalog(catalog, full=True)
+        except Exception as e:
+            print(f"[DEBUG] Initial Jenkins catalog load failed: {e}")
+        delay = JENKINS_CATALOG_REFRESH
+    threading.Thread(target=_job_catalog_refresher, args=(catalog, delay), daemon=True, name="jenkins-catalog").start()
+    return catalog
+
+# Ranked job search: an inverted index (BM25 over name path segments, parameter
+# names/choices and descriptions, weighted in that order) plus a trigram index over
+# the vocabulary, so misspelled or partial query words still find their terms.
+# The index follows the shared catalog's version and only re-indexes jobs whose
+# hash changed.
+_SEARCH_FIELD_WEIGHTS = {"name": 3.0, "params": 1.5, "description": 1.0}
+_SEARCH_BM25_K1 = 1.2
+_SEARCH_BM25_B = 0.75
+_SEARCH_MIN_SIMILARITY = 0.5
+_SEARCH_MAX_EXPANSIONS = 8
+
+def _search_tokens(text: str) -> list:
+    """Lower-case words, with camelCase and digit runs split out (deployAppV2 -> deployappv2, deploy, app, v, 2)"""
+    tokens = []
+    for word in re.findall(r"[A-Za-z0-9]+", text or ""):
+        tokens.append(word.lower())
+        parts = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+def _trigrams(term: str) -> set:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _job_document(job: dict) -> dict:
+    """token -> field-weighted term frequency for one catalog entry"""
+    fields = {
+        "name": job["name"].replace("/", " "),
+        "description": "" if job.get("description") == "(no description)" else job.get("description", ""),
+        "params": " ".join(
+            " ".join([p.get("name", "")] + [str(c) for c in ([p["choices"]] if isinstance(p.get("choices"), str) else p.get("choices") or [])])
+            for p in job.get("parameters", [])
+        ),
+    }
+    doc = {}
+    for field, text in fields.items():
+        for token in _search_tokens(text):
+            doc[token] = doc.get(token, 0.0) + _SEARCH_FIELD_WEIGHTS[field]
+    return doc
+
+def _index_add(index: dict, name: str, doc: dict, job_hash: str):
+    index["docs"][name] = {"hash": job_hash, "tf": doc, "length": sum(doc.values())}
+    index["total_length"] += sum(doc.values())
+    for token, tf in doc.items():
+        postings = index["postings"].setdefault(token, {})
+        if not postings:
+            for tri in _trigrams(token):
+                index["trigrams"].setdefault(tri, set()).add(token)
+        postings[name] = tf
+
+def _index_remove(index: dict, name: str):
+    entry = index["docs"].pop(name)
+    index["total_length"] -= entry["length"]
+    for token in entry["tf"]:
+        postings = index["postings"][token]
+        postings.pop(name, None)
+        if not postings:
+            del index["postings"][token]
+            for tri in _trigrams(token):
+                index["trigrams"][tri].discard(token)
+
+@st.cache_resource
+def get_job_search_index() -> dict:
+    return {"lock": threading.Lock(), "version": None, "docs": {}, "postings": {}, "trigrams": {}, "total_length": 0.0}
+
+def _sync_job_search_index(index: dict, catalog: dict):
+    """Re-indexes only jobs added, removed or changed since the index last saw the catalog"""
+    if index["version"] == catalog["version"]:
+        return
+    with catalog["lock"]:
+        jobs, hashes, version = catalog["jobs"], catalog["hashes"], catalog["version"]
+    with index["lock"]:
+        if index["version"] == version:
+            return
+        stale = [n for n, d in index["docs"].items() if hashes.get(n) != d["hash"]]
+        for name in stale:
+            _index_remove(index, name)
+        for job in jobs:
+            if job["name"] not in index["docs"]:
+                _index_add(index, job["name"], _job_document(job), hashes.get(job["name"], ""))
+        index["version"] = version
+
+def _expand_term(index: dict, term: str) -> list:
+    """(indexed term, similarity): the term itself, words it prefixes, and trigram look-alikes"""
+    postings = index["postings"]
+    term_trigrams = _trigrams(term)
+    counts = {}
+    for tri in term_trigrams:
+        for candidate in index["trigrams"].get(tri, ()):
+            counts[candidate] = counts.get(candidate, 0) + 1
+    scored = []
+    for candidate, shared in counts.items():
+        if candidate == term:
+            sim = 1.0
+        elif len(term) >= 2 and candidate.startswith(term):
+            sim = 0.8
+        else:
+            sim = 2.0 * shared / (len(term_trigrams) + len(_trigrams(candidate)))  # Dice coefficient over trigrams
+        if sim >= _SEARCH_MIN_SIMILARITY and candidate in postings:
+            scored.append((candidate, sim))
+    scored.sort(key=lambda t: t[1], reverse=True)
+    return scored[:_SEARCH_MAX_EXPANSIONS]
+
+def search_jobs(query: str, limit: int = 15) -> list:
+    """Ranked [(job name, score)] for a free-text query (typo tolerant).
+    
+    Jobs whose path contains the query literally (the old substring search) always rank
+    first, ordered by score among themselves; fuzzy-only matches follow.
+    """
+    index = get_job_search_index()
+    _sync_job_search_index(index, get_job_catalog())
+    scores = {}
+    with index["lock"]:
+        docs = index["docs"]
+        if not docs:
+            return []
+        n_docs = len(docs)
+        avg_len = index["total_length"] / n_docs or 1.0
+        for token in set(_search_tokens(query)):
+            for term, sim in _expand_term(index, token):
+                postings = index["postings"][term]
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for name, tf in postings.items():
+                    norm = tf + _SEARCH_BM25_K1 * (1 - _SEARCH_BM25_B + _SEARCH_BM25_B * docs[name]["length"] / avg_len)
+                    scores[name] = scores.get(name, 0.0) + sim * idf * tf * (_SEARCH_BM25_K1 + 1) / norm
+        needle = query.lower().strip()
+        literal = {name for name in docs if needle in name.lower()} if needle else set()
+    for name in literal:
+        scores.setdefault(name, 0.0)
+    return heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[0] in literal, kv[1]))
+
+# Shared read-only job list; a background refresh swaps in a new list, so re-read it every run
+st.session_state["job_map"] = get_job_catalog()["jobs"]
 
 # Helper function for ASH report with specific time range
 def generate_ash_report_specific_range(start_time: str, end_time: str, db: str):
@@ -509,6 +837,23 @@ def tool_run_sql(sql_query: str) -> str:
         sql_hash = hashlib.md5(sql_query.encode()).hexdigest()[:8]
         audit_log("SQL_QUERY", db, {"sql_hash": sql_hash, "query_preview": sql_query[:100]})
         
+        if is_select_statement(sql_query):
+            # Stream: stop as soon as there is one row more than the 100 shown
+            cols, preview = [], []
+            batches = iter_oracle_query(sql_query, db, arraysize=101, prefetchrows=101)
+            try:
+                for cols, rows in batches:
+                    preview.extend(rows[:101 - len(preview)])
+                    if len(preview) > 100:
+                        break
+            finally:
+                batches.close()
+            if not preview:
+                return "Query executed. No rows returned."
+            count = "≥101 rows, first 100 shown" if len(preview) > 100 else f"{len(preview)} rows"
+            df = pd.DataFrame.from_records(preview[:100], columns=cols)
+            return f"**SQL Result ({count}):**\n{df.to_markdown(index=False)}"
+        
         result = run_oracle_query(sql_query, db)
         if isinstance(result, list):
             if not result: 
@@ -524,21 +869,103 @@ def tool_run_sql(sql_query: str) -> str:
         return f"Exception: {error_msg}"
 
 def tool_search_jenkins_jobs(search_term: str) -> str:
-    query = search_term.lower()
-    matches = []
-    for j in st.session_state["job_map"]:
-        if query in j["name"].lower():
-            matches.append(j["name"])
-    
-    if not matches: 
+    """Ranked, typo-tolerant search over job names, descriptions and parameters"""
+    ranked = search_jobs(search_term, limit=15)
+    if not ranked: 
         return f"No jobs found matching '{search_term}'."
+    matches = [name for name, _ in ranked]
     search_id = str(uuid.uuid4())
     st.session_state["artifacts"][search_id] = {
         "type": "JENKINS_SELECT",
-        "matches": matches[:15],
+        "matches": matches,
         "timestamp": datetime.now().strftime("%H:%M")
     }
-    return f"I found {len(matches)} jobs matching '{search_term}'. ::ARTIFACT_JENKINS:{search_id}:: TERMINATE"
+    return f"I found {len(matches)} jobs matching '{search_term}' (best: {', '.join(matches[:3])}). ::ARTIFACT_JENKINS:{search_id}:: TERMINATE"
+
+# Build history: one tree= request returns the last N builds with their parameters and
+# causes. Every console reader goes through read_console_tail: logText/progressiveText
+# reports the log length in X-Text-Size and is read backward from there, so multi-hundred
+# MB logs are never downloaded whole.
+_CONSOLE_ERROR_RE = re.compile(rb"(?i)\b(?:error|fatal|exception|traceback|build failed)\b|failed:")
+_BUILD_FIELDS = "number,result,duration,timestamp,building,url,actions[parameters[name,value],causes[_class,userName,shortDescription]]"
+
+def fetch_build_summaries(server, job_name: str, limit: int) -> list:
+    """The newest `limit` builds of a job, with actions, in a single request"""
+    info = server.get_info(_job_api_path(job_name), f"?tree=builds[_class,{_BUILD_FIELDS}]{{0,{int(limit)}}}")
+    return info.get("builds", [])
+
+def _progressive_console(server, job_name: str, build_number: int, start: int):
+    """Streamed response for a build's console from byte offset `start`"""
+    path = f"{quote(_job_api_path(job_name))}/{int(build_number)}/logText/progressiveText?start={int(start)}"
+    return server.jenkins_request(requests.Request("GET", server._build_url(path)), add_crumb=False, stream=True)
+
+def _read_console_range(server, job_name: str, build_number: int, start: int, length: int) -> bytes:
+    """`length` bytes of the console from `start`; the rest of the stream is never read"""
+    resp = _progressive_console(server, job_name, build_number, start)
+    try:
+        data = bytearray()
+        for piece in resp.iter_content(chunk_size=JENKINS_CONSOLE_CHUNK):
+            data += piece
+            if len(data) >= length:
+                break
+        return bytes(data[:length])
+    finally:
+        resp.close()
+
+def read_console_tail(server, job_name: str, build_number: int, max_chars: int = JENKINS_CONSOLE_TAIL_CHARS,
+                      max_lines: int = None, until_error: bool = False) -> tuple:
+    """(tail of a build's console, full log size in bytes) without downloading the whole log.
+    
+    Without max_lines the last max_chars characters are read in one request. With max_lines the log
+    is read backward in JENKINS_CONSOLE_CHUNK pieces until it has that many lines; until_error also
+    keeps going (up to JENKINS_CONSOLE_MAX_SCAN bytes) until it reaches an error line, which is
+    prepended with some context when it lies above the last max_lines lines.
+    """
+    probe = _progressive_console(server, job_name, build_number, 0)
+    try:
+        size = probe.headers.get("X-Text-Size")
+        if size is None:
+            # No progressive log support: the probe already is the whole log
+            text = probe.content.decode("utf-8", errors="replace")
+            return text[-max_chars:], len(text)
+        size = int(size)
+    finally:
+        probe.close()
+    if size == 0:
+        return "", 0
+    
+    if max_lines is None:
+        end = max(size - max_chars, 0)
+        buf = _read_console_range(server, job_name, build_number, end, size - end)
+    else:
+        floor = max(size - JENKINS_CONSOLE_MAX_SCAN, 0)
+        end = size
+        buf = b""
+        while end > floor:
+            start = max(end - JENKINS_CONSOLE_CHUNK, floor)
+            buf = _read_console_range(server, job_name, build_number, start, end - start) + buf
+            end = start
+            if buf.count(b"\n") > max_lines and (not until_error or _CONSOLE_ERROR_RE.search(buf)):
+                break
+    
+    text = buf.decode("utf-8", errors="replace")
+    if end > 0 and "\n" in text:
+        text = text.split("\n", 1)[1]  # drop the partial first line
+    if max_lines is None:
+        return text, size
+    
+    lines = text.splitlines()
+    tail = lines[-max_lines:]
+    if until_error:
+        errors = [i for i, line in enumerate(lines) if _CONSOLE_ERROR_RE.search(line.encode("utf-8", errors="replace"))]
+        first_tail = len(lines) - len(tail)
+        if errors and errors[-1] < first_tail:
+            last = errors[-1]
+            lo = max(last - JENKINS_CONSOLE_ERROR_CONTEXT, 0)
+            hi = min(last + JENKINS_CONSOLE_ERROR_CONTEXT + 1, first_tail)
+            skipped = first_tail - hi
+            tail = lines[lo:hi] + ([f"... [{skipped} lines skipped] ..."] if skipped else []) + tail
+    return "\n".join(tail), size
 
 def tool_get_build_info(job_name: str, build_number: int = None) -> str:
     """Get detailed information about a Jenkins build. If build_number is not provided, gets the latest build."""
@@ -590,7 +1017,7 @@ def tool_get_build_console(job_name: str, build_number: int = None) -> str:
                 return f"FAILURE: No builds found for job '{job_name}'."
             build_number = job_info["builds"][0]["number"]
         
-        console_output = server.get_build_console_output(job_name, build_number)
+        console_output, console_length = read_console_tail(server, job_name, build_number)
         
         # Store as artifact
         artifact_id = str(uuid.uuid4())
@@ -599,12 +1026,13 @@ def tool_get_build_console(job_name: str, build_number: int = None) -> str:
             "job_name": job_name,
             "build_number": build_number,
             "console_output": console_output,
+            "console_length": console_length,
             "timestamp": datetime.now().strftime("%H:%M:%S")
         }
         
         # Return summary (last 500 chars) to avoid overwhelming the chat
         console_preview = console_output[-500:] if len(console_output) > 500 else console_output
-        return f"SUCCESS: Console output retrieved for {job_name} #{build_number} ({len(console_output)} chars). Last 500 chars:\n\n```\n{console_preview}\n```\n\nFull console available in artifacts. ::ARTIFACT_JENKINS_CONSOLE:{artifact_id}::"
+        return f"SUCCESS: Console output retrieved for {job_name} #{build_number} ({console_length} bytes). Last 500 chars:\n\n```\n{console_preview}\n```\n\nLast {len(console_output)} chars available in artifacts. ::ARTIFACT_JENKINS_CONSOLE:{artifact_id}::"
     except Exception as e:
         return f"FAILURE: Error getting console output: {str(e)}"
 
@@ -635,23 +1063,18 @@ def tool_get_build_history(job_name: str, limit: int = 10) -> str:
         if server is None:
             return "FAILURE: Could not connect to Jenkins server."
         
-        job_info = server.get_job_info(job_name)
-        builds = job_info.get("builds", [])[:limit]
+        builds = fetch_build_summaries(server, job_name, limit)
         
         if not builds:
             return f"FAILURE: No builds found for job '{job_name}'."
         
         result = f"**Build History for {job_name} (Last {len(builds)} builds):**\n\n"
-        for build in builds:
-            build_num = build["number"]
-            try:
-                build_info = server.get_build_info(job_name, build_num)
-                status = build_info.get("result", "IN PROGRESS")
-                duration = build_info.get("duration", 0) / 1000
-                timestamp = datetime.fromtimestamp(build_info.get("timestamp", 0) / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                result += f"- **Build #{build_num}:** {status} | Duration: {duration:.2f}s | {timestamp}\n"
-            except:
-                result += f"- **Build #{build_num}:** Status unknown\n"
+        for build_info in builds:
+            build_num = build_info["number"]
+            status = build_info.get("result") or "IN PROGRESS"
+            duration = (build_info.get("duration") or 0) / 1000
+            timestamp = datetime.fromtimestamp((build_info.get("timestamp") or 0) / 1000).strftime('%Y-%m-%d %H:%M:%S')
+            result += f"- **Build #{build_num}:** {status} | Duration: {duration:.2f}s | {timestamp}\n"
         
         artifact_id = str(uuid.uuid4())
         st.session_state["artifacts"][artifact_id] = {
@@ -684,8 +1107,8 @@ def tool_analyze_build_failure(job_name: str, build_number: int = None) -> str:
         if status == "SUCCESS":
             return f"INFO: Build #{build_number} for '{job_name}' was successful. No failure to analyze."
         
-        # Get console output
-        console_output = server.get_build_console_output(job_name, build_number)
+        # Console tail, plus the last error line (with context) if it is further up
+        console_output, _ = read_console_tail(server, job_name, build_number, max_lines=100, until_error=True)
         
         # Use LLM to analyze the failure
         llm_config = {"config_list": [{"model": "gpt-4o-mini", "api_key": openai_api_key}], "temperature": 0}
@@ -707,8 +1130,8 @@ Be concise but thorough."""
         Build: #{build_number}
         Status: {status}
         
-        Console Output (last 3000 chars):
-        {console_output[-3000:]}
+        Console Output (last error and last lines):
+        {console_output}
         
         Provide a structured analysis of the failure.
         """
@@ -740,8 +1163,8 @@ def tool_compare_builds(job_name: str, build_number1: int, build_number2: int) -
         build1_info = server.get_build_info(job_name, build_number1)
         build2_info = server.get_build_info(job_name, build_number2)
         
-        build1_console = server.get_build_console_output(job_name, build_number1)
-        build2_console = server.get_build_console_output(job_name, build_number2)
+        build1_console, _ = read_console_tail(server, job_name, build_number1, max_chars=2000)
+        build2_console, _ = read_console_tail(server, job_name, build_number2, max_chars=2000)
         
         # Use LLM to compare builds
         llm_config = {"config_list": [{"model": "gpt-4o-mini", "api_key": openai_api_key}], "temperature": 0}
@@ -861,33 +1284,41 @@ def get_comprehensive_build_history(job_name: str, limit: int = 10) -> dict:
         if server is None:
             return {"status": "error", "message": "Could not connect to Jenkins server."}
         
-        # Get job info to check if it exists
+        # Last N builds with parameters/causes in one request (also checks the job exists)
         try:
-            job_info = server.get_job_info(job_name)
+            builds = fetch_build_summaries(server, job_name, limit)
         except Exception as e:
             return {"status": "error", "message": f"Job '{job_name}' not found: {str(e)}"}
         
-        builds = job_info.get("builds", [])[:limit]
         if not builds:
             return {"status": "not_found", "message": f"No builds found for job '{job_name}'."}
         
+        # Console tails, a bounded number of builds at a time
+        consoles = {}
+        with ThreadPoolExecutor(max_workers=min(JENKINS_FETCH_WORKERS, len(builds))) as pool:
+            futures = {pool.submit(read_console_tail, server, job_name, b["number"]): b["number"] for b in builds}
+            for future in as_completed(futures):
+                try:
+                    consoles[futures[future]] = future.result()
+                except Exception as e:
+                    consoles[futures[future]] = (f"Error retrieving console output: {str(e)}", 0)
+        
         build_history = []
         
-        for build in builds:
-            build_num = build["number"]
+        for build_info in builds:
+            build_num = build_info["number"]
             try:
-                build_info = server.get_build_info(job_name, build_num)
-                
                 # Extract basic info
-                status = build_info.get("result", "IN PROGRESS")
-                duration = build_info.get("duration", 0) / 1000  # Convert to seconds
-                timestamp = datetime.fromtimestamp(build_info.get("timestamp", 0) / 1000)
+                status = build_info.get("result") or "IN PROGRESS"
+                duration = (build_info.get("duration") or 0) / 1000  # Convert to seconds
+                timestamp = datetime.fromtimestamp((build_info.get("timestamp") or 0) / 1000)
                 building = build_info.get("building", False)
                 url = build_info.get("url", "")
+                actions = [a for a in build_info.get("actions", []) if a]
                 
                 # Extract parameters from actions
                 parameters = {}
-                for action in build_info.get("actions", []):
+                for action in actions:
                     if "parameters" in action:
                         for param in action["parameters"]:
                             param_name = param.get("name", "")
@@ -897,7 +1328,7 @@ def get_comprehensive_build_history(job_name: str, limit: int = 10) -> dict:
                 
                 # Extract causes (who triggered it)
                 causes = []
-                for action in build_info.get("actions", []):
+                for action in actions:
                     if "causes" in action:
                         for cause in action["causes"]:
                             cause_type = cause.get("_class", "").split(".")[-1] if cause.get("_class") else "Unknown"
@@ -907,16 +1338,8 @@ def get_comprehensive_build_history(job_name: str, limit: int = 10) -> dict:
                             else:
                                 causes.append(cause_type)
                 
-                # Get console output (limit to last 10000 chars to avoid memory issues)
-                console_output = ""
-                try:
-                    full_console = server.get_build_console_output(job_name, build_num)
-                    # Keep last 10000 chars for display, but store full length
-                    console_output = full_console[-10000:] if len(full_console) > 10000 else full_console
-                    console_length = len(full_console)
-                except Exception as e:
-                    console_output = f"Error retrieving console output: {str(e)}"
-                    console_length = 0
+                # Last JENKINS_CONSOLE_TAIL_CHARS of the console, plus the full log length
+                console_output, console_length = consoles[build_num]
                 
                 # Determine job type (freestyle or pipeline)
                 job_type = "Unknown"
@@ -1094,8 +1517,172 @@ def tool_run_health_check() -> str:
     audit_log("HEALTH_CHECK", db, {"status": "failed", "message": res.get('message')})
     return f"Health Check Failed: {res.get('message')}"
 
-def tool_performance_report(start_time: str = None, end_time: str = None, hours_back: float = None) -> str:
-    """Generates AWR/ASH reports - Fixed missing import issue"""
+# Fleet sweep settings: unreachable databases are reported after FLEET_PING_TIMEOUT
+# instead of holding up the whole sweep.
+FLEET_SWEEP_WORKERS = int(os.getenv("FLEET_SWEEP_WORKERS", "8"))
+FLEET_PING_TIMEOUT = float(os.getenv("FLEET_PING_TIMEOUT", "10"))
+FLEET_DB_TIMEOUT = float(os.getenv("FLEET_DB_TIMEOUT", "300"))
+
+def _fleet_check_label(title: str) -> str:
+    """'1. Tablespace Usage >90% ( also ...)' -> '1. Tablespace Usage'"""
+    return re.split(r"\s[>(]", title, maxsplit=1)[0].strip()
+
+def _fleet_error_row(db: str, status: str, message: str) -> dict:
+    return {"DATABASE": db, "STATUS": status, "ERROR": message, "findings": {}}
+
+def _fleet_check_database(db: str, ping_ms: float) -> dict:
+    """Worker: canned health checks + real-time metrics for one database (no LLM call)."""
+    started = time.time()
+    # The ASH-based checks start a sampler; a one-off sweep shouldn't leave one polling behind
+    had_sampler = ash_sampler_running(db)
+    try:
+        results = run_health_checks(db)
+        metrics = get_realtime_metrics_data(db)
+    finally:
+        if not had_sampler:
+            stop_ash_sampler(db)
+    util = metrics.get("current_utilization", {})
+
+    row = {
+        "DATABASE": db,
+        "STATUS": "OK",
+        "PING_MS": ping_ms,
+        "CPU": (util.get("CPU") or {}).get("VALUE"),
+        "IO": (util.get("IO") or {}).get("VALUE"),
+        "MEMORY_GB": (util.get("MEMORY") or {}).get("VALUE"),
+        "findings": {},
+    }
+    statuses = []
+    for title, data in results.items():
+        status = health_check_status(data)
+        statuses.append(status)
+        label = _fleet_check_label(title)
+        if status == "OK":
+            row[label] = "✅"
+        elif status == "ERROR":
+            row[label] = "❌"
+            row["findings"][title] = data
+        else:
+            row[label] = f"⚠️ {len(data) if isinstance(data, list) else 1}"
+            row["findings"][title] = data
+    if "ERROR" in statuses:
+        row["STATUS"] = "ERROR"
+    elif "FINDINGS" in statuses:
+        row["STATUS"] = "FINDINGS"
+    row["DURATION_S"] = round(time.time() - started, 1)
+    return row
+
+def iter_fleet_health_sweep(dbs: List[str]):
+    """
+    Fans health checks + metrics out across databases and yields one matrix row
+    per database as soon as it finishes. Each database is pinged first; ones that
+    do not answer within FLEET_PING_TIMEOUT are yielded as UNREACHABLE right away.
+    """
+    if not dbs:
+        return
+    ping_pool = ThreadPoolExecutor(max_workers=len(dbs), thread_name_prefix="fleet-ping")
+    check_pool = ThreadPoolExecutor(max_workers=max(1, min(FLEET_SWEEP_WORKERS, len(dbs))), thread_name_prefix="fleet-check")
+    try:
+        ping_futures = {ping_pool.submit(ping_database, db): db for db in dbs}
+        check_futures = {}
+        handled = set()
+
+        def _dispatch(fut):
+            db = ping_futures[fut]
+            handled.add(fut)
+            ping = fut.result()
+            if ping.get("status") == "ok":
+                check_futures[check_pool.submit(_fleet_check_database, db, ping.get("latency_ms"))] = db
+                return None
+            return _fleet_error_row(db, "UNREACHABLE", ping.get("message", "Ping failed"))
+
+        try:
+            for fut in as_completed(ping_futures, timeout=FLEET_PING_TIMEOUT):
+                row = _dispatch(fut)
+                if row:
+                    yield row
+        except FuturesTimeoutError:
+            pass
+        for fut, db in ping_futures.items():
+            if fut in handled:
+                continue
+            if fut.done():
+                row = _dispatch(fut)
+                if row:
+                    yield row
+            else:
+                yield _fleet_error_row(db, "UNREACHABLE", f"No response within {FLEET_PING_TIMEOUT:.0f}s")
+
+        done = set()
+        try:
+            for fut in as_completed(check_futures, timeout=FLEET_DB_TIMEOUT):
+                done.add(fut)
+                db = check_futures[fut]
+                try:
+                    yield fut.result()
+                except Exception as e:
+                    yield _fleet_error_row(db, "ERROR", str(e))
+        except FuturesTimeoutError:
+            for fut, db in check_futures.items():
+                if fut not in done:
+                    yield _fleet_error_row(db, "TIMEOUT", f"Checks did not finish within {FLEET_DB_TIMEOUT:.0f}s")
+    finally:
+        # Never wait on stuck connects; their threads finish in the background
+        ping_pool.shutdown(wait=False, cancel_futures=True)
+        check_pool.shutdown(wait=False, cancel_futures=True)
+
+def fleet_matrix_frame(rows: List[Dict]) -> pd.DataFrame:
+    """Builds the DB x check matrix shown in the FLEET artifact."""
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame([{k: v for k, v in r.items() if k != "findings"} for r in rows])
+    lead = [c for c in ["DATABASE", "STATUS", "PING_MS", "CPU", "IO", "MEMORY_GB", "DURATION_S"] if c in df.columns]
+    rest = [c for c in df.columns if c not in lead and c != "ERROR"]
+    tail = ["ERROR"] if "ERROR" in df.columns else []
+    return df[lead + rest + tail].sort_values("DATABASE").reset_index(drop=True)
+
+def tool_run_fleet_health_check(databases: str = None) -> str:
+    """Runs health checks + real-time metrics on every configured database (or a comma-separated subset)."""
+    configured = {name.upper(): name for name in oracle_runner_agentic_1.DB_CONFIG}
+    unknown = []
+    if databases:
+        requested = [d.strip().upper() for d in databases.split(",") if d.strip()]
+        # Unknown names would silently resolve to DEFAULT and show its health under the wrong label
+        unknown = [d for d in requested if d not in configured]
+        dbs = [configured[d] for d in requested if d in configured]
+    else:
+        dbs = list(configured.values())
+
+    fleet_id = str(uuid.uuid4())
+    artifact = {
+        "type": "FLEET_HEALTH",
+        "databases": dbs + unknown,
+        "rows": [_fleet_error_row(d, "UNKNOWN", "Not a configured database") for d in unknown],
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "status": "running",
+    }
+    st.session_state["artifacts"][fleet_id] = artifact
+
+    started = time.time()
+    progress = st.empty()
+    for row in iter_fleet_health_sweep(dbs):
+        artifact["rows"].append(row)
+        with progress.container():
+            st.caption(f"🌐 Fleet sweep: {len(artifact['rows'])}/{len(artifact['databases'])} databases done")
+            st.dataframe(fleet_matrix_frame(artifact["rows"]), width='stretch', hide_index=True)
+    progress.empty()
+
+    artifact["status"] = "done"
+    artifact["elapsed_s"] = round(time.time() - started, 1)
+    counts = {}
+    for row in artifact["rows"]:
+        counts[row["STATUS"]] = counts.get(row["STATUS"], 0) + 1
+    audit_log("FLEET_HEALTH_CHECK", ",".join(artifact["databases"]), {"status": "success", "counts": counts})
+    summary = ", ".join(f"{v} {k}" for k, v in sorted(counts.items()))
+    return f"Fleet health sweep finished for {len(artifact['databases'])} databases in {artifact['elapsed_s']}s ({summary}). ::ARTIFACT_FLEET:{fleet_id}::"
+
+def tool_performance_report(start_time: str = None, end_time: str = None, hours_back: float = None, report_kind: str = None) -> str:
+    """Generates AWR/ASH reports - Fixed missing import issue. report_kind ('AWR'/'ASH') overrides the duration rule for ranges"""
     db = st.session_state["current_db"]
     res = None
     report_type = "AWR"
@@ -1121,16 +1708,22 @@ def tool_performance_report(start_time: str = None, end_time: str = None, hours_
             t1 = datetime.strptime(start_time, fmt)
             t2 = datetime.strptime(end_time, fmt)
             duration = (t2 - t1).total_seconds() / 60.0
+            kind = (report_kind or "").upper()
             
-            if duration < 30.0:
+            if kind == "ASH" or (duration < 30.0 and kind != "AWR"):
                 report_type = "ASH"
                 # FIX: Use helper function instead of missing import
                 res = generate_ash_report_specific_range(start_time, end_time, db)
             else:
-                snaps = get_snapshots_by_date_range(start_time, end_time, db)
-                if not snaps: 
+                # Snapshots land a few seconds past the interval mark (10:00:04), so match the
+                # window edges to the nearest snapshot ends rather than requiring containment
+                rng = find_snapshot_range(db, t1, t2, nearest=True)
+                if rng["start_snap"] is None or rng["start_snap"] == rng["end_snap"]:
                     return f"FAILURE: No snapshots found between {start_time} and {end_time}."
-                res = generate_awr_report(snaps[0]['snap_id'], snaps[1]['snap_id'], db)
+                if rng["restarted_at"]:
+                    # AWR cannot span a restart: report only the part after the latest startup
+                    period_str += f" (instance restarted {rng['restarted_at']}, report starts after restart)"
+                res = generate_awr_report(rng["start_snap"], rng["end_snap"], db)
 
         else:
             return "FAILURE: Provide hours_back OR start_time/end_time."
@@ -1149,13 +1742,38 @@ def tool_performance_report(start_time: str = None, end_time: str = None, hours_
             }
             st.session_state["awr_history"].append(entry)
             audit_log("PERFORMANCE_REPORT", db, {"type": report_type, "period": period_str})
-            return f"SUCCESS: Generated {report_type} Report ({period_str}). File: {res['filename']}. buttons_rendered_below"
+            source = " (served from report cache)" if res.get("cached") else ""
+            return f"SUCCESS: Generated {report_type} Report ({period_str}){source}. File: {res['filename']}. buttons_rendered_below"
         
         return f"FAILURE: {res.get('message')}"
 
     except Exception as e:
         return f"ERROR in tool: {str(e)}"
 
+AWR_SECTION_VIEWS = [
+    ("load_profile", "### 📈 Load Profile", ["METRIC", "PER_SECOND", "PER_TRANSACTION", "PER_EXEC", "PER_CALL"]),
+    ("top_events", "### ⏳ Top Wait Events", ["EVENT", "WAITS", "TIME_S", "AVG_WAIT_MS", "PCT_DB_TIME", "WAIT_CLASS"]),
+    ("ash_top_events", "### ⏳ Top User Events (ASH)", ["EVENT", "EVENT_CLASS", "PCT_ACTIVITY", "AVG_ACTIVE_SESSIONS"]),
+    ("time_model", "### 🕒 Time Model", ["STATISTIC", "TIME_S", "PCT_DB_TIME"]),
+    ("sql_elapsed", "### ⏱️ Top SQLs by Elapsed Time", ["SQL_ID", "ELAPSED_S", "EXECUTIONS", "ELAPSED_PER_EXEC_S", "PCT_TOTAL", "PCT_CPU", "PCT_IO", "SQL_TEXT"]),
+    ("sql_cpu", "### 🔥 Top SQLs by CPU", ["SQL_ID", "CPU_S", "EXECUTIONS", "CPU_PER_EXEC_S", "PCT_TOTAL", "SQL_TEXT"]),
+    ("sql_gets", "### 🧮 Top SQLs by Buffer Gets", ["SQL_ID", "BUFFER_GETS", "EXECUTIONS", "GETS_PER_EXEC", "PCT_TOTAL", "SQL_TEXT"]),
+    ("sql_reads", "### 💾 Top SQLs by Physical Reads", ["SQL_ID", "PHYSICAL_READS", "EXECUTIONS", "READS_PER_EXEC", "PCT_TOTAL", "SQL_TEXT"]),
+    ("ash_top_sql", "### 🔎 Top SQL (ASH)", ["SQL_ID", "PLAN_HASH_VALUE", "PCT_ACTIVITY", "EVENT", "PCT_EVENT", "SQL_TEXT"]),
+    ("io_tablespace", "### 🗄️ Tablespace I/O", ["TABLESPACE", "READS", "AVG_READS_PER_S", "AVG_READ_MS", "WRITES", "BUFFER_WAITS"]),
+    ("efficiency", "### 🎯 Instance Efficiency", ["METRIC", "VALUE"]),
+]
+
+def render_awr_sections(sections: dict, max_rows: int = 10):
+    """Renders parse_awr_report() output: one table per section found in the report."""
+    for key, title, columns in AWR_SECTION_VIEWS:
+        df = sections.get(key)
+        if df is None or df.empty:
+            continue
+        st.markdown(title)
+        with st.container(border=True):
+            st.dataframe(df[[c for c in columns if c in df.columns]].head(max_rows), width='stretch', hide_index=True)
+
 def tool_analyze_report_content(user_question: str) -> str:
     """Analyzes the most recently generated report in history. Can answer questions about the report."""
     if not st.session_state["awr_history"]:
@@ -1164,8 +1782,10 @@ def tool_analyze_report_content(user_question: str) -> str:
     last_report = st.session_state["awr_history"][-1]
     
     try:
-        soup = BeautifulSoup(last_report["report_html"], 'html.parser')
-        text = soup.get_text()[:120000]
+        # Exact section tables from the parser; the flattened report only fills the remaining budget
+        sections = parse_awr_report(last_report["report_html"])
+        sections_text = awr_sections_to_text(sections)
+        text = f"{sections_text}\n\n{awr_report_text(last_report['report_html'])}"[:120000]
         
         # Check if this is a general analysis request or a specific question
         # Remove "Question about the AWR report:" prefix if present
@@ -1175,7 +1795,20 @@ def tool_analyze_report_content(user_question: str) -> str:
             "analyze", "analysis", "summary", "overview", "report", "highlight", "show me", "give me"
         ]) and len(clean_question.split()) < 10  # General analysis requests are usually short
         
-        if is_general_analysis:
+        if is_general_analysis and sections:
+            # Numbers are rendered straight from the parsed tables; the LLM only interprets them
+            prompt = f"""
+            Below are the Load Profile, Top Events, Time Model, SQL and I/O sections parsed from an Oracle {last_report['type']} report.
+            The tables are shown to the user as-is, so do NOT repeat them.
+            
+            Provide:
+            1. **Key Findings** - up to 5 bullets, each citing the SQL ID / event / metric and its number
+            2. **Recommendations** - numbered list, max 5 recommendations
+            
+            Parsed sections:
+            {sections_text}
+            """
+        elif is_general_analysis:
             # General analysis - provide focused summary with STRICT formatting
             prompt = f"""
             Analyze the AWR report and provide a CONCISE, STRUCTURED analysis with ONLY the following sections.
@@ -1251,7 +1884,8 @@ def tool_analyze_report_content(user_question: str) -> str:
             "report_label": last_report['label'],
             "report_html": last_report["report_html"],  # Store full report for Q&A
             "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "is_question": not is_general_analysis
+            "is_question": not is_general_analysis,
+            "sections": sections
         }
         
         # Return minimal text - the artifact will render the full analysis
@@ -1266,7 +1900,7 @@ def tool_analyze_report_content(user_question: str) -> str:
 def tool_compare_awr_reports(baseline_start_time: str, baseline_end_time: str, target_start_time: str, target_end_time: str) -> str:
     """Compare AWR reports for baseline and target time periods. 
     Requires 2 time periods for baseline (start/end) and 2 for target (start/end).
-    Generates detailed LLM analysis."""
+    Deltas are computed locally; one LLM call explains the delta table."""
     db = st.session_state["current_db"]
     
     try:
@@ -1295,65 +1929,27 @@ def tool_compare_awr_reports(baseline_start_time: str, baseline_end_time: str, t
         if not target_snaps or len(target_snaps) < 2:
             return f"FAILURE: Need at least 2 snapshots in target period ({target_start_time} to {target_end_time}). Found: {len(target_snaps) if target_snaps else 0}."
         
-        # Generate AWR reports for both time ranges
-        baseline_report = generate_awr_report(baseline_snaps[0]['snap_id'], baseline_snaps[-1]['snap_id'], db)
-        target_report = generate_awr_report(target_snaps[0]['snap_id'], target_snaps[-1]['snap_id'], db)
-        
-        if baseline_report.get("status") != "ok" or target_report.get("status") != "ok":
-            return f"FAILURE: Could not generate AWR reports. Baseline: {baseline_report.get('message', 'Unknown')}, Target: {target_report.get('message', 'Unknown')}"
+        # Read both periods straight from DBA_HIST (no AWR_REPORT_HTML rendering needed for numbers)
+        try:
+            baseline_data = extract_awr_data(baseline_snaps[0]['snap_id'], baseline_snaps[-1]['snap_id'], db)
+            target_data = extract_awr_data(target_snaps[0]['snap_id'], target_snaps[-1]['snap_id'], db)
+        except Exception as e:
+            return f"FAILURE: Could not read AWR data: {e}"
         
-        # Compare the reports
+        # Compare the periods
         baseline_label = f"Baseline ({baseline_start_time} to {baseline_end_time})"
         target_label = f"Target ({target_start_time} to {target_end_time})"
-        comparison_result = compare_awr_reports(
-            baseline_report["report"], 
-            target_report["report"], 
-            baseline_label, 
-            target_label
-        )
+        comparison_result = compare_awr_sections(baseline_data, target_data, baseline_label, target_label)
         
         if comparison_result.get("status") != "ok":
             return f"FAILURE: Comparison failed: {comparison_result.get('message', 'Unknown error')}"
         
-        # Generate detailed LLM analysis
-        llm_config = {"config_list": [{"model": "gpt-4o-mini", "api_key": openai_api_key}], "temperature": 0}
-        analyzer = AssistantAgent(
-            "awr_comparison_analyst", 
-            llm_config=llm_config, 
-            system_message="""You are an Oracle Expert DBA analyzing AWR report comparisons. 
-            Provide a DETAILED, STRUCTURED analysis with:
-            1. **Executive Summary** - Overall performance comparison
-            2. **Key Metrics Changes** - DB Time, CPU, I/O, Wait Events changes
-            3. **Top SQL Regressions** - SQLs that degraded with details
-            4. **Top SQL Improvements** - SQLs that improved
-            5. **Wait Event Analysis** - Significant wait event changes
-            6. **Resource Utilization Changes** - CPU, Memory, I/O trends
-            7. **Critical Findings** - Issues requiring immediate attention
-            8. **Recommendations** - Actionable steps to address issues
-            
-            Be specific with numbers, percentages, and SQL IDs. Format clearly with sections."""
-        )
-        
-        comparison_text = comparison_result.get("comparison", "")
-        analysis_prompt = f"""
-        Analyze this AWR comparison report and provide a comprehensive detailed analysis:
-        
-        {comparison_text[:150000]}
-        
-        Focus on:
-        - Performance degradation or improvement
-        - Root causes of changes
-        - Specific SQLs and wait events
-        - Actionable recommendations
-        """
-        
-        detailed_analysis = analyzer.generate_reply([{"role": "user", "content": analysis_prompt}])
-        
         # Store as artifact
         comp_id = str(uuid.uuid4())
         st.session_state["artifacts"][comp_id] = {
             "type": "COMPARE",
-            "content": detailed_analysis,
+            "content": comparison_result.get("comparison", ""),
+            "diff": comparison_result.get("diff"),
             "title": f"AWR Comparison: Baseline ({baseline_start_time} to {baseline_end_time}) vs Target ({target_start_time} to {target_end_time})",
             "baseline_start_time": baseline_start_time,
             "baseline_end_time": baseline_end_time,
@@ -1368,11 +1964,33 @@ def tool_compare_awr_reports(baseline_start_time: str, baseline_end_time: str, t
             "target_start": target_start_time,
             "target_end": target_end_time
         })
-        return f"SUCCESS: AWR comparison completed for Baseline ({baseline_start_time} to {baseline_end_time}) vs Target ({target_start_time} to {target_end_time}). Detailed analysis generated. ::ARTIFACT_COMPARE:{comp_id}::"
+        return f"SUCCESS: AWR comparison completed for Baseline ({baseline_start_time} to {baseline_end_time}) vs Target ({target_start_time} to {target_end_time}). Delta table and analysis generated. ::ARTIFACT_COMPARE:{comp_id}::"
         
     except Exception as e:
         return f"ERROR in AWR comparison: {str(e)}"
 
+def tool_scan_plan_regressions(days: float = 7) -> str:
+    """Finds SQL whose current plan is slower per execution than an earlier plan (AWR, last N days)"""
+    db = st.session_state["current_db"]
+    try:
+        df = scan_plan_regressions(db, days=days)
+    except Exception as e:
+        return f"Error scanning plan regressions: {handle_oracle_error(e)}"
+    if df.empty:
+        return f"No plan regressions found in the last {days} days."
+    reg_id = str(uuid.uuid4())
+    st.session_state["artifacts"][reg_id] = {
+        "type": "PLAN_REGRESSIONS",
+        "data": df,
+        "days": days,
+        "db": db,
+        "timestamp": datetime.now().strftime("%H:%M:%S")
+    }
+    top = df.iloc[0]
+    return (f"Found {len(df)} SQL with plan regressions in the last {days} days. Worst: {top['SQL_ID']} "
+            f"(plan {top['BASELINE_PLAN']} → {top['CURRENT_PLAN']}, {top['ELAPSED_RATIO']}x elapsed per exec, "
+            f"{top['EXTRA_DB_TIME_S']}s extra DB time). ::ARTIFACT_PLAN_REGRESSION:{reg_id}::")
+
 def tool_analyze_health_report(user_question: str) -> str:
     """Analyzes the most recently generated health report. Can answer questions about the report."""
     # Find the most recent health report artifact
@@ -1507,6 +2125,32 @@ def tool_list_active_sessions() -> str:
     except Exception as e:
         return f"Error listing sessions: {handle_oracle_error(e)}"
 
+def tool_blocking_chains() -> str:
+    """Blocking chains across all instances: root blockers, waiters per root, deadlock cycles"""
+    db = st.session_state["current_db"]
+    try:
+        result = get_blocking_tree(db)
+        if "error" in result:
+            return f"Error reading blocking chains: {result['error']}"
+        if not result["roots"]:
+            return f"No blocking detected ({result['sessions_scanned']} sessions scanned)."
+        chain_id = str(uuid.uuid4())
+        st.session_state["artifacts"][chain_id] = {
+            "type": "BLOCKING_TREE",
+            "data": result,
+            "db": db,
+            "timestamp": datetime.now().strftime("%H:%M:%S")
+        }
+        top = result["roots"][0]
+        summary = (f"{len(result['roots'])} root blocker(s), {result['blocked_sessions']} blocked sessions, "
+                   f"max chain depth {result['max_depth']}. Top root blocker: {top['SESSION']} "
+                   f"({top['USERNAME'] or top['STATUS']}) holding {top['TOTAL_WAITERS']} waiters.")
+        if result["cycles"]:
+            summary += f" ⚠️ {len(result['cycles'])} deadlock cycle(s) detected."
+        return f"{summary} ::ARTIFACT_BLOCKING:{chain_id}::"
+    except Exception as e:
+        return f"Error reading blocking chains: {handle_oracle_error(e)}"
+
 def tool_kill_session(sid: int, serial: int, immediate: bool = False) -> str:
     """Kill problematic sessions - requires confirmation"""
     db = st.session_state["current_db"]
@@ -1602,9 +2246,27 @@ def tool_check_tablespaces() -> str:
       AND d.CONTENTS LIKE 'TEMPORARY'
     ORDER BY 1
     """
+    # Autoextend ceiling per tablespace (how far it can still grow)
+    sql_max = """
+    SELECT TABLESPACE_NAME,
+           ROUND(SUM(CASE WHEN AUTOEXTENSIBLE = 'YES' THEN GREATEST(MAXBYTES, BYTES) ELSE BYTES END) / 1024 / 1024 / 1024, 2) as MAX_SIZE_GB
+    FROM dba_data_files
+    GROUP BY TABLESPACE_NAME
+    UNION ALL
+    SELECT TABLESPACE_NAME,
+           ROUND(SUM(CASE WHEN AUTOEXTENSIBLE = 'YES' THEN GREATEST(MAXBYTES, BYTES) ELSE BYTES END) / 1024 / 1024 / 1024, 2)
+    FROM dba_temp_files
+    GROUP BY TABLESPACE_NAME
+    """
     
     try:
-        result = run_oracle_query(sql, db)
+        batch = run_oracle_batch({"usage": sql, "max_size": sql_max}, db)
+        result = batch.get("usage")
+        if isinstance(result, dict) and "error" in result:
+            return f"Error checking tablespaces: {handle_oracle_error(result['error'])}"
+        max_sizes = {}
+        if isinstance(batch.get("max_size"), list):
+            max_sizes = {r["TABLESPACE_NAME"]: r["MAX_SIZE_GB"] for r in batch["max_size"]}
         if isinstance(result, list) and result:
             # Convert MB to GB and add calculated columns
             normalized_result = []
@@ -1648,16 +2310,37 @@ def tool_check_tablespaces() -> str:
                     else:
                         normalized_row[key_upper] = value
                 
+                if normalized_row.get('TABLESPACE_NAME') in max_sizes:
+                    normalized_row['MAX_SIZE_GB'] = max_sizes[normalized_row['TABLESPACE_NAME']]
+                
                 # Keep original columns too for reference
                 normalized_result.append(normalized_row)
             
+            # Growth trend from AWR history (warehouse-backed; the table still renders without it)
+            forecast = []
+            try:
+                fc = forecast_tablespace_growth(db)
+                forecast = fc.astype(object).where(fc.notna(), None).to_dict("records")
+            except Exception as e:
+                print(f"[DEBUG] Tablespace forecast unavailable: {e}")
+            by_name = {f["TABLESPACE_NAME"]: f for f in forecast}
+            for row in normalized_result:
+                f = by_name.get(row.get('TABLESPACE_NAME'))
+                if f:
+                    row['GROWTH_GB_PER_DAY'] = f['GROWTH_GB_PER_DAY']
+                    row['DAYS_TO_FULL'] = f['DAYS_TO_FULL']
+                    row['FULL_BY'] = f['FULL_BY']
+            
             ts_id = str(uuid.uuid4())
             st.session_state["artifacts"][ts_id] = {
                 "type": "TABLESPACE_STATUS",
                 "data": normalized_result,
+                "forecast": forecast,
                 "timestamp": datetime.now().strftime("%H:%M:%S")
             }
-            return f"Tablespace status retrieved ({len(normalized_result)} tablespaces). ::ARTIFACT_TABLESPACE:{ts_id}::"
+            at_risk = [f for f in forecast if f["DAYS_TO_FULL"] is not None and f["DAYS_TO_FULL"] <= TBSPC_FORECAST_ALERT_DAYS]
+            note = f" {len(at_risk)} projected to fill within {TBSPC_FORECAST_ALERT_DAYS} days." if at_risk else ""
+            return f"Tablespace status retrieved ({len(normalized_result)} tablespaces).{note} ::ARTIFACT_TABLESPACE:{ts_id}::"
         return "No tablespace data available."
     except Exception as e:
         return f"Error checking tablespaces: {handle_oracle_error(e)}"
@@ -1697,16 +2380,30 @@ def tool_check_tablespaces() -> str:
 # 8. NEW DBA FEATURES - REAL-TIME METRICS
 # ============================================================================
 
+METRICS_QUERY_TIMEOUT = int(os.getenv("METRICS_QUERY_TIMEOUT", "30"))  # seconds per metrics statement
+
 def get_realtime_metrics_data(db: str) -> dict:
     """Helper function to get real-time metrics data (CPU/IO/Memory and top SQLs) - used by health check"""
     current_utilization = {}
-    top_sql_cpu = []
-    top_sql_io = []
-    top_sql_memory = []
-    
-    # Get CPU Utilization
+
+    # Top SQL for the last 5 minutes comes from the local ASH sampler (no ASH scan here).
     try:
-        sql_cpu_util = """
+        ash_sql = ash_breakdown(db, by="sql", seconds=300, top_n=None)
+    except Exception as e:
+        print(f"[DEBUG] ASH sampler unavailable for {db}: {e}")
+        ash_sql = pd.DataFrame()
+    ash_top = {}
+    if not ash_sql.empty:
+        for key, column in (("cpu", "CPU_SAMPLES"), ("io", "IO_REQUESTS"), ("mem", "MAX_PGA_MB")):
+            top = ash_sql[ash_sql[column] > 0].nlargest(10, column)
+            if not top.empty:
+                ash_top[key] = top
+
+    # All canned statements (including the V$OSSTAT / V$SQLSTATS fallbacks) go out as
+    # one batch, so the collector costs a single round trip when pipelining is available.
+    # SQL text comes from the SQL metadata cache afterwards, not from V$SQL joins.
+    statements = {
+        "cpu": """
         SELECT 
             'Current CPU Utilization' as METRIC_NAME,
             ROUND(VALUE, 2) as VALUE,
@@ -1724,34 +2421,21 @@ def get_realtime_metrics_data(db: str) -> dict:
            AND (METRIC_NAME LIKE '%Usage%' OR METRIC_NAME LIKE '%Utilization%')
            AND GROUP_ID = 2
         FETCH FIRST 1 ROWS ONLY
-        """
-        result_cpu = run_oracle_query(sql_cpu_util, db)
-        if isinstance(result_cpu, list) and result_cpu:
-            current_utilization['CPU'] = result_cpu[0]
-    except:
-        try:
-            sql_cpu_os = """
+        """,
+        "cpu_os": """
+        SELECT 
+            'Current CPU Utilization' as METRIC_NAME,
+            ROUND((BUSY_TIME / (BUSY_TIME + IDLE_TIME)) * 100, 2) as VALUE,
+            '%' as UNIT
+        FROM (
             SELECT 
-                'Current CPU Utilization' as METRIC_NAME,
-                ROUND((BUSY_TIME / (BUSY_TIME + IDLE_TIME)) * 100, 2) as VALUE,
-                '%' as UNIT
-            FROM (
-                SELECT 
-                    SUM(CASE WHEN STAT_NAME = 'BUSY_TIME' THEN VALUE ELSE 0 END) as BUSY_TIME,
-                    SUM(CASE WHEN STAT_NAME = 'IDLE_TIME' THEN VALUE ELSE 0 END) as IDLE_TIME
-                FROM V$OSSTAT
-                WHERE STAT_NAME IN ('BUSY_TIME', 'IDLE_TIME')
-            )
-            """
-            result_cpu_os = run_oracle_query(sql_cpu_os, db)
-            if isinstance(result_cpu_os, list) and result_cpu_os:
-                current_utilization['CPU'] = result_cpu_os[0]
-        except:
-            pass
-    
-    # Get I/O Utilization
-    try:
-        sql_io_util = """
+                SUM(CASE WHEN STAT_NAME = 'BUSY_TIME' THEN VALUE ELSE 0 END) as BUSY_TIME,
+                SUM(CASE WHEN STAT_NAME = 'IDLE_TIME' THEN VALUE ELSE 0 END) as IDLE_TIME
+            FROM V$OSSTAT
+            WHERE STAT_NAME IN ('BUSY_TIME', 'IDLE_TIME')
+        )
+        """,
+        "io": """
         SELECT 
             'Current I/O Operations/sec' as METRIC_NAME,
             ROUND(VALUE, 2) as VALUE,
@@ -1761,16 +2445,8 @@ def get_realtime_metrics_data(db: str) -> dict:
            AND GROUP_ID = 2
         ORDER BY VALUE DESC
         FETCH FIRST 1 ROWS ONLY
-        """
-        result_io = run_oracle_query(sql_io_util, db)
-        if isinstance(result_io, list) and result_io:
-            current_utilization['IO'] = result_io[0]
-    except:
-        pass
-    
-    # Get Memory Utilization
-    try:
-        sql_mem_util = """
+        """,
+        "memory": """
         SELECT 
             'SGA Actual Size' AS memory_type,
             ROUND(SUM(value) / 1024 / 1024 / 1024, 2) AS size_gb
@@ -1788,9 +2464,69 @@ def get_realtime_metrics_data(db: str) -> dict:
                     (SELECT value FROM v$pgastat WHERE name = 'total PGA allocated') ) 
                   / 1024 / 1024 / 1024, 2)
         FROM DUAL
-        """
-        result_mem = run_oracle_query(sql_mem_util, db)
-        if isinstance(result_mem, list) and result_mem:
+        """,
+        "sql_cpu_stats": """
+        SELECT 
+            'SQL_CPU' as METRIC_TYPE,
+            SQL_ID,
+            ROUND(CPU_TIME/1000000, 2) as VALUE,
+            'seconds (recent)' as UNIT,
+            EXECUTIONS,
+            ROUND(CPU_TIME/1000000/NULLIF(EXECUTIONS, 0), 4) as AVG_CPU_PER_EXEC
+        FROM V$SQLSTATS
+        WHERE CPU_TIME > 0
+        ORDER BY CPU_TIME DESC
+        FETCH FIRST 10 ROWS ONLY
+        """,
+        "sql_io_stats": """
+        SELECT 
+            'SQL_IO' as METRIC_TYPE,
+            SQL_ID,
+            ROUND(DISK_READS + BUFFER_GETS, 0) as VALUE,
+            'blocks (recent)' as UNIT,
+            EXECUTIONS,
+            ROUND((DISK_READS + BUFFER_GETS)/NULLIF(EXECUTIONS, 0), 2) as AVG_BLOCKS_PER_EXEC
+        FROM V$SQLSTATS
+        WHERE (DISK_READS + BUFFER_GETS) > 0
+        ORDER BY (DISK_READS + BUFFER_GETS) DESC
+        FETCH FIRST 10 ROWS ONLY
+        """,
+        "sql_mem_stats": """
+        SELECT 
+            'SQL_MEMORY' as METRIC_TYPE,
+            SQL_ID,
+            ROUND(BUFFER_GETS/1000000, 2) as VALUE,
+            'M blocks (recent)' as UNIT,
+            EXECUTIONS,
+            ROUND(BUFFER_GETS/1000000/NULLIF(EXECUTIONS, 0), 4) as AVG_MBLOCKS_PER_EXEC
+        FROM V$SQLSTATS
+        WHERE BUFFER_GETS > 0
+        ORDER BY BUFFER_GETS DESC
+        FETCH FIRST 10 ROWS ONLY
+        """,
+    }
+    # Cumulative V$SQLSTATS fallbacks only where the sampler had nothing
+    for key in ash_top:
+        statements.pop(f"sql_{key}_stats")
+    results = run_oracle_batch(statements, db, default_timeout=METRICS_QUERY_TIMEOUT)
+
+    def _rows(key):
+        data = results.get(key)
+        return data if isinstance(data, list) and data else []
+
+    # CPU Utilization (V$OSSTAT busy/idle when V$SYSMETRIC has nothing)
+    cpu_rows = _rows("cpu") or _rows("cpu_os")
+    if cpu_rows:
+        current_utilization['CPU'] = cpu_rows[0]
+
+    # I/O Utilization
+    if _rows("io"):
+        current_utilization['IO'] = _rows("io")[0]
+
+    # Memory Utilization
+    try:
+        result_mem = _rows("memory")
+        if result_mem:
             sga_actual = 0
             pga_allocated = 0
             total_memory = 0
@@ -1813,170 +2549,42 @@ def get_realtime_metrics_data(db: str) -> dict:
             }
     except:
         pass
-    
-    # Get Top SQL by CPU
-    try:
-        sql_cpu_ash = """
-        SELECT 
-            'SQL_CPU' as METRIC_TYPE,
-            SQL_ID,
-            ROUND(SUM(CPU_TIME_DELTA)/1000000, 2) as VALUE,
-            'seconds (last 5 min)' as UNIT,
-            COUNT(*) as EXECUTIONS,
-            ROUND(SUM(CPU_TIME_DELTA)/1000000/NULLIF(COUNT(*), 0), 4) as AVG_CPU_PER_EXEC,
-            SUBSTR(MAX(SQL_TEXT), 1, 50) as SQL_TEXT_PREVIEW
-        FROM (
-            SELECT 
-                ash.SQL_ID,
-                ash.CPU_TIME_DELTA,
-                SUBSTR(q.SQL_TEXT, 1, 50) as SQL_TEXT
-            FROM V$ACTIVE_SESSION_HISTORY ash
-            LEFT JOIN V$SQL q ON ash.SQL_ID = q.SQL_ID
-            WHERE ash.SAMPLE_TIME > SYSDATE - 5/1440
-              AND ash.SQL_ID IS NOT NULL
-              AND ash.CPU_TIME_DELTA > 0
-        )
-        GROUP BY SQL_ID
-        ORDER BY VALUE DESC
-        FETCH FIRST 10 ROWS ONLY
-        """
-        result_cpu = run_oracle_query(sql_cpu_ash, db)
-        if isinstance(result_cpu, list) and result_cpu:
-            top_sql_cpu = result_cpu
-        else:
-            sql_cpu_stats = """
-            SELECT 
-                'SQL_CPU' as METRIC_TYPE,
-                SQL_ID,
-                ROUND(CPU_TIME/1000000, 2) as VALUE,
-                'seconds (recent)' as UNIT,
-                EXECUTIONS,
-                ROUND(CPU_TIME/1000000/NULLIF(EXECUTIONS, 0), 4) as AVG_CPU_PER_EXEC,
-                SUBSTR(SQL_TEXT, 1, 50) as SQL_TEXT_PREVIEW
-            FROM (
-                SELECT s.SQL_ID, s.CPU_TIME, s.EXECUTIONS, q.SQL_TEXT
-                FROM V$SQLSTATS s
-                LEFT JOIN V$SQL q ON s.SQL_ID = q.SQL_ID
-                WHERE s.CPU_TIME > 0
-                ORDER BY s.CPU_TIME DESC
-                FETCH FIRST 10 ROWS ONLY
-            )
-            """
-            result_cpu = run_oracle_query(sql_cpu_stats, db)
-            if isinstance(result_cpu, list) and result_cpu:
-                top_sql_cpu = result_cpu
-    except:
-        pass
-    
-    # Get Top SQL by I/O
-    try:
-        sql_io_ash = """
-        SELECT 
-            'SQL_IO' as METRIC_TYPE,
-            SQL_ID,
-            ROUND(SUM(DISK_READS_DELTA + BUFFER_GETS_DELTA), 0) as VALUE,
-            'blocks (last 5 min)' as UNIT,
-            COUNT(*) as EXECUTIONS,
-            ROUND(SUM(DISK_READS_DELTA + BUFFER_GETS_DELTA)/NULLIF(COUNT(*), 0), 2) as AVG_BLOCKS_PER_EXEC,
-            SUBSTR(MAX(SQL_TEXT), 1, 50) as SQL_TEXT_PREVIEW
-        FROM (
-            SELECT 
-                ash.SQL_ID,
-                ash.DISK_READS_DELTA,
-                ash.BUFFER_GETS_DELTA,
-                SUBSTR(q.SQL_TEXT, 1, 50) as SQL_TEXT
-            FROM V$ACTIVE_SESSION_HISTORY ash
-            LEFT JOIN V$SQL q ON ash.SQL_ID = q.SQL_ID
-            WHERE ash.SAMPLE_TIME > SYSDATE - 5/1440
-              AND ash.SQL_ID IS NOT NULL
-              AND (ash.DISK_READS_DELTA > 0 OR ash.BUFFER_GETS_DELTA > 0)
-        )
-        GROUP BY SQL_ID
-        ORDER BY VALUE DESC
-        FETCH FIRST 10 ROWS ONLY
-        """
-        result_io = run_oracle_query(sql_io_ash, db)
-        if isinstance(result_io, list) and result_io:
-            top_sql_io = result_io
-        else:
-            sql_io_stats = """
-            SELECT 
-                'SQL_IO' as METRIC_TYPE,
-                SQL_ID,
-                ROUND(DISK_READS + BUFFER_GETS, 0) as VALUE,
-                'blocks (recent)' as UNIT,
-                EXECUTIONS,
-                ROUND((DISK_READS + BUFFER_GETS)/NULLIF(EXECUTIONS, 0), 2) as AVG_BLOCKS_PER_EXEC,
-                SUBSTR(SQL_TEXT, 1, 50) as SQL_TEXT_PREVIEW
-            FROM (
-                SELECT s.SQL_ID, s.DISK_READS, s.BUFFER_GETS, s.EXECUTIONS, q.SQL_TEXT
-                FROM V$SQLSTATS s
-                LEFT JOIN V$SQL q ON s.SQL_ID = q.SQL_ID
-                WHERE (s.DISK_READS + s.BUFFER_GETS) > 0
-                ORDER BY (s.DISK_READS + s.BUFFER_GETS) DESC
-                FETCH FIRST 10 ROWS ONLY
-            )
-            """
-            result_io = run_oracle_query(sql_io_stats, db)
-            if isinstance(result_io, list) and result_io:
-                top_sql_io = result_io
-    except:
-        pass
-    
-    # Get Top SQL by Memory
+
+    # Top SQL by CPU / I/O / Memory: ASH sampler (last 5 min) first, cumulative V$SQLSTATS otherwise.
+    # Text for every SQL_ID on any of the lists is resolved with one cached lookup.
+    top_ids = {sql_id for top in ash_top.values() for sql_id in top["SQL_ID"]}
+    top_ids.update(r["SQL_ID"] for key in ("cpu", "io", "mem") for r in _rows(f"sql_{key}_stats"))
     try:
-        sql_mem_ash = """
-        SELECT 
-            'SQL_MEMORY' as METRIC_TYPE,
-            SQL_ID,
-            ROUND(SUM(BUFFER_GETS_DELTA)/1000000, 2) as VALUE,
-            'M blocks (last 5 min)' as UNIT,
-            COUNT(*) as EXECUTIONS,
-            ROUND(SUM(BUFFER_GETS_DELTA)/1000000/NULLIF(COUNT(*), 0), 4) as AVG_MBLOCKS_PER_EXEC,
-            SUBSTR(MAX(SQL_TEXT), 1, 50) as SQL_TEXT_PREVIEW
-        FROM (
-            SELECT 
-                ash.SQL_ID,
-                ash.BUFFER_GETS_DELTA,
-                SUBSTR(q.SQL_TEXT, 1, 50) as SQL_TEXT
-            FROM V$ACTIVE_SESSION_HISTORY ash
-            LEFT JOIN V$SQL q ON ash.SQL_ID = q.SQL_ID
-            WHERE ash.SAMPLE_TIME > SYSDATE - 5/1440
-              AND ash.SQL_ID IS NOT NULL
-              AND ash.BUFFER_GETS_DELTA > 0
-        )
-        GROUP BY SQL_ID
-        ORDER BY VALUE DESC
-        FETCH FIRST 10 ROWS ONLY
-        """
-        result_mem = run_oracle_query(sql_mem_ash, db)
-        if isinstance(result_mem, list) and result_mem:
-            top_sql_memory = result_mem
-        else:
-            sql_mem_stats = """
-            SELECT 
-                'SQL_MEMORY' as METRIC_TYPE,
-                SQL_ID,
-                ROUND(BUFFER_GETS/1000000, 2) as VALUE,
-                'M blocks (recent)' as UNIT,
-                EXECUTIONS,
-                ROUND(BUFFER_GETS/1000000/NULLIF(EXECUTIONS, 0), 4) as AVG_MBLOCKS_PER_EXEC,
-                SUBSTR(SQL_TEXT, 1, 50) as SQL_TEXT_PREVIEW
-            FROM (
-                SELECT s.SQL_ID, s.BUFFER_GETS, s.EXECUTIONS, q.SQL_TEXT
-                FROM V$SQLSTATS s
-                LEFT JOIN V$SQL q ON s.SQL_ID = q.SQL_ID
-                WHERE s.BUFFER_GETS > 0
-                ORDER BY s.BUFFER_GETS DESC
-                FETCH FIRST 10 ROWS ONLY
-            )
-            """
-            result_mem = run_oracle_query(sql_mem_stats, db)
-            if isinstance(result_mem, list) and result_mem:
-                top_sql_memory = result_mem
-    except:
-        pass
-    
+        sql_meta = lookup_sql_metadata(sorted(top_ids), db)
+    except Exception as e:
+        print(f"[DEBUG] SQL metadata lookup failed on {db}: {e}")
+        sql_meta = {}
+    texts = {sql_id: (m["SQL_TEXT"] or "")[:50] or None for sql_id, m in sql_meta.items()}
+    for key in ("cpu", "io", "mem"):
+        for r in _rows(f"sql_{key}_stats"):
+            r["SQL_TEXT_PREVIEW"] = texts.get(r["SQL_ID"])
+
+    def _ash_rows(key, metric_type, unit, value_col, avg_col):
+        top = ash_top.get(key)
+        if top is None:
+            return []
+        return [{
+            'METRIC_TYPE': metric_type,
+            'SQL_ID': r["SQL_ID"],
+            'VALUE': round(float(r[value_col]), 2),
+            'UNIT': unit,
+            'EXECUTIONS': int(r["EXECUTIONS"]),
+            avg_col: round(float(r[value_col]) / r["EXECUTIONS"], 4) if r["EXECUTIONS"] else None,
+            'SQL_TEXT_PREVIEW': texts.get(r["SQL_ID"]),
+        } for _, r in top.iterrows()]
+
+    top_sql_cpu = _ash_rows("cpu", "SQL_CPU", "seconds on CPU (last 5 min, ASH)", "CPU_SAMPLES", "AVG_CPU_PER_EXEC") \
+        or _rows("sql_cpu_stats")
+    top_sql_io = _ash_rows("io", "SQL_IO", "I/O requests (last 5 min, ASH)", "IO_REQUESTS", "AVG_IO_REQUESTS_PER_EXEC") \
+        or _rows("sql_io_stats")
+    top_sql_memory = _ash_rows("mem", "SQL_MEMORY", "MB PGA peak (last 5 min, ASH)", "MAX_PGA_MB", "AVG_PGA_MB_PER_EXEC") \
+        or _rows("sql_mem_stats")
+
     return {
         'current_utilization': current_utilization,
         'top_sql_cpu': top_sql_cpu,
@@ -1984,100 +2592,105 @@ def get_realtime_metrics_data(db: str) -> dict:
         'top_sql_memory': top_sql_memory
     }
 
-def get_historical_metrics(db: str, days: int = 30) -> dict:
-    """Get historical metrics for last N days (CPU, I/O, Memory, AAS) from AWR snapshots"""
+LIVE_REFRESH_OPTIONS = [5, 10, 15, 30, 60]  # seconds
+LIVE_WINDOW_MINUTES = int(os.getenv("LIVE_WINDOW_MINUTES", "30"))
+
+def render_live_dashboard(db: str):
+    """Body of the Performance tab's live view; runs as a fragment so only this block reruns."""
     try:
-        # Single comprehensive query for CPU, I/O, Memory, and AAS - grouped by hour
-        sql = f"""
-        SELECT 
-            TO_CHAR(TRUNC(s.end_interval_time, 'HH'), 'YYYY-MM-DD HH24:MI') AS snap_time,
-            -- 1. CPU (Average across all nodes, per hour)
-            ROUND(AVG(sys.cpu_util), 2) AS avg_cluster_cpu_pct,
-            -- 2. AAS (Sum of all work across the cluster, per hour)
-            ROUND(AVG(sys.aas), 2) AS total_cluster_aas,
-            -- 3. I/O (Total Throughput: Reads + Writes, per hour)
-            ROUND(AVG(sys.phys_reads + sys.phys_writes) / 1024 / 1024, 2) AS total_io_mb_sec,
-            -- 4. Memory (SGA + PGA Combined, per hour)
-            ROUND(AVG(mem.total_pga + mem.total_sga) / 1024 / 1024 / 1024, 2) AS total_db_memory_gb,
-            -- Breakdown of Memory (Optional, for reference)
-            ROUND(AVG(mem.total_sga) / 1024 / 1024 / 1024, 2) AS sga_gb,
-            ROUND(AVG(mem.total_pga) / 1024 / 1024 / 1024, 2) AS pga_gb
-        FROM dba_hist_snapshot s
-        -- JOIN METRICS (CPU, I/O, AAS)
-        JOIN (
-            SELECT 
-                snap_id, dbid, instance_number,
-                MAX(CASE WHEN metric_name = 'Host CPU Utilization (%)' THEN average END) AS cpu_util,
-                MAX(CASE WHEN metric_name = 'Average Active Sessions' THEN average END) AS aas,
-                MAX(CASE WHEN metric_name = 'Physical Read Total Bytes Per Sec' THEN average END) AS phys_reads,
-                MAX(CASE WHEN metric_name = 'Physical Write Total Bytes Per Sec' THEN average END) AS phys_writes
-            FROM dba_hist_sysmetric_summary
-            WHERE metric_name IN ('Host CPU Utilization (%)', 'Average Active Sessions', 
-                                  'Physical Read Total Bytes Per Sec', 'Physical Write Total Bytes Per Sec')
-            GROUP BY snap_id, dbid, instance_number
-        ) sys ON s.snap_id = sys.snap_id AND s.dbid = sys.dbid AND s.instance_number = sys.instance_number
-        -- JOIN MEMORY (SGA + PGA)
-        LEFT JOIN (
-            SELECT 
-                snap_id, dbid, instance_number,
-                -- Get PGA
-                (SELECT MAX(value) FROM dba_hist_pgastat p 
-                 WHERE p.snap_id = main.snap_id AND p.dbid = main.dbid 
-                 AND p.instance_number = main.instance_number 
-                 AND p.name = 'total PGA allocated') AS total_pga,
-                -- Get SGA (Sum of components)
-                (SELECT SUM(value) FROM dba_hist_sga g 
-                 WHERE g.snap_id = main.snap_id AND g.dbid = main.dbid 
-                 AND g.instance_number = main.instance_number) AS total_sga
-            FROM dba_hist_snapshot main
-            GROUP BY snap_id, dbid, instance_number
-        ) mem ON s.snap_id = mem.snap_id AND s.dbid = mem.dbid AND s.instance_number = mem.instance_number
-        WHERE s.end_interval_time >= SYSDATE - {days}
-        GROUP BY TRUNC(s.end_interval_time, 'HH')
-        ORDER BY TRUNC(s.end_interval_time, 'HH') ASC
-        """
-        
-        # Execute query
-        result = run_oracle_query(sql, db)
-        
-        if isinstance(result, list) and result:
-            # Parse the results into separate series for each metric
-            cpu_data = []
-            aas_data = []
-            io_data = []
-            memory_data = []
-            
-            for row in result:
-                timestamp = row.get('SNAP_TIME', row.get('snap_time', ''))
-                cpu_data.append({
-                    'timestamp': timestamp,
-                    'cpu_utilization': row.get('AVG_CLUSTER_CPU_PCT', row.get('avg_cluster_cpu_pct', 0))
-                })
-                aas_data.append({
-                    'timestamp': timestamp,
-                    'aas': row.get('TOTAL_CLUSTER_AAS', row.get('total_cluster_aas', 0))
-                })
-                io_data.append({
-                    'timestamp': timestamp,
-                    'io_operations': row.get('TOTAL_IO_MB_SEC', row.get('total_io_mb_sec', 0))
-                })
-                memory_data.append({
-                    'timestamp': timestamp,
-                    'memory_gb': row.get('TOTAL_DB_MEMORY_GB', row.get('total_db_memory_gb', 0)),
-                    'sga_gb': row.get('SGA_GB', row.get('sga_gb', 0)),
-                    'pga_gb': row.get('PGA_GB', row.get('pga_gb', 0))
-                })
-            
-            return {
-                'cpu': cpu_data,
-                'aas': aas_data,
-                'io': io_data,
-                'memory': memory_data
-            }
-        else:
-            return {'cpu': [], 'aas': [], 'io': [], 'memory': [], 'error': 'No data returned'}
+        point = sample_live_metrics(db)
     except Exception as e:
-        return {'cpu': [], 'aas': [], 'io': [], 'memory': [], 'error': str(e)}
+        st.error(f"Live metrics unavailable: {e}")
+        return
+    df_live = live_metrics_frame(db, minutes=LIVE_WINDOW_MINUTES)
+    previous = df_live.iloc[-2] if len(df_live) > 1 else None
+
+    def _metric(col, label, column, fmt="{:.2f}"):
+        value = point.get(column)
+        delta = None
+        if value is not None and previous is not None and pd.notna(previous.get(column)):
+            delta = fmt.format(value - previous[column])
+        col.metric(label, fmt.format(value) if value is not None else "N/A", delta, delta_color="inverse")
+
+    c1, c2, c3, c4, c5, c6 = st.columns(6)
+    _metric(c1, "Host CPU %", "HOST_CPU_PCT", "{:.1f}")
+    _metric(c2, "AAS (DB time/s)", "DB_TIME_PER_SEC")
+    _metric(c3, "DB CPU/s", "DB_CPU_PER_SEC")
+    _metric(c4, "Executions/s", "EXECS_PER_SEC", "{:,.0f}")
+    _metric(c5, "Read MB/s", "READ_MB_PER_SEC", "{:,.1f}")
+    _metric(c6, "Write MB/s", "WRITE_MB_PER_SEC", "{:,.1f}")
+    st.caption(f"Sampled {point['SAMPLE_TIME']:%H:%M:%S} (database time) · per-second rates from counter deltas between samples")
+
+    if df_live.empty:
+        st.info("Collecting samples... rates appear after the second refresh.")
+        return
+    chart_col1, chart_col2 = st.columns(2)
+    with chart_col1:
+        st.markdown("**Load (average active sessions)**")
+        st.line_chart(df_live[[c for c in ("DB_TIME_PER_SEC", "DB_CPU_PER_SEC") if c in df_live.columns]], height=220)
+    with chart_col2:
+        st.markdown("**Wait classes (sessions waiting)**")
+        wait_cols = [c for c in df_live.columns if c.startswith("WAIT_")]
+        if wait_cols:
+            st.area_chart(df_live[wait_cols], height=220)
+    chart_col3, chart_col4 = st.columns(2)
+    with chart_col3:
+        st.markdown("**Throughput**")
+        st.line_chart(df_live[[c for c in ("EXECS_PER_SEC", "USER_CALLS_PER_SEC", "COMMITS_PER_SEC") if c in df_live.columns]], height=220)
+    with chart_col4:
+        st.markdown("**I/O (MB/s)**")
+        st.line_chart(df_live[[c for c in ("READ_MB_PER_SEC", "WRITE_MB_PER_SEC", "REDO_MB_PER_SEC") if c in df_live.columns]], height=220)
+
+def get_historical_metrics(db: str, days: int = 30, granularity: str = "hour") -> dict:
+    """Get historical metrics for last N days (CPU, I/O, Memory, AAS) from the local AWR metrics warehouse"""
+    try:
+        # Incremental sync (new snap_ids only), then hourly/daily rollups served from SQLite
+        df = load_metric_history(db, days=days, granularity=granularity)
+        if df.empty:
+            return {'metrics': df, 'error': 'No data returned'}
+        scores, windows = detect_metric_anomalies(df, granularity=granularity)
+        return {'metrics': df, 'scores': scores, 'windows': windows}
+    except Exception as e:
+        return {'metrics': pd.DataFrame(), 'error': str(e)}
+
+def render_plan_regressions(df: pd.DataFrame):
+    """Summary metrics plus the ranked regression table (shared by the chat artifact and the Performance tab)"""
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Regressed SQL", len(df))
+    col2.metric("Extra DB Time", f"{df['EXTRA_DB_TIME_S'].sum():,.0f}s")
+    col3.metric("Worst Elapsed Ratio", f"{df['ELAPSED_RATIO'].max():.1f}x")
+    st.dataframe(df, width='stretch', hide_index=True)
+
+def anomaly_chart(df_hist: pd.DataFrame, scores: pd.DataFrame, windows: pd.DataFrame, column: str):
+    """Metric line with its seasonal baseline (dashed), anomalous buckets (red) and top windows (shaded)"""
+    frame = df_hist[["SNAP_TIME", column]].merge(
+        scores[["SNAP_TIME", f"{column}_BASELINE", f"{column}_SCORE", f"{column}_ANOMALY"]], on="SNAP_TIME", how="left"
+    )
+    base = alt.Chart(frame).encode(x=alt.X("SNAP_TIME:T", title=None))
+    layers = [
+        base.mark_line().encode(y=alt.Y(f"{column}:Q", title=None)),
+        base.mark_line(strokeDash=[4, 4], color="gray").encode(y=f"{column}_BASELINE:Q"),
+        base.transform_filter(alt.datum[f"{column}_ANOMALY"]).mark_point(color="red", filled=True, size=60).encode(
+            y=f"{column}:Q",
+            tooltip=[alt.Tooltip("SNAP_TIME:T", format="%Y-%m-%d %H:%M"), f"{column}:Q", f"{column}_BASELINE:Q", f"{column}_SCORE:Q"],
+        ),
+    ]
+    hits = windows[windows["METRICS"].str.contains(column, regex=False)] if not windows.empty else windows
+    if not hits.empty:
+        layers.insert(0, alt.Chart(hits).mark_rect(color="red", opacity=0.12).encode(x="START:T", x2="END:T"))
+    return alt.layer(*layers).properties(height=280)
+
+def open_report_for_window(start: str, end: str, kind: str):
+    """Generates an AWR/ASH report for an anomaly window and posts it to the chat (download/analyze buttons live there)"""
+    prompt = f"Generate an {kind} report from {start} to {end}."
+    with st.spinner(f"Generating {kind} report for {start} → {end}..."):
+        result = tool_performance_report(start_time=start, end_time=end, report_kind=kind)
+    st.session_state["messages"].append({"role": "user", "content": prompt})
+    st.session_state["messages"].append({"role": "assistant", "content": result})
+    if result.startswith("SUCCESS"):
+        st.success(f"✅ {kind} report generated. Open the chat tab to download or analyze it.")
+    else:
+        st.error(result)
 
 def get_sql_id_performance(sql_id: str, time_range: str, db: str) -> dict:
     """Get historical performance metrics for a specific SQL ID"""
@@ -2094,9 +2707,9 @@ def get_sql_id_performance(sql_id: str, time_range: str, db: str) -> dict:
         days = time_map.get(time_range, 30)
         
         # Query for SQL performance from AWR history
-        sql = f"""
+        sql = """
         SELECT 
-            TO_CHAR(s.begin_interval_time, 'YYYY-MM-DD HH24:MI') AS start_time,
+            s.begin_interval_time AS start_time,
             h.instance_number AS inst_id,
             h.plan_hash_value,
             h.executions_delta AS execs,
@@ -2118,90 +2731,48 @@ def get_sql_id_performance(sql_id: str, time_range: str, db: str) -> dict:
             AND h.dbid = s.dbid 
             AND h.instance_number = s.instance_number
         WHERE 
-            UPPER(h.sql_id) = UPPER('{sql_id}')
-            AND s.begin_interval_time >= SYSDATE - {days}
+            h.sql_id = :sql_id
+            AND s.begin_interval_time >= SYSDATE - :days
             AND h.executions_delta > 0
         ORDER BY 
             s.begin_interval_time DESC, h.instance_number
         """
         
-        result = run_oracle_query(sql, db)
-        
-        # Check if result is an error dict
-        if isinstance(result, dict) and "error" in result:
+        # SQL_IDs are lower-case base32, so an exact bind keeps the sql_id predicate indexable
+        try:
+            result = fetch_oracle_dataframe(sql, db, params={"sql_id": sql_id.strip().lower(), "days": days})
+        except Exception as e:
             return {
                 'sql_id': sql_id,
                 'status': 'error',
-                'error': result.get('error', 'Unknown error'),
-                'message': f'Error querying SQL ID {sql_id}: {result.get("error", "Unknown error")}'
+                'error': str(e),
+                'message': f'Error querying SQL ID {sql_id}: {e}'
             }
         
-        # Check if result is a valid list with data
-        if isinstance(result, list):
-            if result:
-                # Get execution plan info - try multiple sources
+        if isinstance(result, pd.DataFrame):
+            if not result.empty:
+                # Get execution plan info
                 sql_text = 'N/A'
                 plan_hash = 'N/A'
                 
-                # Try 1: dba_hist_sqltext (AWR historical data)
-                plan_sql = f"""
-                SELECT DISTINCT
-                    plan_hash_value,
-                    SUBSTR(sql_text, 1, 500) AS sql_text
-                FROM dba_hist_sqltext
-                WHERE UPPER(sql_id) = UPPER('{sql_id}')
-                FETCH FIRST 1 ROWS ONLY
-                """
-                plan_result = run_oracle_query(plan_sql, db)
-                
-                # Check if result is valid (not an error dict)
-                if isinstance(plan_result, list) and plan_result:
-                    sql_text = plan_result[0].get('SQL_TEXT', plan_result[0].get('sql_text', 'N/A'))
-                    plan_hash = plan_result[0].get('PLAN_HASH_VALUE', plan_result[0].get('plan_hash_value', 'N/A'))
-                
-                # Try 2: v$sqlarea (current shared pool - for recent SQL IDs)
-                if (sql_text == 'N/A' or plan_hash == 'N/A'):
-                    plan_sql_vsql = f"""
-                    SELECT DISTINCT
-                        plan_hash_value,
-                        SUBSTR(sql_text, 1, 500) AS sql_text
-                    FROM v$sqlarea
-                    WHERE UPPER(sql_id) = UPPER('{sql_id}')
-                    AND ROWNUM = 1
-                    """
-                    plan_result_vsql = run_oracle_query(plan_sql_vsql, db)
-                    
-                    # Check if result is valid (not an error dict)
-                    if isinstance(plan_result_vsql, list) and plan_result_vsql:
-                        if sql_text == 'N/A':
-                            sql_text = plan_result_vsql[0].get('SQL_TEXT', plan_result_vsql[0].get('sql_text', 'N/A'))
-                        if plan_hash == 'N/A':
-                            plan_hash = plan_result_vsql[0].get('PLAN_HASH_VALUE', plan_result_vsql[0].get('plan_hash_value', 'N/A'))
-                
-                # Try 3: v$sql (alternative view)
-                if (sql_text == 'N/A' or plan_hash == 'N/A'):
-                    plan_sql_vsql2 = f"""
-                    SELECT DISTINCT
-                        plan_hash_value,
-                        SUBSTR(sql_text, 1, 500) AS sql_text
-                    FROM v$sql
-                    WHERE UPPER(sql_id) = UPPER('{sql_id}')
-                    AND ROWNUM = 1
-                    """
-                    plan_result_vsql2 = run_oracle_query(plan_sql_vsql2, db)
-                    
-                    # Check if result is valid (not an error dict)
-                    if isinstance(plan_result_vsql2, list) and plan_result_vsql2:
-                        if sql_text == 'N/A':
-                            sql_text = plan_result_vsql2[0].get('SQL_TEXT', plan_result_vsql2[0].get('sql_text', 'N/A'))
-                        if plan_hash == 'N/A':
-                            plan_hash = plan_result_vsql2[0].get('PLAN_HASH_VALUE', plan_result_vsql2[0].get('plan_hash_value', 'N/A'))
+                # Text, plan hashes, module and schema from the cached SQL metadata lookup
+                # (shared pool + AWR resolved in one batch, then served locally)
+                key = sql_id.strip().lower()
+                try:
+                    meta = lookup_sql_metadata([key], db).get(key) or {}
+                except Exception as e:
+                    print(f"[DEBUG] SQL metadata lookup failed for {sql_id}: {e}")
+                    meta = {}
+                if meta.get("SQL_TEXT"):
+                    sql_text = meta["SQL_TEXT"]
+                if meta.get("PLAN_HASH_VALUES"):
+                    plan_hash = ", ".join(str(p) for p in meta["PLAN_HASH_VALUES"])
                 
-                # Try 4: Get plan_hash from the performance data if available
-                if plan_hash == 'N/A' and result:
+                # Fallback: plan_hash from the performance data if available
+                if plan_hash == 'N/A' and not result.empty:
                     # Check if plan_hash_value is in the performance data
                     # Try multiple column name variations
-                    first_row = result[0]
+                    first_row = result.iloc[0]
                     plan_hash_from_data = (
                         first_row.get('PLAN_HASH_VALUE') or 
                         first_row.get('plan_hash_value') or
@@ -2215,6 +2786,8 @@ def get_sql_id_performance(sql_id: str, time_range: str, db: str) -> dict:
                     'sql_id': sql_id,
                     'sql_text': sql_text,
                     'plan_hash_value': plan_hash,
+                    'module': meta.get("MODULE"),
+                    'parsing_schema': meta.get("PARSING_SCHEMA_NAME"),
                     'performance_data': result,
                     'status': 'success'
                 }
@@ -2246,13 +2819,29 @@ def get_table_sql_history(table_name: str, time_range: str, db: str) -> dict:
         }
         days = time_map.get(time_range, 30)
         
-        # Normalize table name to uppercase for case-insensitive search
-        table_name_upper = table_name.upper().strip()
+        # SQL_IDs come from the local table -> SQL index (DBA_HIST_SQL_PLAN object
+        # references), so the AWR query below is an exact SQL_ID lookup, not a CLOB scan
+        sql_ids = find_table_sql_ids(table_name, db)
+        if not sql_ids:
+            return {
+                'table_name': table_name,
+                'time_range': time_range,
+                'status': 'not_found',
+                'message': f'No captured execution plans reference table {table_name}. Verify the table name (optionally as OWNER.TABLE).'
+            }
+        
+        # IN-lists of at most 1000 binds each, OR-ed together
+        binds = {f"id{i}": sql_id for i, sql_id in enumerate(sql_ids)}
+        names = list(binds)
+        in_lists = " OR ".join(
+            f"h.sql_id IN ({', '.join(':' + n for n in names[k:k + 1000])})" for k in range(0, len(names), 1000)
+        )
+        binds["days"] = days
         
         # Query for table usage from AWR history
         sql = f"""
         SELECT
-            t.sql_id,
+            h.sql_id,
             -- Aggregated Stats
             SUM(h.executions_delta) AS total_execs,
             ROUND(SUM(h.elapsed_time_delta) / 1000000, 2) AS total_elapsed_sec,
@@ -2264,28 +2853,29 @@ def get_table_sql_history(table_name: str, time_range: str, db: str) -> dict:
             -- Memory Metric (Logical I/O)
             ROUND(SUM(h.buffer_gets_delta) / NULLIF(SUM(h.executions_delta), 0), 2) AS avg_buffer_gets,
             MIN(TO_CHAR(s.begin_interval_time, 'YYYY-MM-DD')) as first_seen,
-            MAX(TO_CHAR(s.begin_interval_time, 'YYYY-MM-DD')) as last_seen,
-            -- Preview of the SQL Text (Using MAX to avoid GROUP BY CLOB error)
-            MAX(DBMS_LOB.SUBSTR(t.sql_text, 100, 1)) AS sql_text_preview
+            MAX(TO_CHAR(s.begin_interval_time, 'YYYY-MM-DD')) as last_seen
         FROM
-            dba_hist_sqltext t
-        JOIN
-            dba_hist_sqlstat h ON t.sql_id = h.sql_id AND t.dbid = h.dbid
+            dba_hist_sqlstat h
         JOIN
             dba_hist_snapshot s ON h.snap_id = s.snap_id
             AND h.dbid = s.dbid
             AND h.instance_number = s.instance_number
         WHERE
-            UPPER(DBMS_LOB.SUBSTR(t.sql_text, 4000, 1)) LIKE '%{table_name_upper}%'
-            AND s.begin_interval_time >= SYSDATE - {days}
+            ({in_lists})
+            AND s.begin_interval_time >= SYSDATE - :days
             AND h.executions_delta > 0
         GROUP BY
-            t.sql_id
+            h.sql_id
         ORDER BY
             total_elapsed_sec DESC
         """
         
-        result = run_oracle_query(sql, db)
+        result = run_oracle_query(sql, db, params=binds)
+        if isinstance(result, list) and result:
+            # Text preview from the SQL metadata cache (one batched lookup)
+            meta = lookup_sql_metadata([r["SQL_ID"] for r in result], db)
+            for r in result:
+                r["SQL_TEXT_PREVIEW"] = (meta.get(r["SQL_ID"], {}).get("SQL_TEXT") or "")[:100] or None
         
         # Check if result is an error dict
         if isinstance(result, dict) and "error" in result:
@@ -2339,7 +2929,7 @@ def get_top_heavily_used_tables(time_range: str, db: str) -> dict:
         
         # Query to find top tables by I/O and access patterns
         # Exclude default Oracle schemas
-        sql = f"""
+        sql = """
         SELECT 
             obj.owner,
             obj.object_name AS table_name,
@@ -2356,7 +2946,7 @@ def get_top_heavily_used_tables(time_range: str, db: str) -> dict:
         JOIN dba_hist_seg_stat_obj obj ON seg.obj# = obj.obj# 
             AND seg.dataobj# = obj.dataobj#
             AND seg.dbid = obj.dbid
-        WHERE s.end_interval_time >= SYSDATE - {days}
+        WHERE s.end_interval_time >= SYSDATE - :days
           AND obj.owner IS NOT NULL
           AND obj.object_name IS NOT NULL
           AND seg.logical_reads_delta > 0
@@ -2375,9 +2965,9 @@ def get_top_heavily_used_tables(time_range: str, db: str) -> dict:
         FETCH FIRST 10 ROWS ONLY
         """
         
-        result = run_oracle_query(sql, db)
+        result = fetch_oracle_dataframe(sql, db, params={"days": days})
         
-        if isinstance(result, list) and result:
+        if not result.empty:
             return {
                 'time_range': time_range,
                 'tables': result,
@@ -2558,11 +3148,14 @@ You are an Oracle DBA and Jenkins Admin assistant.
   - **IMPORTANT:** If the user says "I want to compare AWR reports" or "compare AWR reports" but hasn't provided time information yet, you MUST ask them: "Please provide the baseline period (start time and end time) and target period (start time and end time) for the AWR comparison. Format: YYYY-MM-DD HH:MM:SS (e.g., Baseline: 2024-01-15 10:00:00 to 2024-01-15 11:00:00, Target: 2024-01-15 14:00:00 to 2024-01-15 15:00:00)." Then immediately reply "TERMINATE" - do NOT wait for a response or call any tools. The UI will handle collecting the time inputs.
   - Requires: `baseline_start_time`, `baseline_end_time`, `target_start_time`, `target_end_time` (format: YYYY-MM-DD HH:MM:SS).
   - After generating the comparison, "TERMINATE".
+- **Plan Regressions:** Use `scan_plan_regressions` (optional `days`, default 7) to find SQL that got slower after a plan change, ranked by extra DB time. After showing results, "TERMINATE".
 - **Analysis:** If user asks questions about the report ("why is cpu high?", "analyze it"), use `analyze_report`. After analysis, "TERMINATE".
 - **Health:** Use `health_check`. After showing results, "TERMINATE".
 - **Sessions:** Use `list_sessions` to see active sessions, `kill_session` to terminate problematic ones. After showing results, "TERMINATE".
+- **Blocking:** For locks, hangs or "who is blocking", use `blocking_chains` (root blockers, chain depth and deadlock cycles across all instances). Suggest `kill_session` only for the root blocker. After showing results, "TERMINATE".
 - **Tablespaces:** Use `check_tablespaces` to monitor space usage. After showing results, "TERMINATE".
 - **Health Check:** The `health_check` tool now includes real-time CPU/IO/Memory utilization and top SQLs. Use it for comprehensive database health assessment.
+- **Fleet Health:** Use `fleet_health_check` to sweep every configured database at once (optional `databases` as a comma-separated list). After showing results, "TERMINATE".
 - **Jenkins Tools:**
   - Use `search_jenkins` to find jobs by name. When it returns `::ARTIFACT_JENKINS::`, reply "TERMINATE" immediately.
   - Use `get_build_info` to get detailed information about a build (job_name, optional build_number).
@@ -2633,13 +3226,16 @@ register_function(tool_compare_builds, caller=oracle_admin, executor=user_proxy,
 register_function(tool_get_job_config, caller=oracle_admin, executor=user_proxy, name="get_job_config", description="Get the configuration XML for a Jenkins job. Provide job_name")
 register_function(tool_get_build_artifacts, caller=oracle_admin, executor=user_proxy, name="get_build_artifacts", description="List artifacts produced by a Jenkins build. Provide job_name and optional build_number (defaults to latest)")
 register_function(tool_run_health_check, caller=oracle_admin, executor=user_proxy, name="health_check", description="Run Health Check")
+register_function(tool_run_fleet_health_check, caller=oracle_admin, executor=user_proxy, name="fleet_health_check", description="Run health checks and real-time metrics across all configured databases in parallel. Optional databases as comma-separated names")
 register_function(tool_performance_report, caller=oracle_admin, executor=user_proxy, name="generate_performance_report", description="Generates AWR/ASH")
 register_function(tool_analyze_report_content, caller=oracle_admin, executor=user_proxy, name="analyze_report", description="Analyze last report")
 register_function(tool_analyze_health_report, caller=oracle_admin, executor=user_proxy, name="analyze_health_report", description="Analyze last health report")
 register_function(tool_download_patch_wrapper, caller=oracle_admin, executor=user_proxy, name="download_patch", description="Download Oracle Patches")
 register_function(tool_list_active_sessions, caller=oracle_admin, executor=user_proxy, name="list_sessions", description="List active sessions")
+register_function(tool_blocking_chains, caller=oracle_admin, executor=user_proxy, name="blocking_chains", description="Show blocking chains: root blockers, waiters per root and deadlock cycles across RAC instances")
 register_function(tool_kill_session, caller=oracle_admin, executor=user_proxy, name="kill_session", description="Kill session (requires confirmation)")
 register_function(tool_check_tablespaces, caller=oracle_admin, executor=user_proxy, name="check_tablespaces", description="Check tablespace usage")
+register_function(tool_scan_plan_regressions, caller=oracle_admin, executor=user_proxy, name="scan_plan_regressions", description="Scan AWR SQL stats for plan changes that degraded elapsed/CPU/buffer gets per execution over the last N days (default 7)")
 register_function(tool_compare_awr_reports, caller=oracle_admin, executor=user_proxy, name="compare_awr_reports", description="Compare AWR reports for baseline and target time periods. Requires baseline_start_time, baseline_end_time, target_start_time, target_end_time (format: YYYY-MM-DD HH:MM:SS) with detailed LLM analysis")
 register_function(tool_save_query, caller=oracle_admin, executor=user_proxy, name="save_query", description="Save SQL query")
 
@@ -3263,6 +3859,15 @@ with st.sidebar:
         st.session_state["_processing"] = True
         st.rerun()
     
+    if st.button("🌐 Fleet Health Sweep", width='stretch', key="btn_fleet_health_check"):
+        st.session_state["messages"].append({
+            "role": "user", 
+            "content": "Run a fleet-wide health check across all configured databases."
+        })
+        st.session_state["_pending_user_input"] = "Run a fleet-wide health check across all configured databases."
+        st.session_state["_processing"] = True
+        st.rerun()
+    
     if st.button("💾 Check Tablespaces", width='stretch', key="btn_check_tablespaces"):
         st.session_state["messages"].append({
             "role": "user", 
@@ -3281,6 +3886,15 @@ with st.sidebar:
         st.session_state["_processing"] = True
         st.rerun()
     
+    if st.button("🔗 Blocking Chains", width='stretch', key="btn_blocking_chains"):
+        st.session_state["messages"].append({
+            "role": "user", 
+            "content": "Show the current blocking chains."
+        })
+        st.session_state["_pending_user_input"] = "Show the current blocking chains."
+        st.session_state["_processing"] = True
+        st.rerun()
+    
     # Generate Performance Report - send prompt to chat
     if st.button("📊 Generate Performance Report", width='stretch'):
         # Send a message to chat asking for inputs - be explicit
@@ -3935,7 +4549,7 @@ with tab1:
                                                             st.success(f"Job #{b_num} Succeeded!")
                                                         elif res_status == "FAILURE":
                                                             st.error(f"Job #{b_num} Failed.")
-                                                            console = server.get_build_console_output(selected_job, b_num)
+                                                            console, _ = read_console_tail(server, selected_job, b_num, max_lines=120, until_error=True)
                                                             st.code(console[-500:])
                                                             with st.spinner("Analyzing Failure..."):
                                                                 analysis = analyze_jenkins_failure(console)
@@ -4127,6 +4741,35 @@ with tab1:
                                     del st.session_state["artifacts"][art_id]
                                     st.rerun()
                 
+                elif "::ARTIFACT_FLEET:" in content:
+                    match = re.search(r"::ARTIFACT_FLEET:(.*?)::", content)
+                    display_text = content.replace(match.group(0), "") if match else content
+                    st.markdown(display_text)
+                    
+                    if match:
+                        art_id = match.group(1)
+                        artifact = st.session_state["artifacts"].get(art_id)
+                        if artifact:
+                            with st.expander(f"🌐 Fleet Health Matrix ({artifact['timestamp']})", expanded=True):
+                                st.dataframe(fleet_matrix_frame(artifact["rows"]), width='stretch', hide_index=True)
+                                st.caption("✅ healthy · ⚠️ rows returned (review) · ❌ check failed")
+                                
+                                for row in sorted(artifact["rows"], key=lambda r: r["DATABASE"]):
+                                    if row.get("ERROR"):
+                                        st.error(f"**{row['DATABASE']}** ({row['STATUS']}): {row['ERROR']}")
+                                    elif row.get("findings"):
+                                        with st.expander(f"🔎 {row['DATABASE']} - {len(row['findings'])} checks with findings", expanded=False):
+                                            for title, data in row["findings"].items():
+                                                st.markdown(f"**{title}**")
+                                                if isinstance(data, list) and data and isinstance(data[0], dict):
+                                                    st.dataframe(pd.DataFrame(data), width='stretch', hide_index=True)
+                                                else:
+                                                    st.write(data)
+                                
+                                if st.button("Close Matrix", key=f"close_fleet_{i}"):
+                                    del st.session_state["artifacts"][art_id]
+                                    st.rerun()
+                
                 elif "::ARTIFACT_COMPARE:" in content:
                     match = re.search(r"::ARTIFACT_COMPARE:(.*?)::", content)
                     display_text = content.replace(match.group(0), "") if match else content
@@ -4137,6 +4780,14 @@ with tab1:
                         artifact = st.session_state["artifacts"].get(art_id)
                         if artifact:
                             with st.expander(f"📊 {artifact['title']}", expanded=True):
+                                diff_df = artifact.get("diff")
+                                if diff_df is not None and not diff_df.empty:
+                                    flagged = diff_df[diff_df["REGRESSION"]]
+                                    st.markdown(f"**🔴 Flagged regressions: {len(flagged)}** (computed from the reports, not by the LLM)")
+                                    if not flagged.empty:
+                                        st.dataframe(flagged.drop(columns=["REGRESSION"]), width='stretch', hide_index=True)
+                                    with st.expander("All deltas"):
+                                        st.dataframe(diff_df, width='stretch', hide_index=True)
                                 st.markdown(artifact["content"])
                                 
                                 # Add Q&A section for asking questions about the comparison report
@@ -4161,6 +4812,21 @@ with tab1:
                                     del st.session_state["artifacts"][art_id]
                                     st.rerun()
                 
+                elif "::ARTIFACT_PLAN_REGRESSION:" in content:
+                    match = re.search(r"::ARTIFACT_PLAN_REGRESSION:(.*?)::", content)
+                    display_text = content.replace(match.group(0), "") if match else content
+                    st.markdown(display_text)
+                    
+                    if match:
+                        art_id = match.group(1)
+                        artifact = st.session_state["artifacts"].get(art_id)
+                        if artifact:
+                            with st.expander(f"🔀 Plan Regressions - last {artifact['days']} days ({artifact['timestamp']})", expanded=True):
+                                render_plan_regressions(artifact["data"])
+                                if st.button("Close", key=f"close_planreg_{i}"):
+                                    del st.session_state["artifacts"][art_id]
+                                    st.rerun()
+                
                 elif "::ARTIFACT_PATCH:" in content:
                     match = re.search(r"::ARTIFACT_PATCH:(.*?)::", content)
                     display_text = content.replace(match.group(0), "") if match else content
@@ -4289,6 +4955,12 @@ with tab1:
                                 df = pd.DataFrame(artifact["data"])
                                 st.dataframe(df, width='stretch', hide_index=True)
                                 
+                                at_risk = [f for f in artifact.get("forecast", [])
+                                           if f["DAYS_TO_FULL"] is not None and f["DAYS_TO_FULL"] <= TBSPC_FORECAST_ALERT_DAYS]
+                                if at_risk:
+                                    st.warning(f"📈 {len(at_risk)} tablespace(s) projected to reach their max size within {TBSPC_FORECAST_ALERT_DAYS} days")
+                                    st.dataframe(pd.DataFrame(at_risk), width='stretch', hide_index=True)
+                                
                                 # Add summary metrics
                                 if len(df) > 0:
                                     col1, col2, col3 = st.columns(3)
@@ -4403,14 +5075,14 @@ with tab1:
                             # Display Top SQL by I/O
                             if sql_metrics.get("IO"):
                                 st.subheader("💾 Top SQL by I/O Consumption (Real-Time)")
-                                st.caption("Values are from the last 5 minutes (real-time activity). Check AVG_BLOCKS_PER_EXEC for per-execution average.")
+                                st.caption("Values are from the last 5 minutes (real-time activity). The AVG_*_PER_EXEC column is the per-execution average.")
                                 df_io = pd.DataFrame(sql_metrics["IO"])
                                 st.dataframe(df_io, width='stretch')
                             
                             # Display Top SQL by Memory
                             if sql_metrics.get("MEMORY"):
-                                st.subheader("🧠 Top SQL by Memory (Buffer Gets) - Real-Time")
-                                st.caption("Values are from the last 5 minutes (real-time activity). Check AVG_MBLOCKS_PER_EXEC for per-execution average.")
+                                st.subheader("🧠 Top SQL by Memory - Real-Time")
+                                st.caption("Values are from the last 5 minutes (real-time activity). The AVG_*_PER_EXEC column is the per-execution average.")
                                 df_mem = pd.DataFrame(sql_metrics["MEMORY"])
                                 st.dataframe(df_mem, width='stretch')
                 
@@ -4481,6 +5153,50 @@ with tab1:
                                 st.metric("Memory Utilization", "N/A")
                                 st.caption("Data not available")
                 
+                elif "::ARTIFACT_BLOCKING:" in content:
+                    match = re.search(r"::ARTIFACT_BLOCKING:(.*?)::", content)
+                    display_text = content.replace(match.group(0), "") if match else content
+                    st.markdown(display_text)
+                    
+                    if match:
+                        art_id = match.group(1)
+                        artifact = st.session_state["artifacts"].get(art_id)
+                        if artifact:
+                            tree = artifact["data"]
+                            with st.expander(f"🔗 Blocking Chains ({artifact['timestamp']})", expanded=True):
+                                col1, col2, col3, col4 = st.columns(4)
+                                col1.metric("Root Blockers", len(tree["roots"]))
+                                col2.metric("Blocked Sessions", tree["blocked_sessions"])
+                                col3.metric("Max Chain Depth", tree["max_depth"])
+                                col4.metric("Deadlock Cycles", len(tree["cycles"]))
+                                for cycle in tree["cycles"]:
+                                    st.error(f"Deadlock cycle: {' → '.join(cycle + cycle[:1])}")
+                                
+                                st.markdown("**Root blockers**")
+                                st.dataframe(pd.DataFrame(tree["roots"]), width='stretch', hide_index=True)
+                                
+                                # Indented tree, one block per root (sessions are listed as inst:sid)
+                                for root in tree["roots"]:
+                                    lines = []
+                                    for node in tree["tree"]:
+                                        if node["ROOT"] != root["SESSION"]:
+                                            continue
+                                        label = f"{node['SESSION']} {node.get('USERNAME') or node.get('STATUS') or ''}".rstrip()
+                                        detail = f"{node.get('EVENT') or ''} {node.get('SQL_ID') or ''}".strip()
+                                        wait = f" {node['SECONDS_IN_WAIT']}s" if node["DEPTH"] and node.get("SECONDS_IN_WAIT") is not None else ""
+                                        waiters = f" [{node['WAITERS']} waiting]" if node["WAITERS"] else ""
+                                        cycle = " ⟲" if node["IN_CYCLE"] else ""
+                                        lines.append(f"{'    ' * node['DEPTH']}{'└─ ' if node['DEPTH'] else ''}{label}{waiters}{cycle} {detail}{wait}".rstrip())
+                                    st.code("\n".join(lines), language=None)
+                                
+                                with st.expander("All sessions in chains", expanded=False):
+                                    st.dataframe(pd.DataFrame(tree["tree"]), width='stretch', hide_index=True)
+                                st.caption(f"{tree['sessions_scanned']} sessions scanned in one GV$SESSION snapshot at {tree['captured_at']}")
+                                
+                                if st.button("Close", key=f"close_blocking_{i}"):
+                                    del st.session_state["artifacts"][art_id]
+                                    st.rerun()
+                
                 elif "::ARTIFACT_KILL:" in content:
                     match = re.search(r"::ARTIFACT_KILL:(.*?)::", content)
                     display_text = content.replace(match.group(0), "") if match else content
@@ -4636,6 +5352,12 @@ with tab1:
                             if artifact.get("is_question"):
                                 with st.container(border=True):
                                     st.markdown(analysis_text)
+                            elif artifact.get("sections"):
+                                # Exact numbers from the parsed report, LLM findings below
+                                render_awr_sections(artifact["sections"])
+                                st.markdown("### 💡 Findings & Recommendations")
+                                with st.container(border=True):
+                                    st.markdown(analysis_text)
                             else:
                                 # Parse structured analysis (Load Profile, Top SQLs, Wait Events, Recommendations)
                                 import re as re_module
@@ -5303,6 +6025,19 @@ with tab2:
     
     db = st.session_state["current_db"]
     
+    # Live view: refreshed as a fragment (run_every), so the rest of the script does not rerun
+    st.subheader("📡 Live View")
+    live_col1, live_col2 = st.columns([1, 3])
+    with live_col1:
+        live_enabled = st.toggle("Auto-refresh", key="perf_live_enabled")
+    with live_col2:
+        live_interval = st.select_slider(
+            "Refresh every (seconds)", options=LIVE_REFRESH_OPTIONS, value=10, key="perf_live_interval"
+        )
+    if live_enabled:
+        st.fragment(run_every=live_interval)(render_live_dashboard)(db)
+    st.markdown("---")
+    
     # Time range selector
     time_range_options = {
         '24 hours': 1,
@@ -5326,11 +6061,14 @@ with tab2:
         key="perf_time_range"
     )
     days_selected = time_range_options[selected_time_range]
+    resolution = st.radio("Resolution", ["Hourly", "Daily"], horizontal=True, key="perf_resolution")
     
     # Load metrics button
     if st.button("🔄 Load Metrics", type="primary"):
         with st.spinner(f"Fetching historical metrics for last {selected_time_range}..."):
-            historical_data = get_historical_metrics(db, days=days_selected)
+            historical_data = get_historical_metrics(
+                db, days=days_selected, granularity="day" if resolution == "Daily" else "hour"
+            )
             
             if historical_data.get('error'):
                 st.error(f"Error loading historical data: {historical_data['error']}")
@@ -5348,84 +6086,54 @@ with tab2:
         
         hist_data = st.session_state.get("historical_metrics")
         if hist_data:
-            # CPU Utilization Graph
-            if hist_data.get('cpu') and len(hist_data['cpu']) > 0:
-                st.subheader("🔥 CPU Utilization Over Time (%)")
-                df_cpu = pd.DataFrame(hist_data['cpu'])
-                # Handle both uppercase and lowercase column names
-                timestamp_col = 'timestamp' if 'timestamp' in df_cpu.columns else 'TIMESTAMP'
-                cpu_col = 'cpu_utilization' if 'cpu_utilization' in df_cpu.columns else 'CPU_UTILIZATION'
-                if timestamp_col in df_cpu.columns and cpu_col in df_cpu.columns:
-                    df_cpu[timestamp_col] = pd.to_datetime(df_cpu[timestamp_col], format='%Y-%m-%d %H:%M', errors='coerce')
-                    df_cpu = df_cpu.sort_values(timestamp_col)
-                    # Format index to show only date and time (no day name)
-                    df_cpu_indexed = df_cpu.set_index(timestamp_col)
-                    df_cpu_indexed.index = df_cpu_indexed.index.strftime('%Y-%m-%d %H:%M')
-                    st.line_chart(df_cpu_indexed[cpu_col], width='stretch')
-                else:
-                    st.dataframe(df_cpu)
-            else:
-                st.info(f"No CPU utilization data available for the last {st.session_state.get('perf_time_range_selected', selected_time_range)}.")
-            
-            st.markdown("---")
+            # Rollups from the local metrics warehouse; SNAP_TIME is already datetime64
+            df_hist = hist_data.get('metrics')
+            if df_hist is None:
+                df_hist = pd.DataFrame()
+            if not df_hist.empty:
+                df_hist = df_hist.set_index('SNAP_TIME')
+            range_label = st.session_state.get('perf_time_range_selected', selected_time_range)
             
-            # AAS (Average Active Sessions) Graph
-            if hist_data.get('aas') and len(hist_data['aas']) > 0:
-                st.subheader("⚡ Average Active Sessions (AAS) Over Time")
-                df_aas = pd.DataFrame(hist_data['aas'])
-                timestamp_col = 'timestamp' if 'timestamp' in df_aas.columns else 'TIMESTAMP'
-                aas_col = 'aas' if 'aas' in df_aas.columns else 'AAS'
-                if timestamp_col in df_aas.columns and aas_col in df_aas.columns:
-                    df_aas[timestamp_col] = pd.to_datetime(df_aas[timestamp_col], format='%Y-%m-%d %H:%M', errors='coerce')
-                    df_aas = df_aas.sort_values(timestamp_col)
-                    # Format index to show only date and time (no day name)
-                    df_aas_indexed = df_aas.set_index(timestamp_col)
-                    df_aas_indexed.index = df_aas_indexed.index.strftime('%Y-%m-%d %H:%M')
-                    st.line_chart(df_aas_indexed[aas_col], width='stretch')
-                else:
-                    st.dataframe(df_aas)
-            else:
-                st.info(f"No AAS data available for the last {st.session_state.get('perf_time_range_selected', selected_time_range)}.")
-            
-            st.markdown("---")
-            
-            # I/O Utilization Graph
-            if hist_data.get('io') and len(hist_data['io']) > 0:
-                st.subheader("💾 I/O Throughput Over Time (MB/sec)")
-                df_io = pd.DataFrame(hist_data['io'])
-                timestamp_col = 'timestamp' if 'timestamp' in df_io.columns else 'TIMESTAMP'
-                io_col = 'io_operations' if 'io_operations' in df_io.columns else 'IO_OPERATIONS'
-                if timestamp_col in df_io.columns and io_col in df_io.columns:
-                    df_io[timestamp_col] = pd.to_datetime(df_io[timestamp_col], format='%Y-%m-%d %H:%M', errors='coerce')
-                    df_io = df_io.sort_values(timestamp_col)
-                    # Format index to show only date and time (no day name)
-                    df_io_indexed = df_io.set_index(timestamp_col)
-                    df_io_indexed.index = df_io_indexed.index.strftime('%Y-%m-%d %H:%M')
-                    st.line_chart(df_io_indexed[io_col], width='stretch')
-                else:
-                    st.dataframe(df_io)
-            else:
-                st.info(f"No I/O operations data available for the last {st.session_state.get('perf_time_range_selected', selected_time_range)}.")
+            chart_specs = [
+                ("🔥 CPU Utilization Over Time (%)", 'AVG_CLUSTER_CPU_PCT', "CPU utilization"),
+                ("⚡ Average Active Sessions (AAS) Over Time", 'TOTAL_CLUSTER_AAS', "AAS"),
+                ("💾 I/O Throughput Over Time (MB/sec)", 'TOTAL_IO_MB_SEC', "I/O operations"),
+                ("🧠 Memory Usage Over Time (GB)", 'TOTAL_DB_MEMORY_GB', "memory usage"),
+            ]
+            scores = hist_data.get('scores')
+            windows = hist_data.get('windows')
+            if windows is None:
+                windows = pd.DataFrame(columns=["START", "END", "PEAK_SCORE", "METRICS", "POINTS"])
             
-            st.markdown("---")
+            # Top anomalous windows (seasonal hour-of-week baseline), each one click away from a report
+            if not windows.empty:
+                st.subheader("🚨 Top Anomalous Windows")
+                st.caption("Scored against the same hour of the week; open a report for the window directly.")
+                for w_idx, w in windows.iterrows():
+                    w_start = w["START"].strftime("%Y-%m-%d %H:%M:%S")
+                    w_end = w["END"].strftime("%Y-%m-%d %H:%M:%S")
+                    col_w, col_awr, col_ash = st.columns([4, 1, 1])
+                    with col_w:
+                        st.markdown(f"**{w_start} → {w_end}** · peak score {w['PEAK_SCORE']} · {w['METRICS']}")
+                    with col_awr:
+                        if st.button("📄 AWR", key=f"anomaly_awr_{w_idx}"):
+                            open_report_for_window(w_start, w_end, "AWR")
+                    with col_ash:
+                        if st.button("📄 ASH", key=f"anomaly_ash_{w_idx}"):
+                            open_report_for_window(w_start, w_end, "ASH")
+                st.markdown("---")
             
-            # Memory Utilization Graph
-            if hist_data.get('memory') and len(hist_data['memory']) > 0:
-                st.subheader("🧠 Memory Usage Over Time (GB)")
-                df_mem = pd.DataFrame(hist_data['memory'])
-                timestamp_col = 'timestamp' if 'timestamp' in df_mem.columns else 'TIMESTAMP'
-                mem_col = 'memory_gb' if 'memory_gb' in df_mem.columns else 'MEMORY_GB'
-                if timestamp_col in df_mem.columns and mem_col in df_mem.columns:
-                    df_mem[timestamp_col] = pd.to_datetime(df_mem[timestamp_col], format='%Y-%m-%d %H:%M', errors='coerce')
-                    df_mem = df_mem.sort_values(timestamp_col)
-                    # Format index to show only date and time (no day name)
-                    df_mem_indexed = df_mem.set_index(timestamp_col)
-                    df_mem_indexed.index = df_mem_indexed.index.strftime('%Y-%m-%d %H:%M')
-                    st.line_chart(df_mem_indexed[mem_col], width='stretch')
+            for idx, (title, column, label) in enumerate(chart_specs):
+                if idx:
+                    st.markdown("---")
+                if column in df_hist.columns and df_hist[column].notna().any():
+                    st.subheader(title)
+                    if scores is not None and f"{column}_SCORE" in scores.columns:
+                        st.altair_chart(anomaly_chart(df_hist.reset_index(), scores, windows, column), width='stretch')
+                    else:
+                        st.line_chart(df_hist[column], width='stretch')
                 else:
-                    st.dataframe(df_mem)
-            else:
-                st.info(f"No memory usage data available for the last {st.session_state.get('perf_time_range_selected', selected_time_range)}.")
+                    st.info(f"No {label} data available for the last {range_label}.")
     
     st.markdown("---")
     
@@ -5485,25 +6193,52 @@ with tab2:
         if sql_perf.get('status') == 'success':
             with st.expander(f"📊 SQL ID: {sql_perf['sql_id']} - Performance Details", expanded=True):
                 st.write(f"**Plan Hash Value:** {sql_perf.get('plan_hash_value', 'N/A')}")
+                if sql_perf.get('parsing_schema') or sql_perf.get('module'):
+                    st.write(f"**Schema / Module:** {sql_perf.get('parsing_schema') or 'N/A'} / {sql_perf.get('module') or 'N/A'}")
                 st.write(f"**SQL Text:**")
                 st.code(sql_perf.get('sql_text', 'N/A'), language='sql')
                 
-                if sql_perf.get('performance_data'):
-                    df_sql = pd.DataFrame(sql_perf['performance_data'])
+                df_sql = sql_perf.get('performance_data')
+                if df_sql is not None and not df_sql.empty:
                     st.dataframe(df_sql, width='stretch', hide_index=True)
                     
-                    # Performance trends
-                    if 'START_TIME' in df_sql.columns or 'start_time' in df_sql.columns:
-                        time_col = 'START_TIME' if 'START_TIME' in df_sql.columns else 'start_time'
-                        elapsed_col = 'TOTAL_ELAPSED_SEC' if 'TOTAL_ELAPSED_SEC' in df_sql.columns else 'total_elapsed_sec'
-                        if elapsed_col not in df_sql.columns:
-                            elapsed_col = 'AVG_ELAPSED_SEC' if 'AVG_ELAPSED_SEC' in df_sql.columns else 'avg_elapsed_sec'
-                        cpu_col = 'AVG_CPU_SEC' if 'AVG_CPU_SEC' in df_sql.columns else 'avg_cpu_sec'
-                        
-                        if elapsed_col in df_sql.columns:
-                            df_sql[time_col] = pd.to_datetime(df_sql[time_col], format='%Y-%m-%d %H:%M', errors='coerce')
-                            df_sql = df_sql.sort_values(time_col)
-                            st.line_chart(df_sql.set_index(time_col)[elapsed_col], width='stretch')
+                    # Performance trends (START_TIME is datetime64 from the columnar fetch)
+                    if 'START_TIME' in df_sql.columns and 'TOTAL_ELAPSED_SEC' in df_sql.columns:
+                        trend = df_sql.groupby('START_TIME')['TOTAL_ELAPSED_SEC'].sum().sort_index()
+                        st.line_chart(trend, width='stretch')
+    
+    st.markdown("---")
+    
+    # Plan Regression Scanner Section
+    st.subheader("🔀 Plan Regressions")
+    col_pr1, col_pr2 = st.columns([2, 1])
+    with col_pr1:
+        st.caption("SQL whose latest plan is slower per execution than its best earlier plan, ranked by extra DB time")
+    with col_pr2:
+        plan_reg_range = st.selectbox(
+            "Time Range",
+            options=['24 hours', '3 days', '7 days', '1 month'],
+            index=2,
+            key="plan_reg_time_range"
+        )
+    
+    if st.button("🔀 Scan for Plan Regressions", key="scan_plan_regressions"):
+        with st.spinner(f"Scanning AWR SQL statistics for the last {plan_reg_range}..."):
+            try:
+                st.session_state["plan_reg_data"] = {
+                    "time_range": plan_reg_range,
+                    "data": scan_plan_regressions(db, days=time_range_options[plan_reg_range]),
+                }
+            except Exception as e:
+                st.error(f"Error scanning plan regressions: {handle_oracle_error(e)}")
+    
+    if st.session_state.get("plan_reg_data"):
+        plan_reg = st.session_state["plan_reg_data"]
+        with st.expander(f"🔀 Plan Regressions (Last {plan_reg['time_range']})", expanded=True):
+            if plan_reg["data"].empty:
+                st.success("✅ No plan regressions found.")
+            else:
+                render_plan_regressions(plan_reg["data"])
     
     st.markdown("---")
     
@@ -5516,7 +6251,7 @@ with tab2:
             "Enter Table Name",
             placeholder="e.g., EMPLOYEES",
             key="table_name_input",
-            help="Enter a table name to find all SQLs that used it"
+            help="Enter a table name (optionally OWNER.TABLE) to find all SQLs whose plans used it"
         )
     with col_tbl2:
         table_time_range = st.selectbox(
@@ -5599,8 +6334,8 @@ with tab2:
         top_tables_result = st.session_state["top_tables_data"]
         if top_tables_result.get('status') == 'success':
             with st.expander(f"📊 Top 10 Heavily Used Tables (Last {top_tables_result.get('time_range', 'N/A')})", expanded=True):
-                if top_tables_result.get('tables'):
-                    df_top_tables = pd.DataFrame(top_tables_result['tables'])
+                df_top_tables = top_tables_result.get('tables')
+                if df_top_tables is not None and not df_top_tables.empty:
                     st.dataframe(df_top_tables, width='stretch', hide_index=True)
     
     st.markdown("---")
@@ -5628,9 +6363,41 @@ with tab3:
                         try:
                             sql_query_clean = sql_query.strip().rstrip(";")
                             audit_log("SQL_QUERY", db, {"sql_hash": hashlib.md5(sql_query_clean.encode()).hexdigest()[:8], "query_preview": sql_query_clean[:100]})
-                            result = run_oracle_query(sql_query_clean, db)
+                            if is_select_statement(sql_query_clean):
+                                # Stream rows into a CSV spool on disk; only the preview stays in memory
+                                spool_fd, spool_path = tempfile.mkstemp(suffix=".csv")
+                                try:
+                                    with os.fdopen(spool_fd, "w", newline="", encoding="utf-8") as spool:
+                                        cols, total, preview, complete = write_query_csv(
+                                            sql_query_clean, spool, db, preview_rows=SQL_EXPLORER_PREVIEW_ROWS,
+                                            max_bytes=SQL_EXPLORER_CSV_MAX_MB * 1024 * 1024
+                                        )
+                                    
+                                    if total:
+                                        st.success(f"✅ Query executed successfully. Returned {total:,}{'' if complete else '+'} rows.")
+                                        if not complete:
+                                            st.warning(f"Result stopped at {total:,} rows, the {SQL_EXPLORER_CSV_MAX_MB} MB CSV limit; narrow the query (or spool it server-side) for a full export.")
+                                        elif total > len(preview):
+                                            st.caption(f"Showing the first {len(preview):,} rows; the CSV download contains all {total:,}.")
+                                        st.dataframe(pd.DataFrame.from_records(preview, columns=cols), width='stretch', height=400)
+                                        with open(spool_path, "rb") as csv_file:
+                                            st.download_button(
+                                                label="📥 Download as CSV",
+                                                data=csv_file,
+                                                file_name=f"query_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                                                mime="text/csv"
+                                            )
+                                    else:
+                                        st.info("Query executed successfully. No rows returned.")
+                                finally:
+                                    os.remove(spool_path)
+                                result = None
+                            else:
+                                result = run_oracle_query(sql_query_clean, db)
                             
-                            if isinstance(result, list):
+                            if result is None:
+                                pass
+                            elif isinstance(result, list):
                                 if result:
                                     df = pd.DataFrame(result)
                                     st.success(f"✅ Query executed successfully. Returned {len(df)} rows.")
@@ -2,13 +2,40 @@
 import oracledb
 import json
 import os
+import csv
+import gzip
+import hashlib
+import re
+import sqlite3
+import threading
+import asyncio
+import bisect
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from autogen import AssistantAgent
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from bs4 import BeautifulSoup
 
+# Optional: Arrow-backed DataFrame fetch (python-oracledb 3.x fetch_df_all)
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Optional: fast AWR/ASH HTML parsing (falls back to BeautifulSoup)
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
 load_dotenv()
 os.environ["REQUESTS_CA_BUNDLE"] = r"C:\Users\omkarav\Downloads\Amdocs RSA Root CA.crt"
 os.environ["SSL_CERT_FILE"] = r"C:\Users\omkarav\Downloads\Amdocs RSA Root CA.crt"
@@ -150,71 +177,1099 @@ def get_db_list():
     """Returns list of available DB names."""
     return list(DB_CONFIG.keys())
 
-def run_oracle_query(sql: str, db: str = "DEFAULT"):
+# ==========================================
+# CONNECTION POOLS
+# ==========================================
+# One python-oracledb pool per DB_CONFIG entry. Sessions are created once and
+# reused across queries, so the timezone setup below runs per session, not per query.
+ORACLE_CLIENT_LIB_DIR = os.getenv(
+    "ORACLE_CLIENT_LIB_DIR",
+    r"C:\Users\omkarav\Downloads\instantclient-basiclite-windows.x64-19.28.0.0.0dbru\instantclient_19_28",
+)
+# Thin mode (no Instant Client) is required for round-trip pipelining, see run_oracle_batch
+ORACLE_THIN_MODE = os.getenv("ORACLE_THIN_MODE", "false").lower() in ("1", "true", "yes")
+POOL_CONFIG = {
+    "min": int(os.getenv("ORACLE_POOL_MIN", "1")),
+    "max": int(os.getenv("ORACLE_POOL_MAX", "8")),
+    "increment": int(os.getenv("ORACLE_POOL_INCREMENT", "1")),
+    "ping_interval": int(os.getenv("ORACLE_POOL_PING_INTERVAL", "60")),      # seconds
+    "wait_timeout": int(os.getenv("ORACLE_POOL_WAIT_TIMEOUT_MS", "30000")),  # ms to wait for a free session
+}
+
+_client_lock = threading.Lock()
+_client_initialized = False
+_pool_registry_lock = threading.Lock()
+_pool_locks = {}   # DB name -> lock serializing pool creation for that DB
+_pools = {}        # DB name -> (signature, pool)
+
+
+def _init_oracle_client():
+    """Initializes thick mode exactly once per process (no-op in thin mode)."""
+    global _client_initialized
+    if _client_initialized or ORACLE_THIN_MODE:
+        return
+    with _client_lock:
+        if not _client_initialized:
+            oracledb.init_oracle_client(lib_dir=ORACLE_CLIENT_LIB_DIR)
+            _client_initialized = True
+
+
+def resolve_db_name(db: str = "DEFAULT") -> str:
+    """Maps a requested DB name to its DB_CONFIG key (falls back to DEFAULT)."""
+    name = (db or "DEFAULT").upper()
+    return name if name in DB_CONFIG else "DEFAULT"
+
+
+def _pool_signature(config: dict) -> tuple:
+    return (config.get("user"), config.get("password"), config.get("dsn"))
+
+
+def _init_session(conn, requested_tag):
+    """Pool session callback: align the session timezone with the database (once per new session)."""
+    with conn.cursor() as cur:
+        cur.execute("ALTER SESSION SET TIME_ZONE = DBTIMEZONE")
+
+
+def _close_pool(name: str, pool):
+    try:
+        pool.close(force=True)
+        print(f"[DEBUG] Closed connection pool for {name}")
+    except Exception as e:
+        print(f"[DEBUG] Error closing pool for {name}: {e}")
+
+
+def get_pool(db: str = "DEFAULT"):
     """
-    Executes SQL on the specified Oracle DB and returns rows as list of dicts.
-    Falls back to DEFAULT if db not found.
+    Returns the connection pool for a DB_CONFIG entry, creating it on first use.
+    The pool is rebuilt if the entry's user/password/DSN changed since it was created.
     """
-    oracledb.init_oracle_client(lib_dir=r"C:\Users\omkarav\Downloads\instantclient-basiclite-windows.x64-19.28.0.0.0dbru\instantclient_19_28")
-    
-    config = DB_CONFIG.get(db.upper(), DB_CONFIG["DEFAULT"])
-    
-    try:
-        conn = oracledb.connect(
+    name = resolve_db_name(db)
+    config = DB_CONFIG[name]
+    signature = _pool_signature(config)
+
+    entry = _pools.get(name)
+    if entry and entry[0] == signature:
+        return entry[1]
+
+    with _pool_registry_lock:
+        lock = _pool_locks.setdefault(name, threading.Lock())
+
+    with lock:
+        entry = _pools.get(name)
+        if entry and entry[0] == signature:
+            return entry[1]
+        if entry:
+            _close_pool(name, entry[1])
+
+        _init_oracle_client()
+        pool = oracledb.create_pool(
             user=config["user"],
             password=config["password"],
-            dsn=config["dsn"]
+            dsn=config["dsn"],
+            min=POOL_CONFIG["min"],
+            max=POOL_CONFIG["max"],
+            increment=POOL_CONFIG["increment"],
+            session_callback=_init_session,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=POOL_CONFIG["wait_timeout"],
+            ping_interval=POOL_CONFIG["ping_interval"],
         )
-        # Set session timezone to match manual/SQL*Plus (adjust '-06:00' if your TZ differs)
-        cur_tz = conn.cursor()
-        cur_tz.execute("SELECT DBTIMEZONE FROM DUAL")
-        db_tz_result = cur_tz.fetchone()
-        db_tz = db_tz_result[0] if db_tz_result else '-06:00'
-        print(f"[DEBUG] DB Timezone: {db_tz}")
-        cur_tz.execute(f"ALTER SESSION SET TIME_ZONE = '{db_tz}'")
-        cur_tz.close()
-        
+        _pools[name] = (signature, pool)
+        print(f"[DEBUG] Created connection pool for {name} (min={POOL_CONFIG['min']}, max={POOL_CONFIG['max']})")
+        return pool
+
+
+@contextmanager
+def get_connection(db: str = "DEFAULT"):
+    """Acquires a pooled connection and always hands it back to the pool."""
+    pool = get_pool(db)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        try:
+            # Sessions broken by a call timeout or network error are dropped, not reused
+            if conn.is_healthy():
+                pool.release(conn)
+            else:
+                pool.drop(conn)
+        except Exception as e:
+            print(f"[DEBUG] Error releasing connection: {e}")
+
+
+def ping_database(db: str = "DEFAULT"):
+    """Round-trips a ping over a pooled session. Returns {"status", "latency_ms"} or an error dict."""
+    start = datetime.now()
+    try:
+        with get_connection(db) as conn:
+            conn.ping()
+        latency = (datetime.now() - start).total_seconds() * 1000
+        return {"status": "ok", "latency_ms": round(latency, 1)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def refresh_pools():
+    """Closes pools whose DB_CONFIG entry was removed or whose user/password/DSN changed."""
+    for name, (signature, pool) in list(_pools.items()):
+        config = DB_CONFIG.get(name)
+        if config is None or _pool_signature(config) != signature:
+            _pools.pop(name, None)
+            _close_pool(name, pool)
+
+
+def close_all_pools():
+    for name, (_, pool) in list(_pools.items()):
+        _pools.pop(name, None)
+        _close_pool(name, pool)
+
+
+def reload_db_config():
+    """Re-reads db_config.json and drops pools that no longer match it."""
+    global DB_CONFIG
+    DB_CONFIG = load_db_config()
+    refresh_pools()
+    return DB_CONFIG
+
+
+def run_oracle_query(sql: str, db: str = "DEFAULT", timeout: float = None, params=None):
+    """
+    Executes SQL on the specified Oracle DB and returns rows as list of dicts.
+    Falls back to DEFAULT if db not found. Uses a pooled session for the DB.
+    timeout (seconds) bounds every round trip of this statement; params are bind values.
+    """
+    try:
+        with get_connection(db) as conn:
+            cur = conn.cursor()
+            print(f"[SQL EXEC] {sql[:500]}")
+            if timeout:
+                conn.call_timeout = int(timeout * 1000)
+            try:
+                cur.execute(sql, params) if params else cur.execute(sql)
+                if cur.description:
+                    cols = [d[0] for d in cur.description]
+                    return [dict(zip(cols, r)) for r in cur.fetchall()]
+                conn.commit()
+                return f"Success. Statement executed. Rows affected: {cur.rowcount}"
+            finally:
+                if timeout and conn.is_healthy():
+                    conn.call_timeout = 0
+    except Exception as e:
+        if timeout and any(code in str(e) for code in ("DPI-1067", "DPY-4024", "ORA-03156")):
+            return {"error": f"Timed out after {timeout}s: {e}"}
+        return {"error": str(e)}
+
+
+# ==========================================
+# STREAMING FETCH
+# ==========================================
+FETCH_ARRAYSIZE = int(os.getenv("ORACLE_FETCH_ARRAYSIZE", "1000"))
+FETCH_PREFETCHROWS = int(os.getenv("ORACLE_FETCH_PREFETCHROWS", "1000"))
+
+
+def iter_oracle_query(sql: str, db: str = "DEFAULT", params=None, arraysize: int = None, prefetchrows: int = None):
+    """
+    Streams a query as (columns, rows) batches: rows is a list of tuples and columns is
+    the same list object for every batch. Only one batch is held in memory at a time.
+    The pooled session is held until the generator is exhausted or closed.
+    Unlike run_oracle_query, errors are raised, not returned.
+    """
+    arraysize = arraysize or FETCH_ARRAYSIZE
+    with get_connection(db) as conn:
         cur = conn.cursor()
-        print(f"[SQL EXEC] {sql[:500]}")
-        cur.execute(sql)
-        if cur.description:
-            cols = [d[0] for d in cur.description] if cur.description else []
-            rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-            conn.close()
-            return rows
+        cur.arraysize = arraysize
+        cur.prefetchrows = FETCH_PREFETCHROWS if prefetchrows is None else prefetchrows
+        print(f"[SQL STREAM] {sql[:500]}")
+        cur.execute(sql, params) if params else cur.execute(sql)
+        if not cur.description:
+            raise ValueError("iter_oracle_query only supports statements that return rows")
+        cols = [d[0] for d in cur.description]
+        emitted = False
+        try:
+            while True:
+                rows = cur.fetchmany(arraysize)
+                if not rows:
+                    break
+                emitted = True
+                yield cols, rows
+            if not emitted:
+                yield cols, []
+        finally:
+            cur.close()
+
+
+def write_query_csv(sql: str, fileobj, db: str = "DEFAULT", params=None, preview_rows: int = 0, max_bytes: int = None):
+    """
+    Streams a query straight into a text file object as CSV.
+    Returns (columns, row_count, preview, complete) where preview holds the first
+    preview_rows tuples. With max_bytes, fetching stops (and complete is False) once
+    the file has grown past that size; row_count is then the rows written so far.
+    """
+    writer = csv.writer(fileobj)
+    cols, total, preview = [], 0, []
+    batches = iter_oracle_query(sql, db, params=params)
+    try:
+        for cols, rows in batches:
+            if total == 0:
+                writer.writerow(cols)
+            writer.writerows(["" if v is None else v for v in row] for row in rows)
+            if len(preview) < preview_rows:
+                preview.extend(rows[:preview_rows - len(preview)])
+            total += len(rows)
+            if max_bytes and fileobj.tell() >= max_bytes:
+                return cols, total, preview, False
+    finally:
+        batches.close()  # releases the pooled session if we stopped early
+    return cols, total, preview, True
+
+
+# ==========================================
+# COLUMNAR (DATAFRAME) FETCH
+# ==========================================
+def _numeric_output_handler(cursor, metadata):
+    """NUMBER columns fetch as int (integral precision <= 18) or float, never Decimal."""
+    if metadata.type_code is oracledb.DB_TYPE_NUMBER:
+        if metadata.scale == 0 and 0 < (metadata.precision or 0) <= 18:
+            return cursor.var(int, arraysize=cursor.arraysize)
+        return cursor.var(float, arraysize=cursor.arraysize)
+
+
+def fetch_oracle_dataframe(sql: str, db: str = "DEFAULT", params=None, arraysize: int = None) -> pd.DataFrame:
+    """
+    Fetches a query straight into a pandas DataFrame for analytics/charting.
+    Uses python-oracledb's Arrow fetch (fetch_df_all) when available, otherwise a cursor
+    with a numeric output type handler, so NUMBER columns land as int64/float64 and
+    DATE/TIMESTAMP as datetime64 without per-row dict building. Raises on error.
+    """
+    arraysize = arraysize or FETCH_ARRAYSIZE
+    with get_connection(db) as conn:
+        print(f"[SQL DF] {sql[:500]}")
+        if HAS_PYARROW and hasattr(conn, "fetch_df_all"):
+            odf = conn.fetch_df_all(statement=sql, parameters=params, arraysize=arraysize)
+            if hasattr(odf, "__arrow_c_stream__"):
+                table = pa.table(odf)
+            else:
+                table = pa.Table.from_arrays(odf.column_arrays(), names=odf.column_names())
+            return table.to_pandas()
+
+        cur = conn.cursor()
+        cur.arraysize = arraysize
+        cur.prefetchrows = FETCH_PREFETCHROWS
+        cur.outputtypehandler = _numeric_output_handler
+        cur.execute(sql, params) if params else cur.execute(sql)
+        cols = [d[0] for d in cur.description]
+        df = pd.DataFrame.from_records(cur.fetchall(), columns=cols)
+        cur.close()
+        return df
+
+
+# ==========================================
+# PARALLEL QUERY EXECUTION
+# ==========================================
+# Upper bound on statements running at once against a single database, shared by
+# every caller in the process (health checks, metrics, fleet sweeps).
+DB_MAX_CONCURRENCY = int(os.getenv("ORACLE_DB_MAX_CONCURRENCY", "6"))
+_db_slot_lock = threading.Lock()
+_db_slots = {}
+
+
+def _db_slots_for(db: str):
+    name = resolve_db_name(db)
+    with _db_slot_lock:
+        return _db_slots.setdefault(name, threading.BoundedSemaphore(DB_MAX_CONCURRENCY))
+
+
+def run_queries_parallel(queries: dict, db: str = "DEFAULT", timeouts: dict = None, default_timeout: float = None):
+    """
+    Runs independent queries concurrently on pooled sessions of one database.
+    queries maps a name to SQL or (SQL, binds); timeouts optionally maps a name to seconds.
+    Returns {name: run_oracle_query result} in the same order as queries.
+    """
+    if not queries:
+        return {}
+    timeouts = timeouts or {}
+    slots = _db_slots_for(db)
+
+    def _run(name, stmt):
+        sql, params = _split_statement(stmt)
+        with slots:
+            return run_oracle_query(sql, db, timeout=timeouts.get(name, default_timeout), params=params)
+
+    results = {}
+    workers = max(1, min(len(queries), DB_MAX_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"ora-{resolve_db_name(db)}") as executor:
+        futures = {name: executor.submit(_run, name, sql) for name, sql in queries.items()}
+        for name in queries:  # collect in input order, not completion order
+            try:
+                results[name] = futures[name].result()
+            except Exception as e:
+                results[name] = {"error": str(e)}
+    return results
+
+def _split_statement(stmt):
+    """A batch entry is either SQL text or a (SQL, binds) tuple."""
+    if isinstance(stmt, (tuple, list)):
+        return stmt[0], (stmt[1] if len(stmt) > 1 else None)
+    return stmt, None
+
+
+# ==========================================
+# BATCHED / PIPELINED QUERIES
+# ==========================================
+# python-oracledb pipelining sends a group of statements in one round trip. It needs
+# thin mode and the asyncio API, so pipelined batches run on a dedicated event loop
+# thread with their own async pools. Otherwise batches fall back to run_queries_parallel.
+PIPELINE_ENABLED = os.getenv("ORACLE_PIPELINING", "true").lower() in ("1", "true", "yes")
+_pipeline_loop = None
+_pipeline_loop_lock = threading.Lock()
+_async_pools = {}  # DB name -> (signature, AsyncConnectionPool); only touched on the loop thread
+
+
+def pipelining_available() -> bool:
+    if not PIPELINE_ENABLED or not hasattr(oracledb, "create_pipeline"):
+        return False
+    if not hasattr(getattr(oracledb, "PipelineOpResult", None), "columns"):
+        return False
+    _init_oracle_client()
+    return oracledb.is_thin_mode()
+
+
+def _get_pipeline_loop():
+    global _pipeline_loop
+    with _pipeline_loop_lock:
+        if _pipeline_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ora-pipeline", daemon=True).start()
+            _pipeline_loop = loop
+    return _pipeline_loop
+
+
+async def _get_async_pool(name: str):
+    config = DB_CONFIG[name]
+    signature = _pool_signature(config)
+    entry = _async_pools.get(name)
+    if entry and entry[0] == signature:
+        return entry[1]
+    if entry:
+        try:
+            await entry[1].close(force=True)
+        except Exception as e:
+            print(f"[DEBUG] Error closing async pool for {name}: {e}")
+    pool = oracledb.create_pool_async(
+        user=config["user"],
+        password=config["password"],
+        dsn=config["dsn"],
+        min=POOL_CONFIG["min"],
+        max=POOL_CONFIG["max"],
+        increment=POOL_CONFIG["increment"],
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        wait_timeout=POOL_CONFIG["wait_timeout"],
+        ping_interval=POOL_CONFIG["ping_interval"],
+    )
+    _async_pools[name] = (signature, pool)
+    print(f"[DEBUG] Created async connection pool for {name}")
+    return pool
+
+
+async def _run_pipeline(statements: dict, name: str, timeout: float = None, state: dict = None):
+    pool = await _get_async_pool(name)
+    async with pool.acquire() as conn:
+        if timeout:
+            conn.call_timeout = int(timeout * 1000)
+        try:
+            pipeline = oracledb.create_pipeline()
+            # Same session setup as the sync pool's session callback, but in the same round trip
+            pipeline.add_execute("ALTER SESSION SET TIME_ZONE = DBTIMEZONE")
+            for stmt in statements.values():
+                sql, params = _split_statement(stmt)
+                pipeline.add_fetchall(sql, params)
+            if state is not None:
+                state["sent"] = True
+            op_results = await conn.run_pipeline(pipeline, continue_on_error=True)
+        finally:
+            # Pooled session: don't leave this batch's budget on it for the next caller
+            if timeout and conn.is_healthy():
+                conn.call_timeout = 0
+
+    results = {}
+    for key, res in zip(statements.keys(), op_results[1:]):
+        if res.error:
+            results[key] = {"error": str(res.error)}
         else:
-            conn.commit()
-            row_count = cur.rowcount
-            conn.close()
-            return f"Success. Statement executed. Rows affected: {row_count}"
+            cols = [c.name for c in res.columns or []]
+            results[key] = [dict(zip(cols, r)) for r in res.rows or []]
+    return results
+
+
+def run_oracle_batch(statements: dict, db: str = "DEFAULT", timeouts: dict = None, default_timeout: float = None):
+    """
+    Runs a group of independent read-only statements and returns
+    {name: rows | {"error": ...}} in input order (same shapes as run_oracle_query).
+
+    With pipelining available the whole batch is one round trip on one session; the
+    per-statement timeouts then add up to a single budget for that round trip, so this
+    suits batches of cheap statements (slow scans with their own limits belong in
+    run_queries_parallel). Otherwise statements run concurrently on pooled sessions.
+    """
+    if not statements:
+        return {}
+    if pipelining_available():
+        name = resolve_db_name(db)
+        timeouts = timeouts or {}
+        budget = sum(timeouts.get(k, default_timeout) or 0 for k in statements) or None
+        state = {"sent": False}
+        try:
+            for key, stmt in statements.items():
+                print(f"[SQL PIPELINE] {key}: {_split_statement(stmt)[0].strip()[:200]}")
+            with _db_slots_for(db):
+                future = asyncio.run_coroutine_threadsafe(_run_pipeline(statements, name, budget, state), _get_pipeline_loop())
+                return future.result()
+        except Exception as e:
+            if state["sent"]:
+                # The statements already ran (or timed out) on the server: don't pay for them twice
+                print(f"[DEBUG] Pipelined batch failed on {name}: {e}")
+                return {key: {"error": str(e)} for key in statements}
+            print(f"[DEBUG] Pipelined batch failed on {name}, falling back to parallel sessions: {e}")
+    return run_queries_parallel(statements, db, timeouts=timeouts, default_timeout=default_timeout)
+
+# ==========================================
+# AWR REPORT CACHE
+# ==========================================
+# A report for a closed snapshot range never changes, so rendered reports are kept
+# gzip-compressed on disk, named by a hash of (kind, DBID, instance, begin, end).
+# The directory is shared by every Streamlit session (and process) on the host;
+# files are written atomically and the least recently used ones are evicted once
+# the cache grows past REPORT_CACHE_MAX_MB.
+REPORT_CACHE_DIR = os.getenv(
+    "AWR_REPORT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".awr_report_cache"),
+)
+REPORT_CACHE_MAX_MB = int(os.getenv("AWR_REPORT_CACHE_MAX_MB", "512"))
+_report_cache_lock = threading.Lock()
+_db_identity = {}  # DB name -> (pool signature, DBID, INSTANCE_NUMBER)
+
+
+def get_db_identity(db: str = "DEFAULT"):
+    """Returns (DBID, INSTANCE_NUMBER) for a DB_CONFIG entry, cached until its DSN/credentials change."""
+    name = resolve_db_name(db)
+    signature = _pool_signature(DB_CONFIG[name])
+    entry = _db_identity.get(name)
+    if entry and entry[0] == signature:
+        return entry[1], entry[2]
+    with get_connection(name) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT d.DBID, i.INSTANCE_NUMBER FROM V$DATABASE d, V$INSTANCE i")
+        dbid, inst_num = cur.fetchone()
+        cur.close()
+    _db_identity[name] = (signature, dbid, inst_num)
+    return dbid, inst_num
+
+
+def report_cache_key(kind: str, dbid, inst_num, begin, end) -> str:
+    return hashlib.sha256(f"{kind}|{dbid}|{inst_num}|{begin}|{end}".encode("utf-8")).hexdigest()
+
+
+def _report_cache_path(key: str) -> str:
+    return os.path.join(REPORT_CACHE_DIR, f"{key}.html.gz")
+
+
+def report_cache_get(key: str):
+    """Returns the cached report HTML or None. A hit refreshes the entry's LRU position."""
+    path = _report_cache_path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            html = f.read()
+    except (FileNotFoundError, OSError, EOFError):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return html
+
+
+def report_cache_put(key: str, html: str):
+    """Stores a report (temp file + rename, so readers never see a partial file), then trims the cache."""
+    try:
+        os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+        path = _report_cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        _evict_report_cache()
     except Exception as e:
-        return {"error": str(e)}
+        print(f"[DEBUG] Report cache write failed: {e}")
+
+
+def _evict_report_cache():
+    limit = REPORT_CACHE_MAX_MB * 1024 * 1024
+    with _report_cache_lock:
+        entries, total = [], 0
+        for entry in os.scandir(REPORT_CACHE_DIR):
+            if not entry.name.endswith(".html.gz"):
+                continue
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+            total += info.st_size
+        if total <= limit:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+            if total <= limit:
+                break
+
 
-# [Your existing generate_awr_report function - unchanged, truncated for brevity]
 def generate_awr_report(start_snap, end_snap, db):
-    oracledb.init_oracle_client(lib_dir=r"C:\Users\omkarav\Downloads\instantclient-basiclite-windows.x64-19.28.0.0.0dbru\instantclient_19_28")
-    config = DB_CONFIG.get(db.upper(), DB_CONFIG["DEFAULT"])
     try:
-        conn = oracledb.connect(user=config["user"], password=config["password"], dsn=config["dsn"])
-        cur = conn.cursor()
-        
-        # Get DBID/Inst
-        cur.execute("SELECT DBID FROM V$DATABASE")
-        dbid = cur.fetchone()[0]
-        cur.execute("SELECT INSTANCE_NUMBER FROM V$INSTANCE")
-        inst_num = cur.fetchone()[0]
+        dbid, inst_num = get_db_identity(db)
+        filename = f"AWR_{start_snap}_{end_snap}.html"
+        cache_key = report_cache_key("AWR", dbid, inst_num, start_snap, end_snap)
+        report = report_cache_get(cache_key)
+        if report:
+            print(f"[DEBUG] AWR report {start_snap}-{end_snap} served from cache")
+            return {"status": "ok", "report": report, "filename": filename, "cached": True}
+
+        with get_connection(db) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT * FROM TABLE(DBMS_WORKLOAD_REPOSITORY.AWR_REPORT_HTML(:dbid, :inst, :b, :e, 0))",
+                {"dbid": dbid, "inst": inst_num, "b": start_snap, "e": end_snap},
+            )
+            report = "".join([str(row[0]) for row in cur if row[0]])
 
-        sql = f"""
-        SELECT * FROM TABLE(DBMS_WORKLOAD_REPOSITORY.AWR_REPORT_HTML({dbid}, {inst_num}, {start_snap}, {end_snap}, 0))
-        """
-        cur.execute(sql)
-        report = "".join([str(row[0]) for row in cur if row[0]])
-        conn.close()
-        
-        if not report: report = "<h3>Empty Report</h3>"
-        return {"status": "ok", "report": report, "filename": f"AWR_{start_snap}_{end_snap}.html"}
+        if not report:
+            return {"status": "ok", "report": "<h3>Empty Report</h3>", "filename": filename, "cached": False}
+        report_cache_put(cache_key, report)
+        return {"status": "ok", "report": report, "filename": filename, "cached": False}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+# ==========================================
+# AWR / ASH REPORT PARSER
+# ==========================================
+# Extracts the standard report sections into DataFrames with canonical column names,
+# so callers get exact numbers without flattening the whole HTML for the LLM.
+# Each entry: section key -> (regex on heading/table summary, [(header regex, column)]).
+AWR_SECTIONS = {
+    "load_profile": (r"load profile", [
+        (r"^$|^statistic", "METRIC"), (r"per ?second", "PER_SECOND"), (r"per ?trans", "PER_TRANSACTION"),
+        (r"per ?exec", "PER_EXEC"), (r"per ?call", "PER_CALL"),
+    ]),
+    "top_events": (r"top \d+ (timed |foreground )?(foreground )?events|top timed events|wait events by total wait time", [
+        (r"^event", "EVENT"), (r"^waits$", "WAITS"), (r"wait ?avg|avg ?wait", "AVG_WAIT_MS"),
+        (r"time ?\(s|total wait time", "TIME_S"), (r"db ?time", "PCT_DB_TIME"), (r"wait ?class", "WAIT_CLASS"),
+    ]),
+    "time_model": (r"time model statistics", [
+        (r"statistic", "STATISTIC"), (r"time ?\(s", "TIME_S"), (r"db ?time", "PCT_DB_TIME"),
+        (r"cpu ?time", "PCT_CPU_TIME"),
+    ]),
+    "efficiency": (r"instance efficiency", []),
+    "sql_elapsed": (r"sql ordered by elapsed time", None),
+    "sql_cpu": (r"sql ordered by cpu time", None),
+    "sql_gets": (r"sql ordered by gets", None),
+    "sql_reads": (r"sql ordered by reads", None),
+    "io_tablespace": (r"tablespace io stats", [
+        (r"^tablespace", "TABLESPACE"), (r"^reads$", "READS"), (r"av ?rds/s", "AVG_READS_PER_S"),
+        (r"av ?rd ?\(ms", "AVG_READ_MS"), (r"av ?blks/rd", "AVG_BLOCKS_PER_READ"), (r"^writes$", "WRITES"),
+        (r"writes ?avg/s|av ?wrt/s", "AVG_WRITES_PER_S"), (r"buffer ?waits", "BUFFER_WAITS"),
+        (r"av ?buf ?wt", "AVG_BUFFER_WAIT_MS"),
+    ]),
+    "ash_top_events": (r"top user events", [
+        (r"^event$", "EVENT"), (r"event ?class", "EVENT_CLASS"), (r"% ?(event|activity)", "PCT_ACTIVITY"),
+        (r"avg ?active", "AVG_ACTIVE_SESSIONS"),
+    ]),
+    "ash_top_sql": (r"top sql with top events", [
+        (r"sql ?id", "SQL_ID"), (r"plan ?hash", "PLAN_HASH_VALUE"), (r"sampled", "SAMPLED_EXECUTIONS"),
+        (r"% ?activity", "PCT_ACTIVITY"), (r"^event$", "EVENT"), (r"% ?event", "PCT_EVENT"),
+        (r"sql ?text", "SQL_TEXT"),
+    ]),
+}
+# Shared column map for the "SQL ordered by ..." tables
+_AWR_SQL_COLUMNS = [
+    (r"elapsed.*per ?exec", "ELAPSED_PER_EXEC_S"), (r"cpu.*per ?exec", "CPU_PER_EXEC_S"),
+    (r"gets ?per ?exec", "GETS_PER_EXEC"), (r"reads ?per ?exec", "READS_PER_EXEC"),
+    (r"elapsed ?time", "ELAPSED_S"), (r"cpu ?time", "CPU_S"), (r"buffer ?gets", "BUFFER_GETS"),
+    (r"physical ?reads|^reads$", "PHYSICAL_READS"), (r"executions", "EXECUTIONS"),
+    (r"%total", "PCT_TOTAL"), (r"%cpu", "PCT_CPU"), (r"%io", "PCT_IO"), (r"sql ?id", "SQL_ID"),
+    (r"sql ?module", "MODULE"), (r"sql ?text", "SQL_TEXT"),
+]
+_AWR_TEXT_COLUMNS = {"METRIC", "EVENT", "WAIT_CLASS", "STATISTIC", "SQL_ID", "MODULE", "SQL_TEXT",
+                     "TABLESPACE", "EVENT_CLASS", "PLAN_HASH_VALUE"}
+_AWR_SCALE = {"k": 1e3, "m": 1e6, "g": 1e9, "t": 1e12}
+_AWR_TIME_MS = {"ns": 1e-6, "us": 1e-3, "ms": 1.0, "s": 1e3}
+
+
+def _awr_number(text: str, column: str = ""):
+    """'1,234.5' -> 1234.5, '2.1K' -> 2100.0, '512us' -> 0.512 (for *_MS columns); None if not numeric."""
+    t = text.replace(",", "").replace("%", "").strip()
+    if not t:
+        return None
+    m = re.fullmatch(r"(-?\d*\.?\d+)\s*([a-z]*)", t, re.IGNORECASE)
+    if not m:
+        return None
+    value, unit = float(m.group(1)), m.group(2).lower()
+    if not unit:
+        return value
+    if column.endswith("_MS") and unit in _AWR_TIME_MS:
+        return value * _AWR_TIME_MS[unit]
+    if unit in _AWR_SCALE:
+        return value * _AWR_SCALE[unit]
+    return None
+
+
+def _awr_canonical_columns(headers: list, column_map: list) -> list:
+    names, used = [], set()
+    for raw in headers:
+        norm = re.sub(r"\s+", " ", raw).strip().lower()
+        name = next((col for pattern, col in column_map if col not in used and re.search(pattern, norm)), None)
+        if name is None:
+            name = re.sub(r"[^0-9A-Z]+", "_", norm.upper()).strip("_") or f"COL{len(names)}"
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def _awr_table_frame(key: str, header: list, rows: list) -> pd.DataFrame:
+    column_map = AWR_SECTIONS[key][1]
+    if key == "efficiency":
+        # Label/value pairs laid out side by side: "Buffer Nowait %:", "99.99", "Redo NoWait %:", ...
+        pairs = [(r[i].rstrip(": "), _awr_number(r[i + 1])) for r in [header] + rows for i in range(0, len(r) - 1, 2)]
+        return pd.DataFrame([p for p in pairs if p[0] and p[1] is not None], columns=["METRIC", "VALUE"])
+
+    columns = _awr_canonical_columns(header, _AWR_SQL_COLUMNS if column_map is None else column_map)
+    width = len(columns)
+    records = [(r + [""] * width)[:width] for r in rows if any(r)]
+    df = pd.DataFrame(records, columns=columns)
+    for col in df.columns:
+        if col in _AWR_TEXT_COLUMNS:
+            df[col] = df[col].str.strip()
+            if col == "METRIC":
+                df[col] = df[col].str.rstrip(":")
+        else:
+            df[col] = [_awr_number(v, col) for v in df[col]]
+    return df
+
+
+def _awr_elements(html: str):
+    """Yields ("heading", text) and ("table", summary, [[cell text, ...], ...]) in document order."""
+    if HAS_LXML:
+        root = lxml.html.fromstring(html)
+        for el in root.iter("h2", "h3", "table"):
+            if el.tag == "table":
+                rows = [[c.text_content().strip() for c in tr if c.tag in ("th", "td")] for tr in el.iter("tr")]
+                yield ("table", el.get("summary", ""), rows)
+            else:
+                yield ("heading", el.text_content().strip())
+        return
+    soup = BeautifulSoup(html, "html.parser")
+    for el in soup.find_all(["h2", "h3", "table"]):
+        if el.name == "table":
+            rows = [[c.get_text(strip=True) for c in tr.find_all(["th", "td"], recursive=False)] for tr in el.find_all("tr")]
+            yield ("table", el.get("summary", ""), rows)
+        else:
+            yield ("heading", el.get_text(strip=True))
+
+
+def parse_awr_report(html: str) -> dict:
+    """
+    Parses an AWR or ASH HTML report in one pass. Returns {section key: DataFrame} for the
+    sections found (see AWR_SECTIONS); numeric columns are floats with K/M suffixes and
+    us/ms/s units resolved. The first matching table of each section wins.
+    """
+    sections, heading = {}, ""
+    patterns = {key: re.compile(spec[0], re.IGNORECASE) for key, spec in AWR_SECTIONS.items()}
+    for element in _awr_elements(html):
+        if element[0] == "heading":
+            heading = element[1]
+            continue
+        _, summary, rows = element
+        label = f"{heading} {summary}"
+        key = next((k for k, p in patterns.items() if k not in sections and p.search(label)), None)
+        heading = ""
+        if key is None or len(rows) < 2:
+            continue
+        try:
+            df = _awr_table_frame(key, rows[0], rows[1:])
+        except Exception as e:
+            print(f"[DEBUG] AWR parser: could not read section {key}: {e}")
+            continue
+        if not df.empty:
+            sections[key] = df
+    return sections
+
+
+def awr_sections_to_text(sections: dict, max_rows: int = 15) -> str:
+    """Compact plain-text rendering of parsed sections for LLM prompts."""
+    parts = []
+    for key, df in sections.items():
+        parts.append(f"## {key}\n{df.head(max_rows).to_string(index=False, max_colwidth=80)}")
+    return "\n\n".join(parts)
+
+
+def awr_report_text(html: str) -> str:
+    """Whitespace-collapsed text of the whole report (lxml when available)."""
+    if HAS_LXML:
+        text = lxml.html.fromstring(html).text_content()
+    else:
+        text = BeautifulSoup(html, "html.parser").get_text(separator="\n")
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+# ==========================================
+# AWR DIFF ENGINE
+# ==========================================
+# Baseline-vs-target deltas computed locally from parsed sections, so the LLM only
+# explains a compact, exact delta table instead of deriving numbers from two dumps.
+AWR_DIFF_THRESHOLDS = {
+    "load_pct": float(os.getenv("AWR_DIFF_LOAD_PCT", "20")),                # load profile per-second change, %
+    "event_pts": float(os.getenv("AWR_DIFF_EVENT_PTS", "5")),               # % DB time change, percentage points
+    "event_wait_pct": float(os.getenv("AWR_DIFF_EVENT_WAIT_PCT", "50")),    # avg wait change, %
+    "event_min_pct_db_time": float(os.getenv("AWR_DIFF_EVENT_MIN_PCT", "1")),
+    "sql_per_exec_pct": float(os.getenv("AWR_DIFF_SQL_PER_EXEC_PCT", "20")),
+    "sql_min_elapsed_s": float(os.getenv("AWR_DIFF_SQL_MIN_ELAPSED_S", "10")),
+    "efficiency_pts": float(os.getenv("AWR_DIFF_EFFICIENCY_PTS", "2")),
+}
+AWR_DIFF_COLUMNS = ["SECTION", "ITEM", "METRIC", "BASELINE", "TARGET", "DELTA", "DELTA_PCT", "REGRESSION", "NOTE"]
+_AWR_SQL_SECTIONS = ("sql_elapsed", "sql_cpu", "sql_gets", "sql_reads")
+
+
+def _awr_sql_stats(sections: dict) -> pd.DataFrame:
+    """One row per SQL_ID across the SQL ordered by ... sections (first non-null value per column)."""
+    frames = [sections[k] for k in _AWR_SQL_SECTIONS if k in sections and "SQL_ID" in sections[k].columns]
+    if not frames:
+        return pd.DataFrame(columns=["SQL_ID"])
+    df = pd.concat(frames, ignore_index=True)
+    df = df[df["SQL_ID"].astype(str).str.len() > 0].groupby("SQL_ID", as_index=False).first()
+    if "ELAPSED_S" in df.columns and "EXECUTIONS" in df.columns:
+        per_exec = df["ELAPSED_S"] / df["EXECUTIONS"].where(df["EXECUTIONS"] > 0)
+        df["ELAPSED_PER_EXEC_S"] = df["ELAPSED_PER_EXEC_S"].fillna(per_exec) if "ELAPSED_PER_EXEC_S" in df.columns else per_exec
+    return df
+
+
+def _awr_diff_part(section, base, target, key, metrics, higher_is_worse=True, gate=None, extra=None, carry=()):
+    """
+    Long-format deltas for one section. metrics: [(column, "pct" | "pts", threshold or None)].
+    gate(merged) -> bool Series restricting which items may be flagged (e.g. material SQL only).
+    extra(merged) -> Series of notes per item; carry lists extra columns it needs.
+    """
+    if base is None or target is None or key not in base.columns or key not in target.columns:
+        return None
+    metrics = [m for m in metrics if m[0] in base.columns or m[0] in target.columns]
+    cols = [m[0] for m in metrics] + [c for c in carry if c in base.columns and c in target.columns]
+    merged = base.reindex(columns=[key] + cols).merge(
+        target.reindex(columns=[key] + cols), on=key, how="outer", suffixes=("_BASE", "_TARGET")
+    )
+    allowed = gate(merged) if gate else pd.Series(True, index=merged.index)
+    notes = extra(merged) if extra else pd.Series("", index=merged.index)
+    sign = 1 if higher_is_worse else -1
+    parts = []
+    for idx, (metric, kind, threshold) in enumerate(metrics):
+        b, t = merged[f"{metric}_BASE"].astype(float), merged[f"{metric}_TARGET"].astype(float)
+        part = pd.DataFrame({"SECTION": section, "ITEM": merged[key], "METRIC": metric, "BASELINE": b, "TARGET": t})
+        part["DELTA"] = t - b
+        part["DELTA_PCT"] = (part["DELTA"] / b.abs().where(b != 0) * 100).round(1)
+        change = part["DELTA_PCT"] if kind == "pct" else part["DELTA"]
+        flagged = (change * sign >= threshold) if threshold is not None else pd.Series(False, index=part.index)
+        if idx == 0 and higher_is_worse:
+            flagged = flagged | (b.isna() & t.notna())  # new in the target period's top lists
+        part["REGRESSION"] = (flagged & allowed).fillna(False).astype(bool)
+        part["NOTE"] = notes
+        part.loc[b.isna() & t.notna(), "NOTE"] = (part["NOTE"] + " new in target").str.strip()
+        part.loc[b.notna() & t.isna(), "NOTE"] = (part["NOTE"] + " not in target top list").str.strip()
+        parts.append(part[part["BASELINE"].notna() | part["TARGET"].notna()])
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+
+def diff_awr_sections(base: dict, target: dict, thresholds: dict = None) -> pd.DataFrame:
+    """
+    Compares two parse_awr_report()/extract_awr_data() results. Returns one row per
+    (section, item, metric) with BASELINE, TARGET, DELTA, DELTA_PCT, a REGRESSION flag
+    (AWR_DIFF_THRESHOLDS, overridable per call) and a NOTE (new items, plan changes).
+    Load profile compares per-second rates, so windows of different length are comparable.
+    """
+    th = dict(AWR_DIFF_THRESHOLDS, **(thresholds or {}))
+    parts = [
+        _awr_diff_part("load_profile", base.get("load_profile"), target.get("load_profile"), "METRIC",
+                       [("PER_SECOND", "pct", th["load_pct"])]),
+        _awr_diff_part("top_events", base.get("top_events"), target.get("top_events"), "EVENT",
+                       [("PCT_DB_TIME", "pts", th["event_pts"]), ("AVG_WAIT_MS", "pct", th["event_wait_pct"]),
+                        ("WAITS", "pct", None)],
+                       gate=lambda m: m.get("PCT_DB_TIME_TARGET", pd.Series(0.0, index=m.index)).fillna(0)
+                       >= th["event_min_pct_db_time"]),
+        _awr_diff_part("time_model", base.get("time_model"), target.get("time_model"), "STATISTIC",
+                       [("PCT_DB_TIME", "pts", th["event_pts"])]),
+        _awr_diff_part("efficiency", base.get("efficiency"), target.get("efficiency"), "METRIC",
+                       [("VALUE", "pts", th["efficiency_pts"])], higher_is_worse=False),
+    ]
+
+    base_sql, target_sql = _awr_sql_stats(base), _awr_sql_stats(target)
+
+    def _plan_notes(m):
+        if "PLAN_HASH_VALUE_BASE" not in m.columns:
+            return pd.Series("", index=m.index)
+        changed = m["PLAN_HASH_VALUE_BASE"].notna() & m["PLAN_HASH_VALUE_TARGET"].notna() & \
+            (m["PLAN_HASH_VALUE_BASE"] != m["PLAN_HASH_VALUE_TARGET"])
+        text = "plan " + m["PLAN_HASH_VALUE_BASE"].astype(str) + " -> " + m["PLAN_HASH_VALUE_TARGET"].astype(str)
+        return text.where(changed, "")
+
+    sql_metrics = [("ELAPSED_PER_EXEC_S", "pct", th["sql_per_exec_pct"]), ("CPU_PER_EXEC_S", "pct", th["sql_per_exec_pct"]),
+                   ("GETS_PER_EXEC", "pct", th["sql_per_exec_pct"]), ("READS_PER_EXEC", "pct", th["sql_per_exec_pct"]),
+                   ("EXECUTIONS", "pct", None), ("ELAPSED_S", "pct", None)]
+    sql_part = _awr_diff_part(
+        "sql", base_sql, target_sql, "SQL_ID", sql_metrics,
+        gate=lambda m: m.get("ELAPSED_S_TARGET", pd.Series(0.0, index=m.index)).fillna(0) >= th["sql_min_elapsed_s"],
+        extra=_plan_notes, carry=("PLAN_HASH_VALUE",),
+    )
+    parts.append(sql_part)
+
+    parts = [p for p in parts if p is not None and not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=AWR_DIFF_COLUMNS)
+    diff = pd.concat(parts, ignore_index=True)
+    diff["_ABS"] = diff["DELTA_PCT"].abs().fillna(float("inf"))
+    diff = diff.sort_values(["REGRESSION", "_ABS"], ascending=[False, False], kind="stable")
+    return diff.drop(columns="_ABS").reset_index(drop=True)[AWR_DIFF_COLUMNS]
+
+
+def awr_diff_to_text(diff: pd.DataFrame, max_changes: int = 40) -> str:
+    """Regressions plus the largest other changes, compact enough for a single LLM prompt."""
+    if diff.empty:
+        return "No comparable sections were found in the two reports."
+    regressions = diff[diff["REGRESSION"]]
+    others = diff[~diff["REGRESSION"] & diff["DELTA_PCT"].notna()].head(max_changes)
+    num = lambda spec: (lambda v: "-" if pd.isna(v) else format(v, spec))
+    fmt = {"BASELINE": num(",.2f"), "TARGET": num(",.2f"), "DELTA": num("+,.2f"), "DELTA_PCT": lambda v: "-" if pd.isna(v) else f"{v:+.1f}%"}
+    cols = ["SECTION", "ITEM", "METRIC", "BASELINE", "TARGET", "DELTA", "DELTA_PCT", "NOTE"]
+    text = [f"### Flagged regressions ({len(regressions)})"]
+    text.append(regressions[cols].to_string(index=False, formatters=fmt, max_colwidth=60) if len(regressions) else "None")
+    text.append(f"### Other notable changes (top {len(others)})")
+    text.append(others[cols].to_string(index=False, formatters=fmt, max_colwidth=60) if len(others) else "None")
+    return "\n".join(text)
+
+
+# ==========================================
+# AWR DATA EXTRACTION (DBA_HIST)
+# ==========================================
+# Reads the same logical sections parse_awr_report() returns straight from the
+# DBA_HIST views (one batched round trip), for callers that only need numbers.
+# AWR_REPORT_HTML is still used when a downloadable report is wanted.
+_AWR_SYSSTATS = {
+    # stat name -> load profile metric (None: only used for efficiency ratios)
+    "redo size": "Redo size (bytes)",
+    "session logical reads": "Logical read (blocks)",
+    "db block changes": "Block changes",
+    "physical reads": "Physical read (blocks)",
+    "physical writes": "Physical write (blocks)",
+    "physical read total IO requests": "Read IO requests",
+    "physical write total IO requests": "Write IO requests",
+    "user calls": "User calls",
+    "parse count (total)": "Parses (SQL)",
+    "parse count (hard)": "Hard parses (SQL)",
+    "logons cumulative": "Logons",
+    "execute count": "Executes (SQL)",
+    "user rollbacks": "Rollbacks",
+    "user commits": None,
+    "physical reads cache": None,
+    "sorts (memory)": None,
+    "sorts (disk)": None,
+    "parse time cpu": None,
+    "parse time elapsed": None,
+    "redo entries": None,
+    "redo log space requests": None,
+}
+_AWR_EXTRACT_SQL = {
+    "sysstat": """
+        SELECT e.stat_name, e.value - NVL(b.value, 0) AS delta
+        FROM dba_hist_sysstat e
+        LEFT JOIN dba_hist_sysstat b
+          ON b.dbid = e.dbid AND b.instance_number = e.instance_number AND b.stat_id = e.stat_id AND b.snap_id = :b
+        WHERE e.dbid = :dbid AND e.instance_number = :inst AND e.snap_id = :e
+          AND e.stat_name IN ({names})
+    """,
+    "time_model": """
+        SELECT e.stat_name, (e.value - NVL(b.value, 0)) / 1e6 AS time_s
+        FROM dba_hist_sys_time_model e
+        LEFT JOIN dba_hist_sys_time_model b
+          ON b.dbid = e.dbid AND b.instance_number = e.instance_number AND b.stat_id = e.stat_id AND b.snap_id = :b
+        WHERE e.dbid = :dbid AND e.instance_number = :inst AND e.snap_id = :e
+    """,
+    "events": """
+        SELECT e.event_name, e.wait_class,
+               e.total_waits - NVL(b.total_waits, 0) AS waits,
+               (e.time_waited_micro - NVL(b.time_waited_micro, 0)) / 1e6 AS time_s
+        FROM dba_hist_system_event e
+        LEFT JOIN dba_hist_system_event b
+          ON b.dbid = e.dbid AND b.instance_number = e.instance_number AND b.event_id = e.event_id AND b.snap_id = :b
+        WHERE e.dbid = :dbid AND e.instance_number = :inst AND e.snap_id = :e AND e.wait_class <> 'Idle'
+          AND e.time_waited_micro - NVL(b.time_waited_micro, 0) > 0
+    """,
+    "osstat": """
+        SELECT e.stat_name, e.value AS end_value, b.value AS begin_value
+        FROM dba_hist_osstat e
+        LEFT JOIN dba_hist_osstat b
+          ON b.dbid = e.dbid AND b.instance_number = e.instance_number AND b.stat_id = e.stat_id AND b.snap_id = :b
+        WHERE e.dbid = :dbid AND e.instance_number = :inst AND e.snap_id = :e
+          AND e.stat_name IN ('NUM_CPUS', 'BUSY_TIME', 'IDLE_TIME', 'USER_TIME', 'SYS_TIME', 'IOWAIT_TIME', 'LOAD')
+    """,
+    "sqlstat": """
+        SELECT x.*, DBMS_LOB.SUBSTR(t.sql_text, 200, 1) AS sql_text
+        FROM (
+            SELECT a.*,
+                   ROW_NUMBER() OVER (ORDER BY a.elapsed_s DESC) AS rn_ela,
+                   ROW_NUMBER() OVER (ORDER BY a.cpu_s DESC) AS rn_cpu,
+                   ROW_NUMBER() OVER (ORDER BY a.buffer_gets DESC) AS rn_gets,
+                   ROW_NUMBER() OVER (ORDER BY a.physical_reads DESC) AS rn_reads
+            FROM (
+                SELECT s.sql_id,
+                       MAX(s.plan_hash_value) KEEP (DENSE_RANK FIRST ORDER BY s.elapsed_time_delta DESC) AS plan_hash_value,
+                       COUNT(DISTINCT s.plan_hash_value) AS plan_count,
+                       MAX(s.module) AS module,
+                       SUM(s.executions_delta) AS executions,
+                       SUM(s.elapsed_time_delta) / 1e6 AS elapsed_s,
+                       SUM(s.cpu_time_delta) / 1e6 AS cpu_s,
+                       SUM(s.iowait_delta) / 1e6 AS iowait_s,
+                       SUM(s.buffer_gets_delta) AS buffer_gets,
+                       SUM(s.disk_reads_delta) AS physical_reads
+                FROM dba_hist_sqlstat s
+                WHERE s.dbid = :dbid AND s.instance_number = :inst AND s.snap_id > :b AND s.snap_id <= :e
+                GROUP BY s.sql_id
+            ) a
+        ) x
+        LEFT JOIN dba_hist_sqltext t ON t.dbid = :dbid AND t.sql_id = x.sql_id
+        WHERE x.rn_ela <= :top OR x.rn_cpu <= :top OR x.rn_gets <= :top OR x.rn_reads <= :top
+    """,
+}
+
+
+def _awr_pct(part, whole):
+    return round(100.0 * part / whole, 2) if whole else None
+
+
+def extract_awr_data(start_snap, end_snap, db: str = "DEFAULT", top_n: int = 20) -> dict:
+    """
+    Builds AWR sections for begin/end snapshots from DBA_HIST deltas: load_profile,
+    top_events, time_model, efficiency, host_cpu and sql_elapsed/sql_cpu/sql_gets/sql_reads
+    (with PLAN_HASH_VALUE and PLAN_COUNT). Same column names as parse_awr_report().
+    Raises ValueError if the range spans an instance restart, RuntimeError on query errors.
+    """
+    catalog = get_snapshot_catalog(db)
+    ids = catalog["snap_ids"]
+    lo, hi = bisect.bisect_left(ids, start_snap), bisect.bisect_left(ids, end_snap)
+    if lo >= len(ids) or hi >= len(ids) or ids[lo] != start_snap or ids[hi] != end_snap or lo >= hi:
+        raise ValueError(f"Snapshots {start_snap}-{end_snap} are not a valid range on {resolve_db_name(db)}")
+    if catalog["startups"][lo] != catalog["startups"][hi]:
+        raise ValueError(f"Snapshots {start_snap}-{end_snap} span an instance restart")
+    elapsed = (catalog["ends"][hi] - catalog["ends"][lo]).total_seconds() or 1.0
+
+    binds = {"dbid": catalog["dbid"], "inst": catalog["inst_num"], "b": start_snap, "e": end_snap}
+    stat_binds = {f"s{i}": name for i, name in enumerate(_AWR_SYSSTATS)}
+    statements = {
+        "sysstat": (_AWR_EXTRACT_SQL["sysstat"].format(names=", ".join(f":{k}" for k in stat_binds)), dict(binds, **stat_binds)),
+        "time_model": (_AWR_EXTRACT_SQL["time_model"], binds),
+        "events": (_AWR_EXTRACT_SQL["events"], binds),
+        "osstat": (_AWR_EXTRACT_SQL["osstat"], binds),
+        "sqlstat": (_AWR_EXTRACT_SQL["sqlstat"], dict(binds, top=top_n)),
+    }
+    results = run_oracle_batch(statements, db)
+    for key, res in results.items():
+        if isinstance(res, dict):
+            raise RuntimeError(f"AWR extraction ({key}) failed: {res.get('error')}")
+
+    stats = {r["STAT_NAME"]: float(r["DELTA"] or 0) for r in results["sysstat"]}
+    tm = {r["STAT_NAME"]: float(r["TIME_S"] or 0) for r in results["time_model"]}
+    db_time, db_cpu = tm.get("DB time", 0.0), tm.get("DB CPU", 0.0)
+    txns = (stats.get("user commits", 0) + stats.get("user rollbacks", 0)) or None
+    sections = {}
+
+    # Load profile
+    profile = [("DB Time(s)", db_time), ("DB CPU(s)", db_cpu), ("Background CPU(s)", tm.get("background cpu time", 0.0))]
+    profile += [(label, stats.get(name, 0.0)) for name, label in _AWR_SYSSTATS.items() if label]
+    profile.append(("Transactions", txns or 0.0))
+    sections["load_profile"] = pd.DataFrame(
+        [(m, round(v / elapsed, 2), round(v / txns, 2) if txns else None) for m, v in profile],
+        columns=["METRIC", "PER_SECOND", "PER_TRANSACTION"],
+    )
+
+    # Top events (DB CPU included like the AWR report's Top Events section)
+    events = pd.DataFrame(results["events"], columns=["EVENT_NAME", "WAIT_CLASS", "WAITS", "TIME_S"])
+    events = events.rename(columns={"EVENT_NAME": "EVENT"}).astype({"WAITS": float, "TIME_S": float})
+    events = pd.concat([events, pd.DataFrame([{"EVENT": "DB CPU", "WAIT_CLASS": "", "WAITS": None, "TIME_S": db_cpu}])],
+                       ignore_index=True)
+    events["AVG_WAIT_MS"] = (events["TIME_S"] * 1000 / events["WAITS"].where(events["WAITS"] > 0)).round(2)
+    events["PCT_DB_TIME"] = (events["TIME_S"] * 100 / db_time).round(2) if db_time else None
+    sections["top_events"] = events.sort_values("TIME_S", ascending=False).head(top_n)[
+        ["EVENT", "WAITS", "TIME_S", "AVG_WAIT_MS", "PCT_DB_TIME", "WAIT_CLASS"]].reset_index(drop=True)
+
+    # Time model
+    time_model = pd.DataFrame(sorted(tm.items(), key=lambda kv: -kv[1]), columns=["STATISTIC", "TIME_S"])
+    time_model["PCT_DB_TIME"] = (time_model["TIME_S"] * 100 / db_time).round(2) if db_time else None
+    sections["time_model"] = time_model
+
+    # Instance efficiency
+    parses, hard = stats.get("parse count (total)", 0), stats.get("parse count (hard)", 0)
+    sorts_mem, sorts_disk = stats.get("sorts (memory)", 0), stats.get("sorts (disk)", 0)
+    efficiency = [
+        ("Buffer Hit %", _awr_pct(stats.get("session logical reads", 0) - stats.get("physical reads cache", 0),
+                                  stats.get("session logical reads", 0))),
+        ("In-memory Sort %", _awr_pct(sorts_mem, sorts_mem + sorts_disk)),
+        ("Soft Parse %", _awr_pct(parses - hard, parses)),
+        ("Execute to Parse %", _awr_pct(stats.get("execute count", 0) - parses, stats.get("execute count", 0))),
+        ("Parse CPU to Parse Elapsd %", _awr_pct(stats.get("parse time cpu", 0), stats.get("parse time elapsed", 0))),
+        ("Redo NoWait %", _awr_pct(stats.get("redo entries", 0) - stats.get("redo log space requests", 0),
+                                   stats.get("redo entries", 0))),
+        # parse time cpu is in centiseconds, DB CPU in seconds
+        ("% Non-Parse CPU", _awr_pct(db_cpu - stats.get("parse time cpu", 0) / 100, db_cpu)),
+    ]
+    sections["efficiency"] = pd.DataFrame([e for e in efficiency if e[1] is not None], columns=["METRIC", "VALUE"])
+
+    # Host CPU (OS times are cumulative centiseconds; NUM_CPUS and LOAD are gauges)
+    os_rows = {r["STAT_NAME"]: r for r in results["osstat"]}
+    os_delta = {k: float(r["END_VALUE"] or 0) - float(r["BEGIN_VALUE"] or 0) for k, r in os_rows.items()}
+    os_total = os_delta.get("BUSY_TIME", 0) + os_delta.get("IDLE_TIME", 0)
+    host = [("NUM_CPUS", os_rows.get("NUM_CPUS", {}).get("END_VALUE")),
+            ("Load Begin", os_rows.get("LOAD", {}).get("BEGIN_VALUE")),
+            ("Load End", os_rows.get("LOAD", {}).get("END_VALUE")),
+            ("%User", _awr_pct(os_delta.get("USER_TIME", 0), os_total)),
+            ("%System", _awr_pct(os_delta.get("SYS_TIME", 0), os_total)),
+            ("%WIO", _awr_pct(os_delta.get("IOWAIT_TIME", 0), os_total)),
+            ("%Idle", _awr_pct(os_delta.get("IDLE_TIME", 0), os_total))]
+    sections["host_cpu"] = pd.DataFrame([(m, float(v)) for m, v in host if v is not None], columns=["METRIC", "VALUE"])
+
+    # SQL ordered by Elapsed / CPU / Gets / Reads
+    sql = pd.DataFrame(results["sqlstat"])
+    if not sql.empty:
+        sql = sql.drop_duplicates("SQL_ID")  # one sqltext row per container in a CDB
+        for col in ("EXECUTIONS", "ELAPSED_S", "CPU_S", "IOWAIT_S", "BUFFER_GETS", "PHYSICAL_READS"):
+            sql[col] = sql[col].astype(float)
+        execs = sql["EXECUTIONS"].where(sql["EXECUTIONS"] > 0)
+        sql["ELAPSED_PER_EXEC_S"] = (sql["ELAPSED_S"] / execs).round(4)
+        sql["CPU_PER_EXEC_S"] = (sql["CPU_S"] / execs).round(4)
+        sql["GETS_PER_EXEC"] = (sql["BUFFER_GETS"] / execs).round(1)
+        sql["READS_PER_EXEC"] = (sql["PHYSICAL_READS"] / execs).round(1)
+        elapsed_nonzero = sql["ELAPSED_S"].where(sql["ELAPSED_S"] > 0)
+        sql["PCT_CPU"] = (sql["CPU_S"] * 100 / elapsed_nonzero).round(1)
+        sql["PCT_IO"] = (sql["IOWAIT_S"] * 100 / elapsed_nonzero).round(1)
+        base_cols = ["SQL_ID", "PLAN_HASH_VALUE", "PLAN_COUNT", "EXECUTIONS"]
+        orderings = {
+            "sql_elapsed": ("RN_ELA", "ELAPSED_S", db_time, ["ELAPSED_S", "ELAPSED_PER_EXEC_S"]),
+            "sql_cpu": ("RN_CPU", "CPU_S", db_cpu, ["CPU_S", "CPU_PER_EXEC_S", "ELAPSED_S"]),
+            "sql_gets": ("RN_GETS", "BUFFER_GETS", stats.get("session logical reads", 0), ["BUFFER_GETS", "GETS_PER_EXEC", "ELAPSED_S"]),
+            "sql_reads": ("RN_READS", "PHYSICAL_READS", stats.get("physical reads", 0), ["PHYSICAL_READS", "READS_PER_EXEC", "ELAPSED_S"]),
+        }
+        for key, (rank_col, metric, total, cols) in orderings.items():
+            part = sql[sql[rank_col] <= top_n].sort_values(rank_col)
+            part = part.assign(PCT_TOTAL=(part[metric] * 100 / total).round(2) if total else None)
+            sections[key] = part[base_cols + cols + ["PCT_TOTAL", "PCT_CPU", "PCT_IO", "MODULE", "SQL_TEXT"]].reset_index(drop=True)
+    return sections
+
+
 def analyze_awr_report(html_content: str, custom_prompt: str = None):
     if len(html_content) > 100_000: html_content = html_content[:100_000] + "..."
     user_message = custom_prompt or "Analyze this report and give performance tuning summary."
@@ -225,27 +1280,15 @@ def analyze_awr_report(html_content: str, custom_prompt: str = None):
         return {"status": "ok", "analysis": response}
     except Exception as e:
         return {"status": "error", "message": str(e)}
-def compare_awr_reports(report1_html: str, report2_html: str, label1: str = "Baseline", label2: str = "Current"):
-    import traceback
-    print("--- [DEBUG] Starting Compare AWR ---")    
-    def clean_html_content(html_content, max_chars=60000):
-        try:
-            print(f"--- [DEBUG] Cleaning HTML (Size: {len(html_content)} chars) ---")
-            soup = BeautifulSoup(html_content, "html.parser")
-            # get_text with separator ensures tables don't mash together
-            text = soup.get_text(separator="\n")
-            # Remove excessive whitespace
-            clean_text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
-            print(f"--- [DEBUG] Cleaned Text Size: {len(clean_text)} chars ---")
-            return clean_text[:max_chars]
-        except Exception:
-            print(f"--- [DEBUG] HTML Parsing Error: {e} ---")
-            return html_content[:max_chars] # Fallback
-
-    r1_text = clean_html_content(report1_html)
-    r2_text = clean_html_content(report2_html)
-    print("--- [DEBUG] Initializing Agent ---")
-    # --- FIX END ---
+def compare_awr_sections(base_sections: dict, target_sections: dict, label1: str = "Baseline", label2: str = "Current",
+                         thresholds: dict = None):
+    """
+    Diffs two parsed reports locally (diff_awr_sections) and makes a single LLM call that
+    explains only the compact delta table. Returns {"status", "comparison", "diff"}.
+    """
+    diff = diff_awr_sections(base_sections, target_sections, thresholds)
+    delta_text = awr_diff_to_text(diff)
+    print(f"--- [DEBUG] AWR diff: {len(diff)} rows, {int(diff['REGRESSION'].sum())} regressions, {len(delta_text)} chars ---")
 
     llm_config = {
         "config_list": [{"model": "gpt-4o-mini", "api_key": os.getenv("OPENAI_API_KEY")}],
@@ -259,6 +1302,8 @@ def compare_awr_reports(report1_html: str, report2_html: str, label1: str = "Bas
         system_message="""
 You are a **Forensic Database Analyst**.
 Compare two AWR periods and produce a **Differential Analysis Report** focusing on regressions.
+You receive a delta table computed from the two reports. Use ONLY its numbers: never compute,
+estimate or invent a delta that is not in the table.
 
 ### 🎨 Presentation Style
 * **Side-by-Side Comparison:** Use Markdown tables with columns for Baseline, Current, and **Delta**.
@@ -304,74 +1349,461 @@ Compare two AWR periods and produce a **Differential Analysis Report** focusing
 <summary>🕵️ <b>Technical Root Cause Analysis</b></summary>
 * **[SQL_ID]:** Execution count increased by [X]x. Plan hash changed from [Old] to [New].
 </details>
+
+## ✅ Recommendations
+1. [Actionable step tied to a flagged regression] (max 5)
 """,
         human_input_mode="NEVER",
     )
 
     prompt = f"""
-COMPARE THESE TWO ORACLE AWR REPORT PERIODS.
-
-BASELINE PERIOD ({label1}):
-{r1_text}
+EXPLAIN THE DIFFERENCES BETWEEN THESE TWO ORACLE AWR PERIODS.
+BASELINE: {label1}
+CURRENT: {label2}
 
-CURRENT PERIOD ({label2}):
-{r2_text}
+Delta table (BASELINE/TARGET are per-second rates for load_profile, % DB time for events and
+time model, per-execution values for SQL; REGRESSION rows exceeded the configured thresholds):
+{delta_text}
 
-Follow the exact structure above. Focus on Wait Events, Top SQL by Elapsed Time, and Load Profile.
+Follow the exact structure above. Focus on the flagged regressions.
 """
 
     try:
-        print("--- [DEBUG] Sending to LLM... ---")
+        print("--- [DEBUG] Sending delta table to LLM... ---")
         response = comparator.generate_reply([{"role": "user", "content": prompt}])
-        print(f"--- [DEBUG] LLM Response Received (Type: {type(response)}) ---")
-        # Safety check: Ensure we got a string back
         if not response:
-            return {"status": "error", "message": "AI returned empty response."}
-            
-        return {"status": "ok", "comparison": str(response)}
+            return {"status": "error", "message": "AI returned empty response.", "diff": diff}
+        return {"status": "ok", "comparison": str(response), "diff": diff}
     except Exception as e:
         print(f"--- [DEBUG] CRITICAL FAILURE: {e} ---")
-        return {"status": "error", "message": f"Comparison failed: {str(e)}"}
+        return {"status": "error", "message": f"Comparison failed: {str(e)}", "diff": diff}
+
+
+def compare_awr_reports(report1_html: str, report2_html: str, label1: str = "Baseline", label2: str = "Current",
+                        thresholds: dict = None):
+    """Parses both AWR HTML reports and compares them with compare_awr_sections."""
+    print("--- [DEBUG] Starting Compare AWR ---")
+    try:
+        base_sections = parse_awr_report(report1_html)
+        target_sections = parse_awr_report(report2_html)
+    except Exception as e:
+        return {"status": "error", "message": f"Could not parse AWR reports: {e}"}
+    if not set(base_sections) & set(target_sections):
+        return {"status": "error", "message": "No comparable sections found in the two AWR reports."}
+    return compare_awr_sections(base_sections, target_sections, label1, label2, thresholds)
+
+# ==========================================
+# SQL METADATA CACHE
+# ==========================================
+# SQL_ID -> text, plan hash values, module and parsing schema, kept per database in a
+# small LRU. Misses are resolved together: shared pool and AWR lookups for every
+# missing SQL_ID go out as one batch of IN-list queries (chunked at Oracle's 1000-item
+# limit), so a top-SQL table costs at most one round trip however many rows it has.
+SQL_META_CACHE_SIZE = int(os.getenv("SQL_META_CACHE_SIZE", "5000"))
+SQL_META_TTL = int(os.getenv("SQL_META_TTL", "3600"))  # seconds; plan hashes drift over time
+SQL_META_TEXT_CHARS = 1000
+_SQL_META_IN_LIMIT = 1000
+_SQL_META_SQL = {
+    "pool": """
+        SELECT sql_id, plan_hash_value, module, parsing_schema_name, SUBSTR(sql_text, 1, {chars}) AS sql_text
+        FROM gv$sqlarea WHERE sql_id IN ({ids})
+    """,
+    "awr_text": """
+        SELECT sql_id, DBMS_LOB.SUBSTR(sql_text, {chars}, 1) AS sql_text
+        FROM dba_hist_sqltext WHERE dbid = :dbid AND sql_id IN ({ids})
+    """,
+    "awr_plans": """
+        SELECT DISTINCT sql_id, plan_hash_value, module, parsing_schema_name
+        FROM dba_hist_sqlstat WHERE dbid = :dbid AND sql_id IN ({ids})
+    """,
+}
+_sql_meta_caches = {}  # DB name -> (pool signature, OrderedDict sql_id -> (cached_at, metadata))
+_sql_meta_lock = threading.Lock()
+
+
+def _sql_meta_cache_for(name: str) -> OrderedDict:
+    signature = _pool_signature(DB_CONFIG[name])
+    entry = _sql_meta_caches.get(name)
+    if entry is None or entry[0] != signature:
+        entry = _sql_meta_caches[name] = (signature, OrderedDict())
+    return entry[1]
+
+
+def _fetch_sql_metadata(name: str, sql_ids: list) -> dict:
+    """Resolves SQL_IDs from GV$SQLAREA and AWR in one batch. Statements that fail are skipped."""
+    dbid, _ = get_db_identity(name)
+    statements = {}
+    for n, start in enumerate(range(0, len(sql_ids), _SQL_META_IN_LIMIT)):
+        binds = {f"id{i}": sql_id for i, sql_id in enumerate(sql_ids[start:start + _SQL_META_IN_LIMIT])}
+        ids = ", ".join(":" + k for k in binds)
+        for key, sql in _SQL_META_SQL.items():
+            params = dict(binds, dbid=dbid) if ":dbid" in sql else binds
+            statements[f"{key}_{n}"] = (sql.format(ids=ids, chars=SQL_META_TEXT_CHARS), params)
+    results = run_oracle_batch(statements, name)
+
+    meta = {}
+    for key, rows in results.items():
+        if isinstance(rows, dict):
+            print(f"[DEBUG] SQL metadata lookup {key} failed on {name}: {rows.get('error')}")
+            continue
+        for r in rows:
+            m = meta.setdefault(r["SQL_ID"], {"SQL_TEXT": None, "PLAN_HASH_VALUES": set(),
+                                             "MODULE": None, "PARSING_SCHEMA_NAME": None})
+            if r.get("SQL_TEXT") and not m["SQL_TEXT"]:
+                m["SQL_TEXT"] = r["SQL_TEXT"]
+            if r.get("PLAN_HASH_VALUE"):
+                m["PLAN_HASH_VALUES"].add(int(r["PLAN_HASH_VALUE"]))
+            m["MODULE"] = m["MODULE"] or r.get("MODULE")
+            m["PARSING_SCHEMA_NAME"] = m["PARSING_SCHEMA_NAME"] or r.get("PARSING_SCHEMA_NAME")
+    for m in meta.values():
+        m["PLAN_HASH_VALUES"] = sorted(m["PLAN_HASH_VALUES"])
+    return meta
+
+
+def lookup_sql_metadata(sql_ids, db: str = "DEFAULT") -> dict:
+    """
+    Returns {sql_id: {"SQL_TEXT", "PLAN_HASH_VALUES", "MODULE", "PARSING_SCHEMA_NAME"}}
+    for the SQL_IDs that could be resolved (SQL_TEXT is truncated to SQL_META_TEXT_CHARS).
+    Cached entries are served locally; all misses are fetched in one batch.
+    """
+    name = resolve_db_name(db)
+    ids = list(dict.fromkeys(str(i).strip() for i in sql_ids if i))
+    now = time.time()
+    found, missing = {}, []
+    with _sql_meta_lock:
+        cache = _sql_meta_cache_for(name)
+        for sql_id in ids:
+            hit = cache.get(sql_id)
+            if hit and now - hit[0] < SQL_META_TTL:
+                cache.move_to_end(sql_id)
+                found[sql_id] = hit[1]
+            else:
+                missing.append(sql_id)
+    if missing:
+        fetched = _fetch_sql_metadata(name, missing)
+        with _sql_meta_lock:
+            cache = _sql_meta_cache_for(name)
+            for sql_id, meta in fetched.items():
+                cache[sql_id] = (now, meta)
+                cache.move_to_end(sql_id)
+            while len(cache) > SQL_META_CACHE_SIZE:
+                cache.popitem(last=False)
+        found.update(fetched)
+    return found
+
+
+# ==========================================
+# PLAN REGRESSION SCANNER
+# ==========================================
+# One columnar fetch of DBA_HIST_SQLSTAT for the window, aggregated per
+# (SQL_ID, PLAN_HASH_VALUE) in pandas. For every SQL with more than one plan, the
+# plan seen most recently is compared with the best other plan (lowest elapsed per
+# execution) and flagged when elapsed, CPU or buffer gets per execution degraded.
+PLAN_REGRESSION_PCT = float(os.getenv("PLAN_REGRESSION_PCT", "50"))          # % worse per execution
+PLAN_REGRESSION_MIN_EXECS = int(os.getenv("PLAN_REGRESSION_MIN_EXECS", "5"))  # per plan, both sides
+PLAN_REGRESSION_COLUMNS = [
+    "SQL_ID", "SCHEMA", "MODULE", "PLANS", "BASELINE_PLAN", "CURRENT_PLAN", "PLAN_CHANGED_AT",
+    "BASE_ELAPSED_MS", "CUR_ELAPSED_MS", "ELAPSED_RATIO", "BASE_CPU_MS", "CUR_CPU_MS", "CPU_RATIO",
+    "BASE_GETS", "CUR_GETS", "GETS_RATIO", "CUR_EXECS", "EXTRA_DB_TIME_S", "DEGRADED", "SQL_TEXT",
+]
+_PLAN_SCAN_SQL = """
+SELECT h.sql_id, h.plan_hash_value, CAST(s.end_interval_time AS DATE) AS end_time,
+       h.executions_delta AS execs, h.elapsed_time_delta AS elapsed_us, h.cpu_time_delta AS cpu_us,
+       h.buffer_gets_delta AS gets, h.parsing_schema_name AS schema_name, h.module
+FROM dba_hist_sqlstat h
+JOIN dba_hist_snapshot s
+  ON s.dbid = h.dbid AND s.snap_id = h.snap_id AND s.instance_number = h.instance_number
+WHERE h.dbid = :dbid
+  AND s.end_interval_time >= SYSDATE - :days
+  AND h.executions_delta > 0
+  AND h.plan_hash_value <> 0
+"""
+
+
+def scan_plan_regressions(db: str = "DEFAULT", days: float = 7, threshold_pct: float = None,
+                          min_execs: int = None, top_n: int = 50) -> pd.DataFrame:
+    """
+    Flags SQL whose latest plan is slower per execution than its best other plan over
+    the last `days` days. Returns PLAN_REGRESSION_COLUMNS ranked by EXTRA_DB_TIME_S
+    (extra elapsed seconds the current plan cost over its executions), with SQL_TEXT
+    from the SQL metadata cache. Raises on error.
+    """
+    threshold = 1 + (PLAN_REGRESSION_PCT if threshold_pct is None else threshold_pct) / 100.0
+    min_execs = PLAN_REGRESSION_MIN_EXECS if min_execs is None else min_execs
+    dbid, _ = get_db_identity(db)
+    df = fetch_oracle_dataframe(_PLAN_SCAN_SQL, db, params={"dbid": dbid, "days": days})
+    if df.empty:
+        return pd.DataFrame(columns=PLAN_REGRESSION_COLUMNS)
+    df.columns = [c.upper() for c in df.columns]
+
+    plans = df.groupby(["SQL_ID", "PLAN_HASH_VALUE"], sort=False).agg(
+        EXECS=("EXECS", "sum"), ELAPSED_US=("ELAPSED_US", "sum"), CPU_US=("CPU_US", "sum"),
+        GETS=("GETS", "sum"), FIRST_SEEN=("END_TIME", "min"), LAST_SEEN=("END_TIME", "max"),
+        SCHEMA=("SCHEMA_NAME", "first"), MODULE=("MODULE", "first"),
+    ).reset_index()
+    plans["PLANS"] = plans.groupby("SQL_ID")["PLAN_HASH_VALUE"].transform("size")
+    plans = plans[plans["PLANS"] > 1]
+    if plans.empty:
+        return pd.DataFrame(columns=PLAN_REGRESSION_COLUMNS)
+    execs = plans["EXECS"].astype(float)
+    plans["ELAPSED_MS"] = plans["ELAPSED_US"] / execs / 1000
+    plans["CPU_MS"] = plans["CPU_US"] / execs / 1000
+    plans["GETS_PER_EXEC"] = plans["GETS"] / execs
+
+    # Current plan: the one seen last. Baseline: the fastest other plan with enough executions.
+    plans = plans.sort_values(["SQL_ID", "LAST_SEEN", "EXECS"])
+    current = plans.drop_duplicates("SQL_ID", keep="last")
+    others = plans.drop(current.index)
+    baseline = (others[others["EXECS"] >= min_execs]
+                .sort_values(["SQL_ID", "ELAPSED_MS"])
+                .drop_duplicates("SQL_ID", keep="first"))
+    cmp = current[current["EXECS"] >= min_execs].merge(baseline, on="SQL_ID", suffixes=("_CUR", "_BASE"))
+    if cmp.empty:
+        return pd.DataFrame(columns=PLAN_REGRESSION_COLUMNS)
+
+    ratios = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for label, col in (("ELAPSED", "ELAPSED_MS"), ("CPU", "CPU_MS"), ("GETS", "GETS_PER_EXEC")):
+            ratios[label] = (cmp[f"{col}_CUR"] / cmp[f"{col}_BASE"]).replace([np.inf, -np.inf], np.nan)
+    flags = pd.DataFrame({k: (v >= threshold).fillna(False) for k, v in ratios.items()})
+    degraded = flags.any(axis=1)
+
+    out = pd.DataFrame({
+        "SQL_ID": cmp["SQL_ID"],
+        "SCHEMA": cmp["SCHEMA_CUR"],
+        "MODULE": cmp["MODULE_CUR"],
+        "PLANS": cmp["PLANS_CUR"],
+        "BASELINE_PLAN": cmp["PLAN_HASH_VALUE_BASE"].astype("int64"),
+        "CURRENT_PLAN": cmp["PLAN_HASH_VALUE_CUR"].astype("int64"),
+        "PLAN_CHANGED_AT": cmp["FIRST_SEEN_CUR"],
+        "BASE_ELAPSED_MS": cmp["ELAPSED_MS_BASE"].round(2),
+        "CUR_ELAPSED_MS": cmp["ELAPSED_MS_CUR"].round(2),
+        "ELAPSED_RATIO": ratios["ELAPSED"].round(2),
+        "BASE_CPU_MS": cmp["CPU_MS_BASE"].round(2),
+        "CUR_CPU_MS": cmp["CPU_MS_CUR"].round(2),
+        "CPU_RATIO": ratios["CPU"].round(2),
+        "BASE_GETS": cmp["GETS_PER_EXEC_BASE"].round(1),
+        "CUR_GETS": cmp["GETS_PER_EXEC_CUR"].round(1),
+        "GETS_RATIO": ratios["GETS"].round(2),
+        "CUR_EXECS": cmp["EXECS_CUR"].astype("int64"),
+        "EXTRA_DB_TIME_S": ((cmp["ELAPSED_MS_CUR"] - cmp["ELAPSED_MS_BASE"]) * cmp["EXECS_CUR"] / 1000).round(1),
+        "DEGRADED": [", ".join(k for k, hit in zip(flags.columns, row) if hit) for row in flags.itertuples(index=False)],
+    })[degraded.to_numpy()]
+    out = out.sort_values("EXTRA_DB_TIME_S", ascending=False)
+    out = (out.head(top_n) if top_n else out).reset_index(drop=True)
+    meta = lookup_sql_metadata(out["SQL_ID"], db)
+    out["SQL_TEXT"] = out["SQL_ID"].map(lambda sql_id: meta.get(sql_id, {}).get("SQL_TEXT"))
+    return out
+
+
+# ==========================================
+# SNAPSHOT CATALOG
+# ==========================================
+# Per-database copy of DBA_HIST_SNAPSHOT for the connected instance. It is refreshed
+# incrementally (only snap_ids above the last one seen), so resolving a time range to
+# snapshots is a local bisect instead of several MIN/MAX queries per request.
+SNAPSHOT_CATALOG_TTL = int(os.getenv("SNAPSHOT_CATALOG_TTL", "60"))  # seconds between refreshes
+_snapshot_catalogs = {}  # DB name -> catalog dict, see _new_snapshot_catalog
+_snapshot_catalog_lock = threading.Lock()
+
+
+def _new_snapshot_catalog(signature, dbid, inst_num) -> dict:
+    return {
+        "signature": signature,
+        "dbid": dbid,
+        "inst_num": inst_num,
+        "snap_ids": [],
+        "begins": [],
+        "ends": [],
+        "startups": [],
+        "clock_offset": timedelta(0),  # DB SYSDATE minus local clock at last refresh
+        "refreshed_at": 0.0,           # time.monotonic() of last refresh
+        "lock": threading.Lock(),
+    }
+
+
+def _refresh_snapshot_catalog(name: str, catalog: dict):
+    """Fetches snapshots newer than the last cached one, plus MIN/MAX snap_id and SYSDATE, in one batch."""
+    binds = {"dbid": catalog["dbid"], "inst": catalog["inst_num"]}
+    last = catalog["snap_ids"][-1] if catalog["snap_ids"] else -1
+    results = run_oracle_batch({
+        "new": ("""
+            SELECT snap_id,
+                   CAST(begin_interval_time AS DATE) AS begin_time,
+                   CAST(end_interval_time AS DATE) AS end_time,
+                   CAST(startup_time AS DATE) AS startup_time
+            FROM dba_hist_snapshot
+            WHERE dbid = :dbid AND instance_number = :inst AND snap_id > :last
+            ORDER BY snap_id
+        """, dict(binds, last=last)),
+        "bounds": ("""
+            SELECT MIN(snap_id) AS min_snap, MAX(snap_id) AS max_snap, SYSDATE AS db_now
+            FROM dba_hist_snapshot
+            WHERE dbid = :dbid AND instance_number = :inst
+        """, binds),
+    }, name)
+    new_rows, bounds = results["new"], results["bounds"]
+    if isinstance(new_rows, dict) or isinstance(bounds, dict) or not bounds:
+        error = new_rows.get("error") if isinstance(new_rows, dict) else bounds
+        raise RuntimeError(f"Snapshot catalog refresh failed for {name}: {error}")
+
+    min_snap, max_snap, db_now = bounds[0]["MIN_SNAP"], bounds[0]["MAX_SNAP"], bounds[0]["DB_NOW"]
+    ids = catalog["snap_ids"]
+    if ids and (min_snap is None or min_snap < ids[0] or max_snap < ids[-1]):
+        # Repository was dropped/re-imported under us: start over
+        for key in ("snap_ids", "begins", "ends", "startups"):
+            catalog[key].clear()
+        return _refresh_snapshot_catalog(name, catalog)
+
+    if ids and min_snap > ids[0]:
+        # Purged by AWR retention
+        cut = bisect.bisect_left(ids, min_snap)
+        for key in ("snap_ids", "begins", "ends", "startups"):
+            del catalog[key][:cut]
+
+    for row in new_rows:
+        catalog["snap_ids"].append(int(row["SNAP_ID"]))
+        catalog["begins"].append(row["BEGIN_TIME"])
+        catalog["ends"].append(row["END_TIME"])
+        catalog["startups"].append(row["STARTUP_TIME"])
+    if db_now:
+        catalog["clock_offset"] = db_now - datetime.now()
+    catalog["refreshed_at"] = time.monotonic()
+    print(f"[DEBUG] Snapshot catalog {name}: +{len(new_rows)} snaps, {len(catalog['snap_ids'])} cached")
+
+
+def get_snapshot_catalog(db: str = "DEFAULT", max_age: float = None) -> dict:
+    """
+    Returns the snapshot catalog for a DB_CONFIG entry, refreshing it when it is older
+    than max_age seconds (SNAPSHOT_CATALOG_TTL by default). Raises if it cannot be loaded.
+    """
+    name = resolve_db_name(db)
+    signature = _pool_signature(DB_CONFIG[name])
+    max_age = SNAPSHOT_CATALOG_TTL if max_age is None else max_age
+
+    with _snapshot_catalog_lock:
+        catalog = _snapshot_catalogs.get(name)
+        if catalog is None or catalog["signature"] != signature:
+            dbid, inst_num = get_db_identity(name)
+            catalog = _new_snapshot_catalog(signature, dbid, inst_num)
+            _snapshot_catalogs[name] = catalog
+
+    with catalog["lock"]:
+        if not catalog["snap_ids"] or time.monotonic() - catalog["refreshed_at"] > max_age:
+            try:
+                _refresh_snapshot_catalog(name, catalog)
+            except Exception:
+                if not catalog["snap_ids"]:
+                    raise
+                print(f"[DEBUG] Snapshot catalog refresh failed for {name}, serving cached snapshots")
+    return catalog
+
+
+def get_db_now(db: str = "DEFAULT") -> datetime:
+    """Database server time (SYSDATE), estimated from the clock offset seen at the last catalog refresh."""
+    return datetime.now() + get_snapshot_catalog(db)["clock_offset"]
+
+
+def _clamp_to_last_startup(catalog: dict, lo: int, hi: int):
+    """
+    AWR cannot report across an instance restart. If snapshots lo..hi (catalog indexes)
+    span one, moves lo to the first snapshot after the latest restart in the range.
+    Returns (lo, restart_time or None).
+    """
+    startups = catalog["startups"]
+    if startups[lo] == startups[hi]:
+        return lo, None
+    k = hi
+    while k > lo and startups[k - 1] == startups[hi]:
+        k -= 1
+    return k, startups[hi]
+
+
+def _nearest_end(ends: list, t: datetime) -> int:
+    """Index of the snapshot whose end time is closest to t."""
+    i = bisect.bisect_left(ends, t)
+    if i == len(ends):
+        return i - 1
+    if i > 0 and t - ends[i - 1] <= ends[i] - t:
+        return i - 1
+    return i
+
+
+def find_snapshot_range(db: str, begin_time: datetime, end_time: datetime = None, covering: bool = False,
+                        nearest: bool = False) -> dict:
+    """
+    Resolves a time window to AWR snapshots using the local catalog.
+
+    covering=False: snapshots whose interval lies fully inside [begin_time, end_time].
+    covering=True:  from the last snapshot ending at or before begin_time (oldest available
+                    if none) up to the last snapshot ending at or before end_time.
+    nearest=True:   the snapshots ending closest to begin_time and end_time, i.e. the AWR
+                    begin/end snaps for a window given in whole snapshot intervals (10:00-11:00
+                    with snapshots at HH:00:04 gives the one interval 10:00:04-11:00:04).
+    end_time defaults to the database's current time.
+
+    Returns {"start_snap", "end_snap", "restarted_at"} (snaps are None if nothing matches).
+    restarted_at is set when the window spanned an instance restart and the start was
+    moved forward to the first snapshot of the latest instance incarnation.
+    """
+    catalog = get_snapshot_catalog(db)
+    ids, begins, ends = catalog["snap_ids"], catalog["begins"], catalog["ends"]
+    result = {"start_snap": None, "end_snap": None, "restarted_at": None}
+    if not ids:
+        return result
+    if end_time is None:
+        end_time = datetime.now() + catalog["clock_offset"]
+
+    if nearest:
+        lo, hi = _nearest_end(ends, begin_time), _nearest_end(ends, end_time)
+        if lo == hi:  # window shorter than one snapshot interval
+            return result
+    else:
+        hi = bisect.bisect_right(ends, end_time) - 1
+        if covering:
+            lo = max(bisect.bisect_right(ends, begin_time) - 1, 0)
+        else:
+            lo = bisect.bisect_left(begins, begin_time)
+        if hi < 0 or lo > hi:
+            return result
+
+    lo, restarted_at = _clamp_to_last_startup(catalog, lo, hi)
+    result.update(start_snap=ids[lo], end_snap=ids[hi], restarted_at=restarted_at)
+    return result
+
+
 def get_snapshots_for_time(hours_back: float = 3.0, db: str = "DEFAULT"):
     """
     Returns (start_snap, end_snap) covering the full duration.
-    Uses SYSDATE to calculate the target start time relative to Server Time.
+    Uses the database clock (SYSDATE) to calculate the target start time.
     """
     try:
         val = float(hours_back)
     except:
         val = 1.0
 
-    print(f"[DEBUG] Fetching snapshots for last {val} hours on {db}")
-
-    # 1. Get the LATEST Snapshot (End Point)
-    sql_end = "SELECT MAX(snap_id) FROM dba_hist_snapshot"
-    rows_end = run_oracle_query(sql_end, db)
-    if not rows_end or not rows_end[0].get('MAX(SNAP_ID)'):
+    print(f"[DEBUG] Resolving snapshots for last {val} hours on {db}")
+    try:
+        catalog = get_snapshot_catalog(db)
+    except Exception as e:
+        print(f"[DEBUG] {e}")
+        return None, None
+    if not catalog["snap_ids"]:
         return None, None
-    end_snap = rows_end[0]['MAX(SNAP_ID)']
-
-    # 2. Get the START Snapshot (Closest to Now - Hours)
-    # We find the snapshot that ended just before our target start time.
-    sql_start = f"""
-    SELECT MAX(snap_id) 
-    FROM dba_hist_snapshot 
-    WHERE end_interval_time <= (SYSDATE - ({int(val)}/24))
-    """
-    rows_start = run_oracle_query(sql_start, db)
-    start_snap = rows_start[0].get('MAX(SNAP_ID)')
-
-    # 3. Fallback: If DB was restarted or no history that far back, take the oldest available
-    if not start_snap:
-        print("[DEBUG] No snapshot found older than target. Using oldest available.")
-        sql_min = "SELECT MIN(snap_id) FROM dba_hist_snapshot"
-        rows_min = run_oracle_query(sql_min, db)
-        start_snap = rows_min[0].get('MIN(SNAP_ID)')
-
-    # 4. Safety: Start must be < End
+
+    db_now = datetime.now() + catalog["clock_offset"]
+    # End at the latest snapshot; start at the snapshot that ended just before the target start
+    rng = find_snapshot_range(db, db_now - timedelta(hours=val), datetime.max, covering=True)
+    start_snap, end_snap = rng["start_snap"], rng["end_snap"]
+    if rng["restarted_at"]:
+        print(f"[DEBUG] Instance restarted at {rng['restarted_at']}; range starts after the restart")
+
+    # Safety: Start must be < End
     if start_snap and end_snap and start_snap >= end_snap:
         # If collision (e.g. asking for 5 mins ago but snaps are 15 mins), just grab previous one
-        start_snap = end_snap - 1
+        idx = catalog["snap_ids"].index(end_snap)
+        if idx > 0 and catalog["startups"][idx - 1] == catalog["startups"][idx]:
+            start_snap = catalog["snap_ids"][idx - 1]
 
     print(f"[DEBUG] Final Range: {start_snap} -> {end_snap}")
 
@@ -396,14 +1828,474 @@ def get_snapshots_for_time(hours_back: float = 3.0, db: str = "DEFAULT"):
 #     if rows and len(rows) > 0:
 #         return rows[0].get("START_SNAP"), rows[0].get("END_SNAP")
 #     return None, None
+# ==========================================
+# ASH SAMPLER
+# ==========================================
+# Per-database background sampler: pulls only new GV$ACTIVE_SESSION_HISTORY rows
+# (SAMPLE_ID above the last one seen, per instance) every ASH_POLL_SECONDS into a
+# bounded columnar ring buffer (one NumPy array per column). Top SQL / event /
+# session / wait class breakdowns over any recent sub-window are then computed
+# locally. A sampler stops itself after ASH_IDLE_STOP_SECONDS without readers.
+ASH_POLL_SECONDS = float(os.getenv("ASH_POLL_SECONDS", "5"))
+ASH_BUFFER_ROWS = int(os.getenv("ASH_BUFFER_ROWS", "200000"))
+ASH_WINDOW_SECONDS = int(os.getenv("ASH_WINDOW_SECONDS", "900"))    # history kept / backfilled
+ASH_IDLE_STOP_SECONDS = int(os.getenv("ASH_IDLE_STOP_SECONDS", "600"))
+# ASH column -> ring buffer dtype (nullable numbers are float64 so NULL becomes NaN)
+ASH_COLUMNS = {
+    "INST_ID": "int64", "SAMPLE_ID": "int64", "SAMPLE_TIME": "datetime64[us]",
+    "SESSION_ID": "int64", "SESSION_SERIAL#": "int64", "SQL_ID": "object",
+    "SQL_PLAN_HASH_VALUE": "float64", "SQL_EXEC_ID": "float64", "SESSION_STATE": "object",
+    "EVENT": "object", "WAIT_CLASS": "object", "BLOCKING_SESSION": "float64", "BLOCKING_INST_ID": "float64",
+    "DELTA_READ_IO_REQUESTS": "float64", "DELTA_WRITE_IO_REQUESTS": "float64",
+    "DELTA_READ_IO_BYTES": "float64", "DELTA_WRITE_IO_BYTES": "float64",
+    "PGA_ALLOCATED": "float64", "TEMP_SPACE_ALLOCATED": "float64", "MODULE": "object",
+}
+ASH_GROUPINGS = {
+    "sql": ["SQL_ID"],
+    "event": ["EVENT", "WAIT_CLASS"],
+    "session": ["INST_ID", "SESSION_ID", "SESSION_SERIAL#"],
+    "wait_class": ["WAIT_CLASS"],
+}
+_ash_samplers = {}  # DB name -> sampler state dict, see _new_ash_state
+_ash_registry_lock = threading.Lock()
+
+
+def _new_ash_state(signature) -> dict:
+    return {
+        "signature": signature,
+        "lock": threading.Lock(),
+        "poll_lock": threading.Lock(),
+        "cols": {c: np.empty(ASH_BUFFER_ROWS, dtype=t) for c, t in ASH_COLUMNS.items()},
+        "head": 0,                  # next write position
+        "size": 0,                  # valid rows
+        "last_sample_id": {},       # inst_id -> last SAMPLE_ID seen
+        "clock_offset": timedelta(0),
+        "polled_at": None,          # time.monotonic() of last successful poll
+        "last_access": time.monotonic(),
+        "error": None,
+        "thread": None,
+        "stop": threading.Event(),
+    }
+
+
+def _ash_poll(name: str, state: dict):
+    """One incremental pull (a single round trip); SYSDATE comes back even when ASH has no new rows."""
+    with state["poll_lock"]:
+        binds = {"window": ASH_WINDOW_SECONDS}
+        known = []
+        for i, (inst, last) in enumerate(sorted(state["last_sample_id"].items())):
+            binds[f"i{i}"], binds[f"s{i}"] = inst, last
+            known.append(f"(inst_id = :i{i} AND sample_id > :s{i})")
+        if known:
+            new_insts = ", ".join(f":i{i}" for i in range(len(known)))
+            filters = f"(inst_id NOT IN ({new_insts}) OR {' OR '.join(known)})"
+        else:
+            filters = "1 = 1"
+        cols = ", ".join(ASH_COLUMNS)
+        sql = f"""
+            SELECT SYSDATE AS db_now, a.*
+            FROM dual
+            LEFT JOIN (
+                SELECT {cols}
+                FROM gv$active_session_history
+                WHERE sample_time > SYSDATE - :window / 86400 AND {filters}
+            ) a ON 1 = 1
+        """
+        rows, db_now = [], None
+        for _, batch in iter_oracle_query(sql, name, params=binds, arraysize=5000):
+            for row in batch:
+                db_now = row[0]
+                if row[1] is not None:
+                    rows.append(row[1:])
+        if db_now:
+            state["clock_offset"] = db_now - datetime.now()
+        if rows:
+            _ash_append(state, rows)
+        state["polled_at"] = time.monotonic()
+        state["error"] = None
+
+
+def _ash_append(state: dict, rows: list):
+    rows = rows[-ASH_BUFFER_ROWS:]
+    n = len(rows)
+    columns = list(zip(*rows))
+    with state["lock"]:
+        cap, head = ASH_BUFFER_ROWS, state["head"]
+        first = min(n, cap - head)
+        for (col, dtype), values in zip(ASH_COLUMNS.items(), columns):
+            if dtype == "float64":
+                arr = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+            else:
+                arr = np.array(values, dtype=dtype)
+            buf = state["cols"][col]
+            buf[head:head + first] = arr[:first]
+            buf[:n - first] = arr[first:]
+        state["head"] = (head + n) % cap
+        state["size"] = min(state["size"] + n, cap)
+        inst_idx = list(ASH_COLUMNS).index("INST_ID")
+        sample_idx = list(ASH_COLUMNS).index("SAMPLE_ID")
+        for inst, sample_id in zip(columns[inst_idx], columns[sample_idx]):
+            if sample_id > state["last_sample_id"].get(inst, -1):
+                state["last_sample_id"][inst] = sample_id
+
+
+def _ash_sampler_loop(name: str, state: dict):
+    while not state["stop"].wait(ASH_POLL_SECONDS):
+        if time.monotonic() - state["last_access"] > ASH_IDLE_STOP_SECONDS:
+            print(f"[DEBUG] ASH sampler for {name} idle, stopping")
+            break
+        try:
+            _ash_poll(name, state)
+        except Exception as e:
+            state["error"] = str(e)
+            print(f"[DEBUG] ASH sampler poll failed for {name}: {e}")
+    state["thread"] = None
+
+
+def get_ash_sampler(db: str = "DEFAULT") -> dict:
+    """Returns the running sampler for a DB_CONFIG entry (starting it, and polling once inline, if needed)."""
+    name = resolve_db_name(db)
+    signature = _pool_signature(DB_CONFIG[name])
+    with _ash_registry_lock:
+        state = _ash_samplers.get(name)
+        if state is None or state["signature"] != signature:
+            if state:
+                state["stop"].set()
+            state = _new_ash_state(signature)
+            _ash_samplers[name] = state
+        state["last_access"] = time.monotonic()
+        if state["thread"] is None:
+            state["stop"].clear()
+            state["thread"] = threading.Thread(
+                target=_ash_sampler_loop, args=(name, state), name=f"ash-{name}", daemon=True
+            )
+            state["thread"].start()
+    polled_at = state["polled_at"]
+    if polled_at is None or time.monotonic() - polled_at > 2 * ASH_POLL_SECONDS:
+        _ash_poll(name, state)
+    return state
+
+
+def stop_ash_samplers():
+    with _ash_registry_lock:
+        for state in _ash_samplers.values():
+            state["stop"].set()
+
+
+def ash_sampler_running(db: str = "DEFAULT") -> bool:
+    state = _ash_samplers.get(resolve_db_name(db))
+    return bool(state and state["thread"] is not None and not state["stop"].is_set())
+
+
+def stop_ash_sampler(db: str = "DEFAULT"):
+    """Stops one database's sampler (the next reader starts it again)."""
+    with _ash_registry_lock:
+        state = _ash_samplers.get(resolve_db_name(db))
+        if state:
+            state["stop"].set()
+
+
+def ash_window(db: str = "DEFAULT", seconds: int = 300) -> pd.DataFrame:
+    """ASH rows from the last `seconds` (database clock) out of the ring buffer. ON CPU rows get EVENT 'ON CPU'."""
+    state = get_ash_sampler(db)
+    cutoff = np.datetime64(datetime.now() + state["clock_offset"] - timedelta(seconds=seconds), "us")
+    with state["lock"]:
+        size = state["size"]
+        idx = np.flatnonzero(state["cols"]["SAMPLE_TIME"][:size] >= cutoff)
+        df = pd.DataFrame({c: state["cols"][c][idx] for c in ASH_COLUMNS})
+    on_cpu = df["SESSION_STATE"] == "ON CPU"
+    df.loc[on_cpu, "EVENT"] = "ON CPU"
+    df.loc[on_cpu, "WAIT_CLASS"] = "CPU"
+    return df
+
+
+def _ash_top_blockers(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """Per group, the highest blocking SID seen and the instance it is on (same ASH row)."""
+    blocked = df[df["BLOCKING_SESSION"].notna()].sort_values("BLOCKING_SESSION")
+    top = blocked.groupby(keys, dropna=False).tail(1)
+    return top[keys + ["BLOCKING_SESSION", "BLOCKING_INST_ID"]].rename(columns={"BLOCKING_SESSION": "BLOCKING_SID"})
+
+
+def ash_breakdown(db: str = "DEFAULT", by="sql", seconds: int = 300, top_n: int = 10, order_by: str = "SAMPLES") -> pd.DataFrame:
+    """
+    Aggregates the last `seconds` of sampled ASH by "sql", "event", "session", "wait_class"
+    or an explicit list of columns. Columns: SAMPLES, CPU_SAMPLES (~ CPU seconds), AAS,
+    PCT_TOTAL, EXECUTIONS (distinct SQL_EXEC_ID), IO_REQUESTS, IO_MB, MAX_PGA_MB,
+    MAX_TEMP_MB, BLOCKING_SID (+ its BLOCKING_INST_ID). Sorted by order_by; top_n=None keeps all groups.
+    """
+    keys = ASH_GROUPINGS.get(by, by) if isinstance(by, str) else list(by)
+    df = ash_window(db, seconds)
+    if by == "sql":
+        df = df[df["SQL_ID"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=keys + ["SAMPLES", "CPU_SAMPLES", "AAS", "PCT_TOTAL"])
+    df = df.assign(
+        ON_CPU=(df["SESSION_STATE"] == "ON CPU").astype(int),
+        IO_REQ=df["DELTA_READ_IO_REQUESTS"].fillna(0) + df["DELTA_WRITE_IO_REQUESTS"].fillna(0),
+        IO_BYTES=df["DELTA_READ_IO_BYTES"].fillna(0) + df["DELTA_WRITE_IO_BYTES"].fillna(0),
+    )
+    out = df.groupby(keys, dropna=False).agg(
+        SAMPLES=("SAMPLE_ID", "size"),
+        CPU_SAMPLES=("ON_CPU", "sum"),
+        EXECUTIONS=("SQL_EXEC_ID", "nunique"),
+        IO_REQUESTS=("IO_REQ", "sum"),
+        IO_BYTES=("IO_BYTES", "sum"),
+        MAX_PGA=("PGA_ALLOCATED", "max"),
+        MAX_TEMP=("TEMP_SPACE_ALLOCATED", "max"),
+    ).reset_index()
+    out = out.merge(_ash_top_blockers(df, keys), on=keys, how="left")
+    out["AAS"] = (out["SAMPLES"] / seconds).round(2)
+    out["PCT_TOTAL"] = (out["SAMPLES"] * 100.0 / len(df)).round(1)
+    out["IO_MB"] = (out.pop("IO_BYTES") / 1024 / 1024).round(1)
+    out["MAX_PGA_MB"] = (out.pop("MAX_PGA") / 1024 / 1024).round(1)
+    out["MAX_TEMP_MB"] = (out.pop("MAX_TEMP") / 1024 / 1024).round(1)
+    out = out.sort_values(order_by, ascending=False)
+    return (out.head(top_n) if top_n else out).reset_index(drop=True)
+
+
+# ==========================================
+# LIVE METRICS
+# ==========================================
+# Short-interval samples of V$SYSMETRIC (60s group) plus cumulative V$SYSSTAT and
+# V$SYSTEM_EVENT counters (rolled up by wait class), turned into per-second rates
+# between consecutive samples. History is shared by all sessions watching the same database.
+LIVE_HISTORY_POINTS = int(os.getenv("LIVE_HISTORY_POINTS", "720"))   # 1h at 5s
+LIVE_MIN_INTERVAL = float(os.getenv("LIVE_MIN_INTERVAL", "2"))        # seconds; faster callers share a sample
+LIVE_QUERY_TIMEOUT = int(os.getenv("LIVE_QUERY_TIMEOUT", "10"))
+LIVE_SYSMETRICS = {
+    "Host CPU Utilization (%)": "HOST_CPU_PCT",
+    "Average Active Sessions": "AAS_60S",
+    "Executions Per Sec": "EXECS_PER_SEC_60S",
+    "User Transaction Per Sec": "TXNS_PER_SEC_60S",
+    "Session Count": "SESSIONS",
+}
+LIVE_SYSSTATS = {
+    # stat -> (rate column, scale to apply to the per-second delta)
+    "DB time": ("DB_TIME_PER_SEC", 0.01),                     # centiseconds -> AAS
+    "CPU used by this session": ("DB_CPU_PER_SEC", 0.01),
+    "session logical reads": ("LOGICAL_READS_PER_SEC", 1),
+    "physical read total bytes": ("READ_MB_PER_SEC", 1 / 1048576),
+    "physical write total bytes": ("WRITE_MB_PER_SEC", 1 / 1048576),
+    "redo size": ("REDO_MB_PER_SEC", 1 / 1048576),
+    "execute count": ("EXECS_PER_SEC", 1),
+    "user calls": ("USER_CALLS_PER_SEC", 1),
+    "parse count (hard)": ("HARD_PARSES_PER_SEC", 1),
+    "user commits": ("COMMITS_PER_SEC", 1),
+}
+_live_state = {}  # DB name -> {"lock", "prev", "history"}
+_live_registry_lock = threading.Lock()
+
+
+def _live_state_for(name: str) -> dict:
+    with _live_registry_lock:
+        return _live_state.setdefault(name, {
+            "lock": threading.Lock(),
+            "prev": None,          # (db_time, counters, waits, monotonic) of the last sample
+            "history": deque(maxlen=LIVE_HISTORY_POINTS),
+        })
+
+
+def sample_live_metrics(db: str = "DEFAULT") -> dict:
+    """
+    Takes one live sample (a single batched round trip) and returns the new history point:
+    SAMPLE_TIME, the LIVE_SYSMETRICS gauges, LIVE_SYSSTATS per-second rates and one
+    WAIT_<class> column per non-idle wait class (average sessions waiting). Samples closer
+    together than LIVE_MIN_INTERVAL return the previous point. Raises on query errors.
+    """
+    name = resolve_db_name(db)
+    state = _live_state_for(name)
+    with state["lock"]:
+        if state["prev"] and time.monotonic() - state["prev"][3] < LIVE_MIN_INTERVAL and state["history"]:
+            return state["history"][-1]
+
+        metric_binds = {f"m{i}": m for i, m in enumerate(LIVE_SYSMETRICS)}
+        stat_binds = {f"s{i}": st_name for i, st_name in enumerate(LIVE_SYSSTATS)}
+        results = run_oracle_batch({
+            "now": "SELECT CAST(SYSTIMESTAMP AS TIMESTAMP) AS DB_NOW FROM DUAL",
+            "sysmetric": (f"SELECT METRIC_NAME, VALUE FROM V$SYSMETRIC WHERE GROUP_ID = 2 "
+                          f"AND METRIC_NAME IN ({', '.join(':' + k for k in metric_binds)})", metric_binds),
+            "sysstat": (f"SELECT NAME, VALUE FROM V$SYSSTAT WHERE NAME IN ({', '.join(':' + k for k in stat_binds)})",
+                        stat_binds),
+            "waits": ("SELECT WAIT_CLASS, SUM(TIME_WAITED_MICRO) / 10000 AS TIME_WAITED FROM V$SYSTEM_EVENT "
+                      "WHERE WAIT_CLASS <> 'Idle' GROUP BY WAIT_CLASS"),
+        }, name, default_timeout=LIVE_QUERY_TIMEOUT)
+        for key, res in results.items():
+            if isinstance(res, dict) or not isinstance(res, list):
+                raise RuntimeError(f"Live metrics ({key}) failed on {name}: {res.get('error') if isinstance(res, dict) else res}")
+
+        db_now = results["now"][0]["DB_NOW"]
+        counters = {r["NAME"]: float(r["VALUE"]) for r in results["sysstat"]}
+        waits = {r["WAIT_CLASS"]: float(r["TIME_WAITED"]) for r in results["waits"]}  # centiseconds
+        point = {"SAMPLE_TIME": db_now}
+        for r in results["sysmetric"]:
+            point[LIVE_SYSMETRICS[r["METRIC_NAME"]]] = round(float(r["VALUE"]), 2)
+
+        prev = state["prev"]
+        elapsed = (db_now - prev[0]).total_seconds() if prev else 0
+        for stat_name, (column, scale) in LIVE_SYSSTATS.items():
+            delta = counters.get(stat_name, 0) - prev[1].get(stat_name, 0) if prev else None
+            # No rate for the first sample or across a counter reset (instance restart)
+            point[column] = round(delta / elapsed * scale, 3) if elapsed > 0 and delta is not None and delta >= 0 else None
+        for wait_class, value in waits.items():
+            delta = value - prev[2].get(wait_class, 0) if prev else None
+            point[f"WAIT_{wait_class.upper().replace(' ', '_')}"] = (
+                round(delta / elapsed * 0.01, 3) if elapsed > 0 and delta is not None and delta >= 0 else None
+            )
+
+        state["prev"] = (db_now, counters, waits, time.monotonic())
+        if prev:
+            state["history"].append(point)
+        return point
+
+
+def live_metrics_frame(db: str = "DEFAULT", minutes: float = None) -> pd.DataFrame:
+    """Live history as a DataFrame indexed by SAMPLE_TIME (optionally only the last N minutes)."""
+    state = _live_state_for(resolve_db_name(db))
+    with state["lock"]:
+        df = pd.DataFrame(list(state["history"]))
+    if df.empty:
+        return df
+    df = df.set_index("SAMPLE_TIME").sort_index()
+    if minutes:
+        df = df[df.index >= df.index.max() - pd.Timedelta(minutes=minutes)]
+    return df
+
+
+# ==========================================
+# BLOCKING CHAINS
+# ==========================================
+# One GV$SESSION snapshot, turned into a waits-for forest in Python: every blocked
+# session points at its blocker (instance-qualified, so chains can cross RAC nodes).
+# Walking that graph once gives root blockers, chain depth, waiters per root and any
+# cycles (deadlocks), without self-joining GV$SESSION per level.
+BLOCKING_QUERY_TIMEOUT = int(os.getenv("BLOCKING_QUERY_TIMEOUT", "30"))
+_BLOCKING_SNAPSHOT_SQL = """
+    SELECT inst_id, sid, serial#, username, status, type, machine, program, sql_id,
+           event, wait_class, seconds_in_wait, last_call_et,
+           blocking_instance, blocking_session
+    FROM gv$session
+"""
+_BLOCKING_NODE_COLUMNS = ["INST_ID", "SID", "SERIAL#", "USERNAME", "STATUS", "EVENT", "WAIT_CLASS",
+                          "SQL_ID", "SECONDS_IN_WAIT", "LAST_CALL_ET", "PROGRAM", "MACHINE"]
+
+
+def _session_label(key) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def build_blocking_tree(rows) -> dict:
+    """
+    Builds the blocking forest from GV$SESSION rows (uppercase keys, as returned by
+    run_oracle_query). Sessions not involved in any wait chain are dropped. Returns:
+      roots    - one row per root blocker: DIRECT_WAITERS, TOTAL_WAITERS, CHAIN_DEPTH, MAX_WAIT_SEC
+      tree     - all involved sessions in depth-first order, with ROOT, DEPTH, WAITERS, IN_CYCLE
+      cycles   - lists of "inst:sid" labels, one per deadlock cycle
+      blocked_sessions, max_depth, sessions_scanned
+    A blocker missing from the snapshot (it logged off between samples) is kept as a
+    placeholder root with STATUS 'NOT IN SNAPSHOT'.
+    """
+    nodes = {(r["INST_ID"], r["SID"]): r for r in rows}
+    parent, children = {}, {}
+    for key, r in list(nodes.items()):
+        if r.get("BLOCKING_SESSION") is None:
+            continue
+        blocker = (r.get("BLOCKING_INSTANCE") or key[0], r["BLOCKING_SESSION"])
+        parent[key] = blocker
+        children.setdefault(blocker, []).append(key)
+        if blocker not in nodes:
+            nodes[blocker] = {"INST_ID": blocker[0], "SID": blocker[1], "STATUS": "NOT IN SNAPSHOT"}
+
+    # Each session waits on at most one blocker, so following parent pointers from any
+    # node either ends at a root or loops back onto the current path (a cycle).
+    cycle_of = {}   # key -> cycle index, for sessions on a cycle
+    resolved = set()
+    cycles = []
+    for start in parent:
+        path, on_path = [], set()
+        key = start
+        while key in parent and key not in resolved and key not in on_path:
+            path.append(key)
+            on_path.add(key)
+            key = parent[key]
+        if key in on_path:
+            members = path[path.index(key):]
+            for m in members:
+                cycle_of[m] = len(cycles)
+            cycles.append(members)
+        resolved.update(path)
+
+    # Trees hang off true roots (blockers that are not blocked) and off one member of
+    # each cycle; the cycle's back edge is skipped so every session is visited once.
+    starts = [k for k in children if k not in parent]
+    starts += [min(c) for c in cycles]
+    tree, roots, visited = [], [], set()
+    for root in starts:
+        order, stack = [], [(root, 0)]
+        while stack:
+            key, depth = stack.pop()
+            if key in visited:
+                continue
+            visited.add(key)
+            order.append((key, depth))
+            for child in sorted(children.get(key, ()), reverse=True):
+                if child not in visited:
+                    stack.append((child, depth + 1))
+        # Subtree sizes, accumulated bottom-up by walking the pre-order backwards
+        waiters = dict.fromkeys((k for k, _ in order), 0)
+        for key, depth in reversed(order):
+            if depth:
+                waiters[parent[key]] += 1 + waiters[key]
+        r = nodes[root]
+        roots.append({
+            "SESSION": _session_label(root),
+            **{c: r.get(c) for c in _BLOCKING_NODE_COLUMNS},
+            "DIRECT_WAITERS": sum(1 for c in children.get(root, ()) if c != root),
+            "TOTAL_WAITERS": waiters[root],
+            "CHAIN_DEPTH": max(d for _, d in order),
+            "MAX_WAIT_SEC": max((nodes[k].get("SECONDS_IN_WAIT") or 0 for k, d in order if d), default=0),
+            "IN_CYCLE": root in cycle_of,
+        })
+        for key, depth in order:
+            r = nodes[key]
+            tree.append({
+                "ROOT": _session_label(root),
+                "DEPTH": depth,
+                "SESSION": _session_label(key),
+                **{c: r.get(c) for c in _BLOCKING_NODE_COLUMNS},
+                "BLOCKED_BY": _session_label(parent[key]) if key in parent else None,
+                "WAITERS": waiters[key],
+                "IN_CYCLE": key in cycle_of,
+            })
+
+    roots.sort(key=lambda r: (r["TOTAL_WAITERS"], r["CHAIN_DEPTH"]), reverse=True)
+    rank = {r["SESSION"]: i for i, r in enumerate(roots)}
+    tree.sort(key=lambda t: rank[t["ROOT"]])
+    return {
+        "roots": roots,
+        "tree": tree,
+        "cycles": [[_session_label(k) for k in c] for c in cycles],
+        "blocked_sessions": len(parent),
+        "max_depth": max((r["CHAIN_DEPTH"] for r in roots), default=0),
+        "sessions_scanned": len(rows),
+    }
+
+
+def get_blocking_tree(db: str = "DEFAULT") -> dict:
+    """Fetches one GV$SESSION snapshot and builds the blocking forest. Returns {"error"} on failure."""
+    rows = run_oracle_query(_BLOCKING_SNAPSHOT_SQL, db, timeout=BLOCKING_QUERY_TIMEOUT)
+    if isinstance(rows, dict):
+        return rows
+    result = build_blocking_tree(rows)
+    result["captured_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return result
+
+
 # [Your existing run_full_health_check - unchanged, truncated]
-def run_full_health_check(db):
-    """Runs critical Oracle health checks + AI executive report"""
-    from autogen import AssistantAgent
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
+HEALTH_CHECK_TIMEOUT = int(os.getenv("HEALTH_CHECK_TIMEOUT", "60"))            # seconds per check
+HEALTH_CHECK_SLOW_TIMEOUT = int(os.getenv("HEALTH_CHECK_SLOW_TIMEOUT", "180"))  # dictionary/ASH-heavy checks
 
+def run_health_checks(db):
+    """Runs the canned health check queries. Returns {check title: rows or status text} in check order."""
     queries = {
         "1. Tablespace Usage >90% ( also included temp and undo utilization as well)": """
           select
@@ -480,26 +2372,8 @@ WHERE d.tablespace_name = a.tablespace_name(+)
               AND STATUS = 'ACTIVE'
               AND USERNAME IS NOT NULL
         """,
-        "3. Current Blocking Sessions": """
-          SELECT
-    s.blocking_instance,
-    s.blocking_session,
-    bs.username AS blocker_user,
-    bs.machine  AS blocker_machine,
-    bs.program  AS blocker_program,
-    s.inst_id   AS blocked_instance,
-    s.sid       AS blocked_sid,
-    s.username  AS blocked_user,
-    s.machine   AS blocked_machine,
-    s.program   AS blocked_program,
-    s.event     AS blocked_event
-FROM gv$session s
-LEFT JOIN gv$session bs
-       ON s.blocking_session = bs.sid
-      AND s.blocking_instance = bs.inst_id
-WHERE s.blocking_session IS NOT NULL
-ORDER BY s.blocking_instance, s.blocking_session
-        """,
+        # Flat snapshot; chains/cycles are resolved locally by build_blocking_tree
+        "3. Current Blocking Sessions": _BLOCKING_SNAPSHOT_SQL,
         "4. Top Wait Events Right Now": """
           SELECT INST_ID, EVENT, WAIT_CLASS,
                    ROUND(TIME_WAITED_MICRO/1000000, 1) AS WAIT_SEC
@@ -637,18 +2511,8 @@ FROM dual
             ORDER BY st.VALUE DESC
             FETCH FIRST 10 ROWS ONLY
         """,
-        "22. Top Wait Events with Causing SQLs & Impact (Last 10 Mins via ASH)": """
-            SELECT ash.SESSION_ID, ash.SQL_ID, se.EVENT, se.WAIT_CLASS,
-                   COUNT(*) AS SAMPLES, ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER(), 1) AS PCT_TOTAL,
-                   MAX(ash.BLOCKING_SESSION) AS BLOCKING_SID
-            FROM GV$ACTIVE_SESSION_HISTORY ash
-            JOIN GV$SESSION_EVENT se ON ash.SESSION_ID = se.SID AND ash.INST_ID = se.INST_ID
-            WHERE ash.SAMPLE_TIME > SYSDATE - 10/1440  -- Last 10 mins
-              AND ash.SESSION_STATE = 'ON CPU' OR se.WAIT_CLASS != 'Idle'
-            GROUP BY ash.SESSION_ID, ash.SQL_ID, se.EVENT, se.WAIT_CLASS
-            ORDER BY SAMPLES DESC
-            FETCH FIRST 15 ROWS ONLY
-        """,
+        # Computed locally from the ASH sampler (see _ash_health_check), not sent to the database
+        "22. Top Wait Events with Causing SQLs & Impact (Last 10 Mins via ASH)": None,
         "23. Current Top SQL by Elapsed Time (Active)": """
             SELECT INST_ID, SQL_ID, ELAPSED_TIME / 1000000 AS ELAPSED_SEC, EXECUTIONS,
                    (ELAPSED_TIME / EXECUTIONS / 1000000) AS AVG_ELAPSED_SEC,
@@ -664,16 +2528,84 @@ FROM dual
             )
             ORDER BY ELAPSED_TIME DESC
             FETCH FIRST 10 ROWS ONLY
-        """
+        """,
+        # Computed locally from the warehouse copy of DBA_HIST_TBSPC_SPACE_USAGE
+        f"24. Tablespace Growth Forecast (Projected Full Within {TBSPC_FORECAST_ALERT_DAYS} Days)": None,
+    }
+    local_checks = {
+        "22": _ash_health_check,
+        "24": _tablespace_forecast_check,
     }
 
-    results = {}
+    # Checks run in parallel on separate sessions, each with its own timeout; dictionary/ASH
+    # scans get a longer one. (Not pipelined: that would run them back to back on one session.)
+    slow_checks = {"8", "12", "23"}
+    timeouts = {
+        name: HEALTH_CHECK_SLOW_TIMEOUT if name.split(".", 1)[0] in slow_checks else HEALTH_CHECK_TIMEOUT
+        for name in queries
+    }
+    outputs = run_queries_parallel({name: sql.strip() for name, sql in queries.items() if sql}, db, timeouts=timeouts)
     for name, sql in queries.items():
-        try:
-            data = run_oracle_query(sql.strip(), db)
+        if sql is None:
+            outputs[name] = local_checks[name.split(".", 1)[0]](db)
+        elif sql is _BLOCKING_SNAPSHOT_SQL and isinstance(outputs[name], list):
+            outputs[name] = _blocking_health_check(outputs[name])
+
+    results = {}
+    for name in queries:
+        data = outputs[name]
+        if isinstance(data, dict) and "error" in data:
+            results[name] = [f"Error: {data['error']}"]
+        else:
             results[name] = data if data else "STATUS: Healthy (No issues found)"
-        except Exception as e:
-            results[name] = [f"Error: {str(e)}"]
+    return results
+
+
+def _ash_health_check(db):
+    """Check 22: top (session, SQL, event) combinations over the last 10 minutes of sampled ASH."""
+    try:
+        top = ash_breakdown(db, by=ASH_GROUPINGS["session"] + ["SQL_ID", "EVENT", "WAIT_CLASS"], seconds=600, top_n=15)
+    except Exception as e:
+        return {"error": str(e)}
+    top = top.reindex(columns=ASH_GROUPINGS["session"] + ["SQL_ID", "EVENT", "WAIT_CLASS", "SAMPLES", "PCT_TOTAL",
+                                                          "BLOCKING_INST_ID", "BLOCKING_SID"])
+    return top.astype(object).where(top.notna(), None).to_dict("records")
+
+
+def _tablespace_forecast_check(db):
+    """Check 24: tablespaces whose growth trend reaches their autoextend ceiling within the alert horizon."""
+    try:
+        fc = forecast_tablespace_growth(db)
+    except Exception as e:
+        return {"error": str(e)}
+    fc = fc[fc["DAYS_TO_FULL"] <= TBSPC_FORECAST_ALERT_DAYS]
+    return fc.astype(object).where(fc.notna(), None).to_dict("records")
+
+
+def _blocking_health_check(rows):
+    """Check 3: every session in a blocking chain, root blockers first, indented by chain depth."""
+    cols = ["ROOT", "DEPTH", "SESSION", "BLOCKED_BY", "WAITERS", "IN_CYCLE", "USERNAME",
+            "STATUS", "EVENT", "SQL_ID", "SECONDS_IN_WAIT", "MACHINE", "PROGRAM"]
+    return [{c: r.get(c) for c in cols} for r in build_blocking_tree(rows)["tree"]]
+
+
+def health_check_status(data) -> str:
+    """Classifies one check result as OK / FINDINGS / ERROR (used by the fleet matrix)."""
+    if isinstance(data, str):
+        return "OK" if data.startswith("STATUS: Healthy") else "FINDINGS"
+    if isinstance(data, list) and data and isinstance(data[0], str) and data[0].startswith("Error:"):
+        return "ERROR"
+    return "FINDINGS" if data else "OK"
+
+
+def run_full_health_check(db):
+    """Runs critical Oracle health checks + AI executive report"""
+    from autogen import AssistantAgent
+    import os
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    results = run_health_checks(db)
 
     # Build raw report text
     raw_text = f"Database: {db.upper()}\nCheck Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
@@ -736,6 +2668,7 @@ Your output must be **Visually Stunning**, **Technically Precise**, and **Format
 | **18. CPU/IO Saturation**| [Emoji] | [Finding] |
 | **19. Resource Hogs** | [Emoji] | [Finding] |
 | **20. PGA/Memory Usage**| [Emoji] | [Finding] |
+| **24. Tablespace Growth Forecast** | [Emoji] | [Finding] |
 ---
 
 ## 🚨 Critical Action Items
@@ -750,6 +2683,7 @@ Your output must be **Visually Stunning**, **Technically Precise**, and **Format
 
 ### 1. 💾 Storage analysis
 [Insert Markdown table for Tablespace & ASM data. Ensure blank lines around it.]
+[If Query 24 returned rows, add a table of TABLESPACE_NAME, USED_GB, CAPACITY_GB, GROWTH_GB_PER_DAY, DAYS_TO_FULL and FULL_BY; mark DAYS_TO_FULL under 30 as 🔴.]
 
 ### 2. ⚡ Recent Performance (Last 10-25 Mins) 
 *Based on ASH and real-time metrics (Queries 19-23):*
@@ -779,37 +2713,538 @@ Your output must be **Visually Stunning**, **Technically Precise**, and **Format
 # NEW: ASH Report Generation (for recent/short-term performance)
 
 def generate_ash_report(minutes: int = 30, db: str = "DEFAULT"):
-    oracledb.init_oracle_client(lib_dir=r"C:\Users\omkarav\Downloads\instantclient-basiclite-windows.x64-19.28.0.0.0dbru\instantclient_19_28")
-    config = DB_CONFIG.get(db.upper(), DB_CONFIG["DEFAULT"])
     try:
-        conn = oracledb.connect(user=config["user"], password=config["password"], dsn=config["dsn"])
-        cur = conn.cursor()
-        
-        cur.execute("SELECT DBID FROM V$DATABASE")
-        dbid = cur.fetchone()[0]
-        cur.execute("SELECT INSTANCE_NUMBER FROM V$INSTANCE")
-        inst_num = cur.fetchone()[0]
-
-        sql = f"""
-        SELECT OUTPUT FROM TABLE(DBMS_WORKLOAD_REPOSITORY.ASH_REPORT_HTML(:dbid, :inst_num, SYSDATE - ({minutes}/1440), SYSDATE, 0))
-        """
-        cur.execute(sql, dbid=dbid, inst_num=inst_num)
-        report = "".join([str(row[0]) for row in cur if row[0]])
-        conn.close()
+        with get_connection(db) as conn:
+            cur = conn.cursor()
+
+            cur.execute("SELECT DBID FROM V$DATABASE")
+            dbid = cur.fetchone()[0]
+            cur.execute("SELECT INSTANCE_NUMBER FROM V$INSTANCE")
+            inst_num = cur.fetchone()[0]
+
+            sql = f"""
+            SELECT OUTPUT FROM TABLE(DBMS_WORKLOAD_REPOSITORY.ASH_REPORT_HTML(:dbid, :inst_num, SYSDATE - ({minutes}/1440), SYSDATE, 0))
+            """
+            cur.execute(sql, dbid=dbid, inst_num=inst_num)
+            report = "".join([str(row[0]) for row in cur if row[0]])
         return {"status": "ok", "report": report, "filename": f"ASH_{minutes}m.html"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 def get_snapshots_by_date_range(start_time, end_time, db):
-    sql = f"""
-    SELECT MIN(snap_id), MAX(snap_id) FROM dba_hist_snapshot
-    WHERE begin_interval_time >= TO_TIMESTAMP('{start_time}', 'YYYY-MM-DD HH24:MI:SS')
-      AND end_interval_time <= TO_TIMESTAMP('{end_time}', 'YYYY-MM-DD HH24:MI:SS')
-    """
-    rows = run_oracle_query(sql, db)
-    if rows and rows[0].get("MIN(SNAP_ID)"):
-        return [{'snap_id': rows[0]["MIN(SNAP_ID)"]}, {'snap_id': rows[0]["MAX(SNAP_ID)"]}]
-    return None
+    """
+    Returns [{'snap_id': first}, {'snap_id': last}] for the snapshots fully inside the window
+    (resolved from the snapshot catalog), or None. Windows spanning an instance restart
+    are narrowed to the latest incarnation, since AWR cannot report across a restart.
+    """
+    fmt = "%Y-%m-%d %H:%M:%S"
+    try:
+        rng = find_snapshot_range(db, datetime.strptime(start_time, fmt), datetime.strptime(end_time, fmt))
+    except Exception as e:
+        print(f"[DEBUG] Snapshot lookup failed: {e}")
+        return None
+    if rng["start_snap"] is None:
+        return None
+    if rng["restarted_at"]:
+        print(f"[DEBUG] Instance restarted at {rng['restarted_at']}; range starts after the restart")
+    return [{'snap_id': rng["start_snap"]}, {'snap_id': rng["end_snap"]}]
 
 
     # 1. Construct SQL to find min/max snap_id within the window
+
+
+# ==========================================
+# METRICS WAREHOUSE
+# ==========================================
+# Local SQLite copy of the per-snapshot system metrics behind the Performance tab
+# (one file per DB_CONFIG entry). Each sync pulls only snap_ids the warehouse has not
+# seen, then rebuilds the hourly/daily rollups for the hours and days it touched, so
+# charts are served locally instead of re-aggregating 30 days of AWR in SYSAUX.
+WAREHOUSE_DIR = os.getenv(
+    "AWR_WAREHOUSE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".awr_warehouse"),
+)
+_warehouse_locks = {}
+_warehouse_registry_lock = threading.Lock()
+
+_WAREHOUSE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snap_metrics (
+    dbid INTEGER, instance_number INTEGER, snap_id INTEGER, end_time TEXT,
+    cpu_util REAL, aas REAL, phys_reads REAL, phys_writes REAL, total_pga REAL, total_sga REAL,
+    PRIMARY KEY (dbid, instance_number, snap_id)
+);
+CREATE INDEX IF NOT EXISTS snap_metrics_time ON snap_metrics (dbid, end_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    dbid INTEGER PRIMARY KEY, first_snap_id INTEGER, last_snap_id INTEGER, covered_since TEXT
+);
+CREATE TABLE IF NOT EXISTS tbspc_usage (
+    dbid INTEGER, snap_id INTEGER, snap_time TEXT, tablespace_name TEXT,
+    used_mb REAL, size_mb REAL, max_mb REAL,
+    PRIMARY KEY (dbid, snap_id, tablespace_name)
+);
+CREATE INDEX IF NOT EXISTS tbspc_usage_time ON tbspc_usage (dbid, snap_time);
+CREATE TABLE IF NOT EXISTS tbspc_sync_state (
+    dbid INTEGER PRIMARY KEY, last_snap_id INTEGER, covered_since TEXT
+);
+CREATE TABLE IF NOT EXISTS sql_objects (
+    dbid INTEGER, table_owner TEXT, table_name TEXT, sql_id TEXT, plan_hash_value INTEGER,
+    PRIMARY KEY (dbid, table_name, table_owner, sql_id, plan_hash_value)
+);
+CREATE TABLE IF NOT EXISTS sql_objects_sync_state (
+    dbid INTEGER PRIMARY KEY, last_snap_id INTEGER
+);
+"""
+_ROLLUP_COLUMNS = """
+    ROUND(AVG(cpu_util), 2) AS avg_cluster_cpu_pct,
+    ROUND(AVG(aas), 2) AS total_cluster_aas,
+    ROUND(AVG(phys_reads + phys_writes) / 1024 / 1024, 2) AS total_io_mb_sec,
+    ROUND(AVG(total_pga + total_sga) / 1024 / 1024 / 1024, 2) AS total_db_memory_gb,
+    ROUND(AVG(total_sga) / 1024 / 1024 / 1024, 2) AS sga_gb,
+    ROUND(AVG(total_pga) / 1024 / 1024 / 1024, 2) AS pga_gb
+"""
+# rollup table -> length of the end_time prefix that identifies a bucket, and its suffix
+_ROLLUPS = {"metrics_hourly": (13, ":00:00"), "metrics_daily": (10, " 00:00:00")}
+
+_SNAP_METRICS_SQL = """
+SELECT s.snap_id, s.instance_number, CAST(s.end_interval_time AS DATE) AS end_time,
+       m.cpu_util, m.aas, m.phys_reads, m.phys_writes, p.total_pga, g.total_sga
+FROM dba_hist_snapshot s
+JOIN (
+    SELECT snap_id, instance_number,
+        MAX(CASE WHEN metric_name = 'Host CPU Utilization (%)' THEN average END) AS cpu_util,
+        MAX(CASE WHEN metric_name = 'Average Active Sessions' THEN average END) AS aas,
+        MAX(CASE WHEN metric_name = 'Physical Read Total Bytes Per Sec' THEN average END) AS phys_reads,
+        MAX(CASE WHEN metric_name = 'Physical Write Total Bytes Per Sec' THEN average END) AS phys_writes
+    FROM dba_hist_sysmetric_summary
+    WHERE dbid = :dbid AND snap_id > :lo AND snap_id < :hi
+      AND metric_name IN ('Host CPU Utilization (%)', 'Average Active Sessions',
+                          'Physical Read Total Bytes Per Sec', 'Physical Write Total Bytes Per Sec')
+    GROUP BY snap_id, instance_number
+) m ON m.snap_id = s.snap_id AND m.instance_number = s.instance_number
+LEFT JOIN (
+    SELECT snap_id, instance_number, MAX(value) AS total_pga
+    FROM dba_hist_pgastat
+    WHERE dbid = :dbid AND snap_id > :lo AND snap_id < :hi AND name = 'total PGA allocated'
+    GROUP BY snap_id, instance_number
+) p ON p.snap_id = s.snap_id AND p.instance_number = s.instance_number
+LEFT JOIN (
+    SELECT snap_id, instance_number, SUM(value) AS total_sga
+    FROM dba_hist_sga
+    WHERE dbid = :dbid AND snap_id > :lo AND snap_id < :hi
+    GROUP BY snap_id, instance_number
+) g ON g.snap_id = s.snap_id AND g.instance_number = s.instance_number
+WHERE s.dbid = :dbid AND s.snap_id > :lo AND s.snap_id < :hi
+  AND s.end_interval_time >= SYSDATE - :days
+"""
+
+
+def _warehouse_lock(name: str):
+    with _warehouse_registry_lock:
+        return _warehouse_locks.setdefault(name, threading.Lock())
+
+
+def _open_warehouse(name: str):
+    os.makedirs(WAREHOUSE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(WAREHOUSE_DIR, f"{name}.sqlite"), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_WAREHOUSE_SCHEMA)
+    for table in _ROLLUPS:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                dbid INTEGER, snap_time TEXT, avg_cluster_cpu_pct REAL, total_cluster_aas REAL,
+                total_io_mb_sec REAL, total_db_memory_gb REAL, sga_gb REAL, pga_gb REAL,
+                PRIMARY KEY (dbid, snap_time)
+            )""")
+    return conn
+
+
+def _pull_snap_metrics(db: str, dbid, lo: int, hi: int, days: float) -> list:
+    """Fetches per-snapshot metrics for lo < snap_id < hi from AWR."""
+    params = {"dbid": dbid, "lo": lo, "hi": hi, "days": days}
+    rows = run_oracle_query(_SNAP_METRICS_SQL, db, params=params)
+    if isinstance(rows, dict):
+        raise RuntimeError(rows.get("error"))
+    num = lambda v: None if v is None else float(v)
+    return [
+        (dbid, int(r["INSTANCE_NUMBER"]), int(r["SNAP_ID"]), r["END_TIME"].strftime("%Y-%m-%d %H:%M:%S"),
+         num(r["CPU_UTIL"]), num(r["AAS"]), num(r["PHYS_READS"]), num(r["PHYS_WRITES"]),
+         num(r["TOTAL_PGA"]), num(r["TOTAL_SGA"]))
+        for r in rows
+    ]
+
+
+def _store_snap_metrics(conn, dbid, rows: list):
+    """Inserts raw rows and rebuilds the rollup buckets they fall into."""
+    if not rows:
+        return
+    conn.executemany("INSERT OR REPLACE INTO snap_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    first, last = min(r[3] for r in rows), max(r[3] for r in rows)
+    for table, (width, suffix) in _ROLLUPS.items():
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {table}
+            SELECT dbid, substr(end_time, 1, {width}) || '{suffix}' AS snap_time, {_ROLLUP_COLUMNS}
+            FROM snap_metrics
+            WHERE dbid = ? AND substr(end_time, 1, {width}) BETWEEN ? AND ?
+            GROUP BY dbid, substr(end_time, 1, {width})
+        """, (dbid, first[:width], last[:width]))
+
+
+def sync_metrics_warehouse(db: str = "DEFAULT", days: int = 30):
+    """
+    Brings the local warehouse up to date for the last `days` days. Only snapshots newer
+    than the last synced one (or older than the first, when a longer window is requested)
+    are fetched, and nothing is fetched if the snapshot catalog shows no new snapshots.
+    """
+    name = resolve_db_name(db)
+    catalog = get_snapshot_catalog(name)
+    dbid = catalog["dbid"]
+    window_start = (datetime.now() + catalog["clock_offset"] - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    with _warehouse_lock(name):
+        conn = _open_warehouse(name)
+        try:
+            state = conn.execute(
+                "SELECT first_snap_id, last_snap_id, covered_since FROM sync_state WHERE dbid = ?", (dbid,)
+            ).fetchone()
+            latest = catalog["snap_ids"][-1] if catalog["snap_ids"] else None
+
+            if state is None:
+                rows = _pull_snap_metrics(name, dbid, -1, 2 ** 62, days)
+                first = min((r[2] for r in rows), default=latest or 0)
+                state = (first, max([latest or 0] + [r[2] for r in rows]), window_start)
+                _store_snap_metrics(conn, dbid, rows)
+                print(f"[DEBUG] Warehouse {name}: backfilled {len(rows)} snapshot rows")
+            else:
+                first, last, covered_since = state
+                if window_start < covered_since:
+                    older = _pull_snap_metrics(name, dbid, -1, first, days)
+                    _store_snap_metrics(conn, dbid, older)
+                    first = min([first] + [r[2] for r in older])
+                    covered_since = window_start
+                    print(f"[DEBUG] Warehouse {name}: extended back with {len(older)} snapshot rows")
+                if latest is not None and latest > last:
+                    newer = _pull_snap_metrics(name, dbid, last, 2 ** 62, days)
+                    _store_snap_metrics(conn, dbid, newer)
+                    last = max([latest] + [r[2] for r in newer])
+                    print(f"[DEBUG] Warehouse {name}: +{len(newer)} snapshot rows")
+                state = (first, last, covered_since)
+
+            conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)", (dbid,) + tuple(state))
+            conn.commit()
+        finally:
+            conn.close()
+    return dbid, window_start
+
+
+def load_metric_history(db: str = "DEFAULT", days: int = 30, granularity: str = "hour") -> pd.DataFrame:
+    """
+    Returns the Performance tab metrics (SNAP_TIME, AVG_CLUSTER_CPU_PCT, TOTAL_CLUSTER_AAS,
+    TOTAL_IO_MB_SEC, TOTAL_DB_MEMORY_GB, SGA_GB, PGA_GB) for the last `days` days at
+    hourly or daily granularity, syncing the local warehouse first. Raises on error.
+    """
+    dbid, window_start = sync_metrics_warehouse(db, days)
+    table = "metrics_daily" if granularity == "day" else "metrics_hourly"
+    width = _ROLLUPS[table][0]
+    conn = _open_warehouse(resolve_db_name(db))
+    try:
+        df = pd.read_sql_query(
+            f"SELECT * FROM {table} WHERE dbid = ? AND snap_time >= ? ORDER BY snap_time",
+            conn, params=(dbid, window_start[:width]),
+        )
+    finally:
+        conn.close()
+    df = df.drop(columns=["dbid"])
+    df.columns = [c.upper() for c in df.columns]
+    df["SNAP_TIME"] = pd.to_datetime(df["SNAP_TIME"])
+    return df
+
+
+
+# ==========================================
+# METRIC ANOMALY DETECTION
+# ==========================================
+# Seasonal baseline per hour-of-week (day-of-week for daily rollups) with a rolling
+# median fallback for slots seen fewer than ANOMALY_MIN_SEASON_SAMPLES times; the
+# residual is scored against a rolling MAD so a busy Monday 09:00 is compared with
+# other Mondays at 09:00, not with Sunday night. All columns are scored at once.
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+ANOMALY_MIN_SEASON_SAMPLES = 3
+ANOMALY_METRICS = ["AVG_CLUSTER_CPU_PCT", "TOTAL_CLUSTER_AAS", "TOTAL_IO_MB_SEC", "TOTAL_DB_MEMORY_GB"]
+# granularity -> (bucket width, fallback baseline window, MAD window), windows in buckets
+_ANOMALY_BUCKETS = {"hour": (timedelta(hours=1), 24, 24 * 7), "day": (timedelta(days=1), 7, 28)}
+
+
+def detect_metric_anomalies(df: pd.DataFrame, granularity: str = "hour", columns=None,
+                            threshold: float = None, top_n: int = 5):
+    """
+    Scores load_metric_history output (SNAP_TIME + metric columns). Returns
+    (scores, windows):
+      scores  - SNAP_TIME plus <METRIC>_BASELINE, <METRIC>_SCORE and <METRIC>_ANOMALY per metric
+      windows - top_n runs of consecutive anomalous buckets: START, END, PEAK_SCORE, METRICS, POINTS
+    Only upward deviations are flagged (spikes in load, I/O or memory).
+    """
+    threshold = threshold or ANOMALY_Z_THRESHOLD
+    width, base_window, mad_window = _ANOMALY_BUCKETS["day" if granularity == "day" else "hour"]
+    columns = [c for c in (columns or ANOMALY_METRICS) if c in df.columns]
+    df = df.sort_values("SNAP_TIME").reset_index(drop=True)
+    times = df["SNAP_TIME"]
+    values = df[columns].astype(float)
+
+    slot = times.dt.dayofweek if granularity == "day" else times.dt.dayofweek * 24 + times.dt.hour
+    seasonal = values.groupby(slot.values).transform("median")
+    season_n = values.groupby(slot.values).transform("count")
+    rolling = values.rolling(base_window, center=True, min_periods=1).median()
+    baseline = seasonal.where(season_n >= ANOMALY_MIN_SEASON_SAMPLES, rolling)
+
+    resid = values - baseline
+    # Robust scale: rolling MAD of the residual, floored by the series-wide MAD so flat
+    # stretches do not turn tiny wiggles into huge scores
+    mad = resid.abs().rolling(mad_window, min_periods=1).median() * 1.4826
+    floor = (resid.abs().median() * 1.4826).clip(lower=1e-9)
+    score = resid / mad.clip(lower=floor, axis=1)
+
+    scores = pd.DataFrame({"SNAP_TIME": times})
+    for c in columns:
+        scores[f"{c}_BASELINE"] = baseline[c].round(2)
+        scores[f"{c}_SCORE"] = score[c].round(2)
+        scores[f"{c}_ANOMALY"] = (score[c] >= threshold).fillna(False)
+
+    flagged = (score >= threshold).fillna(False)
+    any_flag = flagged.any(axis=1)
+    if not any_flag.any():
+        return scores, pd.DataFrame(columns=["START", "END", "PEAK_SCORE", "METRICS", "POINTS"])
+
+    # A new run starts wherever a flagged bucket does not directly follow the previous one
+    idx = np.flatnonzero(any_flag.to_numpy())
+    gap = np.diff(times.iloc[idx].to_numpy()) > np.timedelta64(int(width.total_seconds()), "s")
+    run_id = np.concatenate([[0], np.cumsum(gap)])
+    runs = pd.DataFrame({
+        "RUN": run_id,
+        "SNAP_TIME": times.iloc[idx].to_numpy(),
+        "PEAK": score.iloc[idx].where(flagged.iloc[idx]).max(axis=1).to_numpy(),
+        "METRICS": [", ".join(c for c, hit in zip(columns, row) if hit)
+                    for row in flagged.iloc[idx].itertuples(index=False)],
+    })
+    windows = runs.groupby("RUN").agg(
+        START=("SNAP_TIME", "min"), END=("SNAP_TIME", "max"),
+        PEAK_SCORE=("PEAK", "max"), POINTS=("SNAP_TIME", "size"),
+        METRICS=("METRICS", lambda m: ", ".join(sorted({x for s in m for x in s.split(", ")}))),
+    )
+    windows["END"] = windows["END"] + width
+    windows["PEAK_SCORE"] = windows["PEAK_SCORE"].round(1)
+    windows = windows.sort_values("PEAK_SCORE", ascending=False).head(top_n)
+    return scores, windows[["START", "END", "PEAK_SCORE", "METRICS", "POINTS"]].reset_index(drop=True)
+
+
+# ==========================================
+# TABLESPACE GROWTH FORECAST
+# ==========================================
+# DBA_HIST_TBSPC_SPACE_USAGE is copied into the warehouse incrementally (same file and
+# lock as the metrics above). The forecast pivots the history into a snapshot x
+# tablespace matrix and fits every tablespace's least-squares trend in one pass of
+# masked NumPy sums, so hundreds of tablespaces cost the same as one.
+TBSPC_FORECAST_DAYS = int(os.getenv("TBSPC_FORECAST_DAYS", "30"))       # regression lookback
+TBSPC_FORECAST_ALERT_DAYS = int(os.getenv("TBSPC_FORECAST_ALERT_DAYS", "90"))
+TBSPC_FORECAST_MIN_SAMPLES = 6
+
+_TBSPC_USAGE_SQL = """
+SELECT u.snap_id, CAST(s.end_time AS DATE) AS snap_time, t.name AS tablespace_name,
+       u.tablespace_usedsize * d.block_size / 1048576 AS used_mb,
+       u.tablespace_size * d.block_size / 1048576 AS size_mb,
+       u.tablespace_maxsize * d.block_size / 1048576 AS max_mb
+FROM dba_hist_tbspc_space_usage u
+JOIN (
+    SELECT snap_id, MAX(end_interval_time) AS end_time
+    FROM dba_hist_snapshot
+    WHERE dbid = :dbid AND snap_id > :lo
+    GROUP BY snap_id
+) s ON s.snap_id = u.snap_id
+JOIN v$tablespace t ON t.ts# = u.tablespace_id
+JOIN dba_tablespaces d ON d.tablespace_name = t.name
+WHERE u.dbid = :dbid AND u.snap_id > :lo
+  AND d.contents = 'PERMANENT'
+  AND s.end_time >= SYSDATE - :days
+"""
+
+
+def sync_tablespace_history(db: str = "DEFAULT", days: int = TBSPC_FORECAST_DAYS):
+    """
+    Copies tablespace usage snapshots newer than the last synced snap_id into the
+    warehouse (the first sync, or a longer window than before, backfills `days` days).
+    Returns (dbid, window_start). Raises on error.
+    """
+    name = resolve_db_name(db)
+    catalog = get_snapshot_catalog(name)
+    dbid = catalog["dbid"]
+    window_start = (datetime.now() + catalog["clock_offset"] - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    latest = catalog["snap_ids"][-1] if catalog["snap_ids"] else None
+
+    with _warehouse_lock(name):
+        conn = _open_warehouse(name)
+        try:
+            state = conn.execute(
+                "SELECT last_snap_id, covered_since FROM tbspc_sync_state WHERE dbid = ?", (dbid,)
+            ).fetchone()
+            if state is None or window_start < state[1]:
+                lo, covered_since = -1, window_start
+            elif latest is None or latest <= state[0]:
+                return dbid, window_start
+            else:
+                lo, covered_since = state
+            df = fetch_oracle_dataframe(_TBSPC_USAGE_SQL, name, params={"dbid": dbid, "lo": lo, "days": days})
+            if not df.empty:
+                df.columns = [c.upper() for c in df.columns]
+                df["SNAP_TIME"] = pd.to_datetime(df["SNAP_TIME"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+                df.insert(0, "DBID", dbid)
+                cols = ["DBID", "SNAP_ID", "SNAP_TIME", "TABLESPACE_NAME", "USED_MB", "SIZE_MB", "MAX_MB"]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tbspc_usage VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    df[cols].astype({"SNAP_ID": int}).itertuples(index=False, name=None),
+                )
+            last = max([lo, latest or -1] + ([int(df["SNAP_ID"].max())] if not df.empty else []))
+            conn.execute("INSERT OR REPLACE INTO tbspc_sync_state VALUES (?, ?, ?)", (dbid, last, covered_since))
+            conn.commit()
+            print(f"[DEBUG] Warehouse {name}: +{len(df)} tablespace usage rows")
+        finally:
+            conn.close()
+    return dbid, window_start
+
+
+def forecast_tablespace_growth(db: str = "DEFAULT", days: int = TBSPC_FORECAST_DAYS) -> pd.DataFrame:
+    """
+    Linear growth trend per permanent tablespace over the last `days` days. Returns
+    TABLESPACE_NAME, USED_GB, CAPACITY_GB (autoextend ceiling), GROWTH_GB_PER_DAY,
+    DAYS_TO_FULL, FULL_BY, FIT_R2, SAMPLES sorted by DAYS_TO_FULL (NaN when the
+    tablespace is not growing or has fewer than TBSPC_FORECAST_MIN_SAMPLES points).
+    Raises on error.
+    """
+    dbid, window_start = sync_tablespace_history(db, days)
+    conn = _open_warehouse(resolve_db_name(db))
+    try:
+        hist = pd.read_sql_query(
+            "SELECT snap_time, tablespace_name, used_mb, size_mb, max_mb FROM tbspc_usage "
+            "WHERE dbid = ? AND snap_time >= ?",
+            conn, params=(dbid, window_start),
+        )
+    finally:
+        conn.close()
+    if hist.empty:
+        return pd.DataFrame(columns=["TABLESPACE_NAME", "USED_GB", "CAPACITY_GB", "GROWTH_GB_PER_DAY",
+                                     "DAYS_TO_FULL", "FULL_BY", "FIT_R2", "SAMPLES"])
+
+    hist["snap_time"] = pd.to_datetime(hist["snap_time"])
+    used = hist.pivot_table(index="snap_time", columns="tablespace_name", values="used_mb", aggfunc="last")
+    capacity = hist.assign(cap=hist[["size_mb", "max_mb"]].max(axis=1)).pivot_table(
+        index="snap_time", columns="tablespace_name", values="cap", aggfunc="last"
+    )
+    # x in days since the first snapshot; every column regressed at once on its non-null points
+    t0 = used.index[0]
+    x = ((used.index - t0).total_seconds() / 86400.0).to_numpy()[:, None]
+    y = used.to_numpy(dtype=float)
+    mask = ~np.isnan(y)
+    xm, ym = np.where(mask, x, 0.0), np.where(mask, y, 0.0)
+    n = mask.sum(axis=0)
+    sx, sy = xm.sum(axis=0), ym.sum(axis=0)
+    sxx, sxy, syy = (xm * xm).sum(axis=0), (xm * ym).sum(axis=0), (ym * ym).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        cov = n * sxy - sx * sy
+        slope = np.where((n >= TBSPC_FORECAST_MIN_SAMPLES) & (var_x > 0), cov / var_x, np.nan)
+        r2 = np.where(var_y > 0, cov * cov / (var_x * var_y), 1.0)
+
+        current = used.ffill().to_numpy()[-1]
+        cap = capacity.reindex(columns=used.columns).ffill().to_numpy()[-1]
+        days_to_full = np.where(slope > 0, np.maximum(cap - current, 0.0) / slope, np.nan)
+
+    now = used.index[-1]
+    out = pd.DataFrame({
+        "TABLESPACE_NAME": used.columns,
+        "USED_GB": np.round(current / 1024, 2),
+        "CAPACITY_GB": np.round(cap / 1024, 2),
+        "GROWTH_GB_PER_DAY": np.round(slope / 1024, 3),
+        "DAYS_TO_FULL": np.round(days_to_full, 1),
+        "FULL_BY": [
+            (now + timedelta(days=float(d))).strftime("%Y-%m-%d") if np.isfinite(d) and d < 36500 else None
+            for d in days_to_full
+        ],
+        "FIT_R2": np.round(r2, 2),
+        "SAMPLES": n,
+    })
+    return out.sort_values(["DAYS_TO_FULL", "GROWTH_GB_PER_DAY"], ascending=[True, False],
+                           na_position="last").reset_index(drop=True)
+
+
+# ==========================================
+# TABLE -> SQL INDEX
+# ==========================================
+# Which SQL touched a table, answered from DBA_HIST_SQL_PLAN object references instead
+# of LIKE scans over DBA_HIST_SQLTEXT CLOBs. Index access paths are mapped back to
+# their table. Each sync only reads plans of (sql_id, plan) pairs that appear in
+# snapshots newer than the last synced one, and stores them in the warehouse keyed by
+# table name, so lookups are exact (ORDERS does not match ORDERS_HIST).
+_SQL_OBJECTS_SQL = """
+SELECT DISTINCT p.sql_id, p.plan_hash_value,
+       NVL(i.table_owner, p.object_owner) AS table_owner,
+       NVL(i.table_name, p.object_name) AS table_name
+FROM dba_hist_sql_plan p
+LEFT JOIN dba_indexes i
+  ON p.object_type LIKE 'INDEX%' AND i.owner = p.object_owner AND i.index_name = p.object_name
+WHERE p.dbid = :dbid
+  AND p.object_owner IS NOT NULL AND p.object_name IS NOT NULL
+  AND (p.object_type LIKE 'TABLE%' OR p.object_type LIKE 'INDEX%' OR p.object_type LIKE 'MAT_VIEW%')
+  AND (p.sql_id, p.plan_hash_value) IN (
+      SELECT sql_id, plan_hash_value FROM dba_hist_sqlstat WHERE dbid = :dbid AND snap_id > :lo
+  )
+"""
+
+
+def sync_table_sql_index(db: str = "DEFAULT"):
+    """Adds plan object references for snapshots newer than the last sync. Returns the DBID. Raises on error."""
+    name = resolve_db_name(db)
+    catalog = get_snapshot_catalog(name)
+    dbid = catalog["dbid"]
+    latest = catalog["snap_ids"][-1] if catalog["snap_ids"] else None
+
+    with _warehouse_lock(name):
+        conn = _open_warehouse(name)
+        try:
+            state = conn.execute("SELECT last_snap_id FROM sql_objects_sync_state WHERE dbid = ?", (dbid,)).fetchone()
+            lo = state[0] if state else -1
+            if latest is None or latest <= lo:
+                return dbid
+            df = fetch_oracle_dataframe(_SQL_OBJECTS_SQL, name, params={"dbid": dbid, "lo": lo})
+            if not df.empty:
+                df.columns = [c.upper() for c in df.columns]
+                df.insert(0, "DBID", dbid)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO sql_objects VALUES (?, ?, ?, ?, ?)",
+                    df[["DBID", "TABLE_OWNER", "TABLE_NAME", "SQL_ID", "PLAN_HASH_VALUE"]]
+                    .astype({"PLAN_HASH_VALUE": "int64"}).itertuples(index=False, name=None),
+                )
+            conn.execute("INSERT OR REPLACE INTO sql_objects_sync_state VALUES (?, ?)", (dbid, latest))
+            conn.commit()
+            print(f"[DEBUG] Warehouse {name}: +{len(df)} SQL plan object references")
+        finally:
+            conn.close()
+    return dbid
+
+
+def find_table_sql_ids(table_name: str, db: str = "DEFAULT") -> list:
+    """
+    SQL_IDs whose captured plans reference the table (directly or through one of its
+    indexes). table_name may be qualified as OWNER.TABLE; matching is exact and
+    case-insensitive. Syncs the index first. Raises on error.
+    """
+    dbid = sync_table_sql_index(db)
+    owner, _, table = table_name.strip().upper().rpartition(".")
+    sql = "SELECT DISTINCT sql_id FROM sql_objects WHERE dbid = ? AND table_name = ?"
+    params = [dbid, table]
+    if owner:
+        sql += " AND table_owner = ?"
+        params.append(owner)
+    conn = _open_warehouse(resolve_db_name(db))
+    try:
+        return [r[0] for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
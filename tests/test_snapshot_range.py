@@ -0,0 +1,55 @@
+"""find_snapshot_range against a synthetic snapshot catalog (no database needed)."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _module in ("oracledb", "autogen", "dotenv", "pandas", "numpy", "bs4"):
+    pytest.importorskip(_module)
+
+import oracle_runner_agentic_1 as runner
+
+
+def _hourly_catalog(first_begin: datetime, count: int) -> dict:
+    """Hourly snapshots taken a few seconds past the hour; snap_id 100 covers first_begin..+1h."""
+    begins = [first_begin + timedelta(hours=i) for i in range(count)]
+    return {
+        "dbid": 1,
+        "snap_ids": list(range(100, 100 + count)),
+        "begins": begins,
+        "ends": [b + timedelta(hours=1) for b in begins],
+        "startups": [datetime(2026, 1, 1)] * count,
+        "clock_offset": timedelta(0),
+    }
+
+
+@pytest.fixture
+def hourly(monkeypatch):
+    catalog = _hourly_catalog(datetime(2026, 3, 2, 0, 0, 4), 24)
+    monkeypatch.setattr(runner, "get_snapshot_catalog", lambda db="DEFAULT", max_age=None: catalog)
+    return catalog
+
+
+def test_one_hour_anomaly_window_resolves_to_one_interval(hourly):
+    rng = runner.find_snapshot_range("DEFAULT", datetime(2026, 3, 2, 10), datetime(2026, 3, 2, 11), nearest=True)
+    # snap 109 ends 10:00:04 and snap 110 ends 11:00:04: the report covers 10:00:04-11:00:04
+    assert (rng["start_snap"], rng["end_snap"]) == (109, 110)
+
+
+def test_n_bucket_window_spans_n_intervals(hourly):
+    rng = runner.find_snapshot_range("DEFAULT", datetime(2026, 3, 2, 10), datetime(2026, 3, 2, 13), nearest=True)
+    assert rng["end_snap"] - rng["start_snap"] == 3
+
+
+def test_window_shorter_than_an_interval_finds_nothing(hourly):
+    rng = runner.find_snapshot_range("DEFAULT", datetime(2026, 3, 2, 10), datetime(2026, 3, 2, 10, 20), nearest=True)
+    assert rng["start_snap"] is None
+
+
+def test_containment_lookup_unchanged(hourly):
+    # The hour bucket does not contain the 10:00:04-11:00:04 interval, which is why reports use nearest=True
+    rng = runner.find_snapshot_range("DEFAULT", datetime(2026, 3, 2, 10), datetime(2026, 3, 2, 11))
+    assert rng["start_snap"] is None